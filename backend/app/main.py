@@ -1,3 +1,4 @@
+import logging
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
@@ -5,12 +6,28 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import settings
 from app.database import engine
-from app.routers import chat, files, knowledge_bases, topics, users
+from app.services.clustering_jobs import clustering_jobs
+from app.services.rlm.executor import repl_pool
+from app.services.rlm.sub_lm_cache import sub_lm_cache
+from app.routers import chat, files, knowledge_bases, metrics, topics, users
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if settings.repl_executor == "process":
+        # Pre-warm REPL workers so the first query doesn't pay the spawn cost
+        repl_pool.start()
+    try:
+        removed = await sub_lm_cache.purge_expired()
+        if removed:
+            logger.info(f"Purged {removed} expired sub-LM cache entries")
+    except Exception as e:
+        logger.warning(f"Sub-LM cache purge failed: {e}")
     yield
+    repl_pool.shutdown()
+    clustering_jobs.shutdown()
     await engine.dispose()
 
 
@@ -29,6 +46,7 @@ app.include_router(knowledge_bases.router)
 app.include_router(files.router)
 app.include_router(topics.router)
 app.include_router(chat.router)
+app.include_router(metrics.router)
 
 
 @app.get("/health")
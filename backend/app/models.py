@@ -5,6 +5,7 @@ from sqlalchemy import (
     BigInteger,
     Column,
     DateTime,
+    Float,
     ForeignKey,
     Integer,
     String,
@@ -38,11 +39,15 @@ class KnowledgeBase(Base):
     name = Column(String, nullable=False)
     description = Column(Text)
     milvus_collection = Column(String, unique=True, nullable=False)
+    clustered_chunk_count = Column(Integer, default=0)  # chunks in the last full fit
+    new_chunk_count = Column(Integer, default=0)  # chunks ingested since the last fit
+    drifted_chunk_count = Column(Integer, default=0)  # new chunks with no close centroid
     created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
 
     user = relationship("User", back_populates="knowledge_bases")
     files = relationship("File", back_populates="knowledge_base", cascade="all, delete-orphan")
     topics = relationship("CollectionTopic", back_populates="knowledge_base", cascade="all, delete-orphan")
+    clustering_jobs = relationship("ClusteringJob", back_populates="knowledge_base", cascade="all, delete-orphan")
 
 
 class File(Base):
@@ -74,12 +79,54 @@ class CollectionTopic(Base):
     doc_count = Column(Integer, default=0)
     sample_keywords = Column(JSON)  # stored as JSON array, maps to TEXT[] in Postgres via init.sql
     parent_topic_id = Column(Uuid, ForeignKey("collection_topics.id"))
+    label_hash = Column(String(64))  # hash of the label inputs, reused to skip re-labelling
+    centroid = Column(JSON)  # unit-length mean embedding, for incremental assignment
     updated_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
 
     knowledge_base = relationship("KnowledgeBase", back_populates="topics")
     parent = relationship("CollectionTopic", remote_side="CollectionTopic.id")
 
 
+class ChunkTopic(Base):
+    """Topic assignment for one Milvus chunk, kept out of Milvus so re-labelling never rewrites vectors."""
+
+    __tablename__ = "chunk_topics"
+
+    id = Column(String(36), primary_key=True)  # Milvus chunk id
+    knowledge_base_id = Column(Uuid, ForeignKey("knowledge_bases.id", ondelete="CASCADE"), nullable=False, index=True)
+    file_id = Column(Uuid, index=True)
+    topic_id = Column(Integer, nullable=False)  # level-1 BERTopic topic id
+
+
+class ClusteringJob(Base):
+    __tablename__ = "clustering_jobs"
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    knowledge_base_id = Column(Uuid, ForeignKey("knowledge_bases.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, running, completed, failed
+    mode = Column(String, nullable=False, default="auto")  # auto, full, warm, transform, sample
+    progress = Column(Float, default=0.0)
+    message = Column(Text)
+    error = Column(Text)
+    topic_count = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
+    updated_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
+    finished_at = Column(DateTime)
+
+    knowledge_base = relationship("KnowledgeBase", back_populates="clustering_jobs")
+
+
+class SubLMCacheEntry(Base):
+    """A memoized sub-LM response, addressed by a hash of model, prompt, context and params."""
+
+    __tablename__ = "sub_lm_cache"
+
+    id = Column(String(64), primary_key=True)  # sha256 cache key
+    sub_model = Column(String, nullable=False)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now(), index=True)
+
+
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
 
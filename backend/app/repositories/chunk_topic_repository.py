@@ -0,0 +1,78 @@
+from uuid import UUID
+
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.models import ChunkTopic, CollectionTopic
+from app.repositories.base import BaseRepository
+
+
+# Level-2 topics are reached through the level-1 topic's parent link
+ParentTopic = aliased(CollectionTopic)
+
+
+class ChunkTopicRepository(BaseRepository[ChunkTopic]):
+    def __init__(self, db: AsyncSession):
+        super().__init__(ChunkTopic, db)
+
+    def _join_level1(self):
+        return and_(
+            CollectionTopic.knowledge_base_id == ChunkTopic.knowledge_base_id,
+            CollectionTopic.topic_id == ChunkTopic.topic_id,
+            CollectionTopic.topic_level == 1,
+        )
+
+    async def insert_many(self, rows: list[dict], batch_size: int = 5000) -> int:
+        """Bulk insert assignments as multi-row INSERTs, `batch_size` rows per statement."""
+        for start in range(0, len(rows), batch_size):
+            await self.db.execute(insert(ChunkTopic), rows[start:start + batch_size])
+        return len(rows)
+
+    async def delete_by_knowledge_base(self, kb_id: UUID) -> int:
+        stmt = delete(ChunkTopic).where(ChunkTopic.knowledge_base_id == kb_id)
+        result = await self.db.execute(stmt)
+        return result.rowcount
+
+    async def delete_by_file(self, file_id: UUID) -> int:
+        stmt = delete(ChunkTopic).where(ChunkTopic.file_id == file_id)
+        result = await self.db.execute(stmt)
+        return result.rowcount
+
+    async def find_ids_by_labels(
+        self,
+        kb_id: UUID,
+        labels: list[str],
+        limit: int | None = None,
+        level: int | None = None,
+    ) -> list[str]:
+        """Chunk ids whose topic has any of the given labels."""
+        if level == 1:
+            label_clause = CollectionTopic.topic_label.in_(labels)
+        elif level == 2:
+            label_clause = ParentTopic.topic_label.in_(labels)
+        else:
+            label_clause = or_(CollectionTopic.topic_label.in_(labels), ParentTopic.topic_label.in_(labels))
+        stmt = (
+            select(ChunkTopic.id)
+            .join(CollectionTopic, self._join_level1())
+            .outerjoin(ParentTopic, ParentTopic.id == CollectionTopic.parent_topic_id)
+            .where(ChunkTopic.knowledge_base_id == kb_id, label_clause)
+        )
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
+
+    async def find_label_paths(self, kb_id: UUID, chunk_ids: list[str]) -> dict[str, tuple[str, str | None]]:
+        """Map chunk id -> (level-1 label, level-2 label or None) for the given chunks."""
+        if not chunk_ids:
+            return {}
+        stmt = (
+            select(ChunkTopic.id, CollectionTopic.topic_label, ParentTopic.topic_label.label("parent_label"))
+            .join(CollectionTopic, self._join_level1())
+            .outerjoin(ParentTopic, ParentTopic.id == CollectionTopic.parent_topic_id)
+            .where(ChunkTopic.knowledge_base_id == kb_id, ChunkTopic.id.in_(chunk_ids))
+        )
+        result = await self.db.execute(stmt)
+        return {row.id: (row.topic_label, row.parent_label) for row in result.fetchall()}
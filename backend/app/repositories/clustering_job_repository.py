@@ -0,0 +1,45 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import ClusteringJob
+from app.repositories.base import BaseRepository
+
+ACTIVE_STATUSES = ("pending", "running")
+
+
+class ClusteringJobRepository(BaseRepository[ClusteringJob]):
+    def __init__(self, db: AsyncSession):
+        super().__init__(ClusteringJob, db)
+
+    async def find_by_knowledge_base(self, kb_id: UUID) -> list[ClusteringJob]:
+        stmt = (
+            select(ClusteringJob)
+            .where(ClusteringJob.knowledge_base_id == kb_id)
+            .order_by(ClusteringJob.created_at.desc())
+        )
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
+
+    async def find_active_by_knowledge_base(
+        self, kb_id: UUID, updated_after: datetime
+    ) -> ClusteringJob | None:
+        """Return a pending/running job that has reported progress since `updated_after`.
+
+        Jobs that went quiet before the cutoff are treated as dead (e.g. the
+        server restarted mid-run) so they don't block new requests forever.
+        """
+        stmt = (
+            select(ClusteringJob)
+            .where(
+                ClusteringJob.knowledge_base_id == kb_id,
+                ClusteringJob.status.in_(ACTIVE_STATUSES),
+                ClusteringJob.updated_at >= updated_after,
+            )
+            .order_by(ClusteringJob.created_at.desc())
+            .limit(1)
+        )
+        result = await self.db.execute(stmt)
+        return result.scalar_one_or_none()
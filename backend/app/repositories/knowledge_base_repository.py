@@ -1,6 +1,6 @@
 from uuid import UUID
 
-from sqlalchemy import select
+from sqlalchemy import func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import KnowledgeBase
@@ -15,3 +15,16 @@ class KnowledgeBaseRepository(BaseRepository[KnowledgeBase]):
         stmt = select(KnowledgeBase).where(KnowledgeBase.user_id == user_id)
         result = await self.db.execute(stmt)
         return list(result.scalars().all())
+
+    async def increment_new_chunks(self, kb_id: UUID, new: int, drifted: int) -> None:
+        """Atomically bump the since-last-fit counters used to decide on a topic refit."""
+        stmt = (
+            update(KnowledgeBase)
+            .where(KnowledgeBase.id == kb_id)
+            .values(
+                new_chunk_count=func.coalesce(KnowledgeBase.new_chunk_count, 0) + new,
+                drifted_chunk_count=func.coalesce(KnowledgeBase.drifted_chunk_count, 0) + drifted,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.execute(stmt)
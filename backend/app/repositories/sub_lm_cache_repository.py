@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import SubLMCacheEntry
+from app.repositories.base import BaseRepository
+
+
+class SubLMCacheRepository(BaseRepository[SubLMCacheEntry]):
+    def __init__(self, db: AsyncSession):
+        super().__init__(SubLMCacheEntry, db)
+
+    async def find_fresh(self, key: str, created_after: datetime) -> SubLMCacheEntry | None:
+        stmt = select(SubLMCacheEntry).where(
+            SubLMCacheEntry.id == key,
+            SubLMCacheEntry.created_at >= created_after,
+        )
+        result = await self.db.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def put(self, key: str, sub_model: str, response: str) -> None:
+        """Insert or refresh the entry for `key`."""
+        entry = await self.find_by_id(key)
+        if entry is None:
+            self.db.add(SubLMCacheEntry(id=key, sub_model=sub_model, response=response))
+        else:
+            entry.sub_model = sub_model
+            entry.response = response
+            entry.created_at = datetime.utcnow()
+        await self.db.flush()
+
+    async def delete_older_than(self, cutoff: datetime) -> int:
+        stmt = delete(SubLMCacheEntry).where(SubLMCacheEntry.created_at < cutoff)
+        result = await self.db.execute(stmt)
+        return result.rowcount
@@ -20,3 +20,23 @@ class TopicRepository(BaseRepository[CollectionTopic]):
         stmt = delete(CollectionTopic).where(CollectionTopic.knowledge_base_id == kb_id)
         result = await self.db.execute(stmt)
         return result.rowcount
+
+    async def find_with_centroids(self, kb_id: UUID, level: int = 1) -> list[CollectionTopic]:
+        stmt = select(CollectionTopic).where(
+            CollectionTopic.knowledge_base_id == kb_id,
+            CollectionTopic.topic_level == level,
+        )
+        result = await self.db.execute(stmt)
+        # JSON None may be stored as JSON null rather than SQL NULL, so filter here
+        return [t for t in result.scalars().all() if t.centroid]
+
+    async def find_centroids_for_knowledge_bases(self, kb_ids: list[UUID], level: int = 1) -> list[CollectionTopic]:
+        """Topics with centroids across several knowledge bases, in one query."""
+        if not kb_ids:
+            return []
+        stmt = select(CollectionTopic).where(
+            CollectionTopic.knowledge_base_id.in_(kb_ids),
+            CollectionTopic.topic_level == level,
+        )
+        result = await self.db.execute(stmt)
+        return [t for t in result.scalars().all() if t.centroid]
@@ -1,5 +1,8 @@
+import asyncio
+import functools
 import json
 import logging
+from dataclasses import dataclass
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
@@ -11,21 +14,32 @@ from app.database import get_db
 from app.repositories.chat_repository import ChatMessageRepository, ChatSessionRepository
 from app.schemas.chat import ChatMessageRead, ChatQueryRequest, ChatSessionCreate, ChatSessionRead
 from app.schemas.common import ApiResponse
+from app.services.answer_cache import CachedAnswer, answer_cache
+from app.services.embedding import embed_text
+from app.services.llm_replay import configured_client
 from app.services.milvus_service import MilvusService
-from app.services.rlm.engine import RLMEngine
-from app.services.rlm.session import session_manager
+from app.services.rlm.budget import RLMBudget
+from app.services.rlm.engine import MAX_ITERATIONS_ANSWER, RLMEngine
+from app.services.rlm.executor import get_repl_executor
+from app.services.rlm.runs import TERMINAL_EVENTS, Run, run_registry
+from app.services.rlm.session import RLMSession, session_manager
+from app.services.rlm.sub_lm_cache import SubLMCache, sub_lm_cache
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
 
-def _get_openai_client() -> AsyncOpenAI:
+def _live_openai_client() -> AsyncOpenAI:
     if settings.llm_backend == "vllm" and settings.vllm_url:
         return AsyncOpenAI(base_url=settings.vllm_url, api_key="dummy")
     return AsyncOpenAI(api_key=settings.openai_api_key)
 
 
+def _get_openai_client() -> AsyncOpenAI:
+    return configured_client(_live_openai_client)
+
+
 @router.post("/sessions", response_model=ApiResponse[ChatSessionRead])
 async def create_session(body: ChatSessionCreate, db: AsyncSession = Depends(get_db)):
     repo = ChatSessionRepository(db)
@@ -81,15 +95,26 @@ async def query_session(
         str(session.user_id), db, milvus
     )
 
+    namespace_key = _namespace_key(session_id, body.persist_namespace)
+    embedding, cached = await _lookup_answer(body.query, rlm_session, namespace_key, body.bypass_cache)
+    if cached is not None:
+        await _persist_cached_answer(msg_repo, session_id, cached)
+        await db.commit()
+        return ApiResponse(success=True, data=cached.answer)
+
     # Run RLM
     client = _get_openai_client()
     engine = RLMEngine(
         client=client,
         model=settings.llm_model,
         sub_model=settings.llm_sub_model,
+        executor=get_repl_executor(),
+        namespace_store=session_manager.namespaces,
+        sub_lm_cache=_sub_lm_cache(),
     )
 
     repl_logs = []
+    budget = RLMBudget.from_settings()
 
     async def on_step(step):
         repl_logs.append(step)
@@ -106,7 +131,11 @@ async def query_session(
         tools=rlm_session.tools,
         tool_prompt=rlm_session.tool_descriptions,
         on_repl_step=on_step,
+        namespace_key=namespace_key,
+        budget=budget,
+        prefetch=_prefetch(rlm_session),
     )
+    _store_answer(embedding, rlm_session, body.query, answer, repl_logs, budget, engine.stop_reason)
 
     # Save assistant message
     await msg_repo.create(session_id=session_id, role="assistant", content=answer)
@@ -117,8 +146,23 @@ async def query_session(
 
 @router.websocket("/sessions/{session_id}/ws")
 async def websocket_chat(websocket: WebSocket, session_id: UUID):
-    """WebSocket endpoint for real-time REPL log streaming."""
+    """WebSocket endpoint for real-time REPL log streaming.
+
+    Each query runs as a server-side run (see app/services/rlm/runs.py) that
+    outlives the socket. Durable events carry "run_id" and "seq"; after a
+    reconnect, {"type": "resume", "run_id", "last_seq"} replays what was
+    missed and continues live. {"type": "cancel"} stops the session's running
+    query. A new query while one is running is rejected, unless it sets
+    "supersede" (default WS_SUPERSEDE_QUERIES), in which case the old one is
+    cancelled first.
+    """
     await websocket.accept()
+    key = str(session_id)
+    attachment: _Attachment | None = None
+
+    active = run_registry.active_for_session(key)
+    if active is not None:
+        await websocket.send_json({"type": "run_active", "run_id": active.id, "seq": active.last_seq})
 
     try:
         while True:
@@ -128,6 +172,20 @@ async def websocket_chat(websocket: WebSocket, session_id: UUID):
             if data.get("type") == "ping":
                 continue
 
+            if data.get("type") == "cancel":
+                active = run_registry.active_for_session(key)
+                if active is not None:
+                    await run_registry.cancel(active, "cancelled by user")
+                continue
+
+            if data.get("type") == "resume":
+                run = run_registry.get(str(data.get("run_id", "")))
+                if run is None or run.session_id != key:
+                    await websocket.send_json({"type": "error", "content": "Unknown or expired run"})
+                    continue
+                attachment = await _attach(websocket, run, int(data.get("last_seq", 0)), attachment)
+                continue
+
             query = data.get("query", "")
             user_id = data.get("user_id", "")
 
@@ -135,55 +193,220 @@ async def websocket_chat(websocket: WebSocket, session_id: UUID):
                 await websocket.send_json({"type": "error", "content": "Missing query or user_id"})
                 continue
 
-            try:
-                async with get_db_session() as db:
-                    msg_repo = ChatMessageRepository(db)
-                    await msg_repo.create(session_id=session_id, role="user", content=query)
-
-                    milvus = MilvusService()
-                    rlm_session = await session_manager.get_or_create(user_id, db, milvus)
-
-                    client = _get_openai_client()
-                    engine = RLMEngine(
-                        client=client,
-                        model=settings.llm_model,
-                        sub_model=settings.llm_sub_model,
-                    )
-
-                    async def on_step(step):
-                        try:
-                            await websocket.send_json({"type": "repl_step", **step})
-                        except Exception as e:
-                            logger.error(f"Failed to send repl_step: {e}")
-
-                    answer = await engine.run(
-                        query=query,
-                        context="",
-                        tools=rlm_session.tools,
-                        tool_prompt=rlm_session.tool_descriptions,
-                        on_repl_step=on_step,
-                    )
-
-                    logger.info(f"RLM engine returned answer ({len(answer)} chars)")
-
-                    # Persist answer to DB first (so it survives WS failures)
-                    await msg_repo.create(session_id=session_id, role="assistant", content=answer)
-                    await db.commit()
-
-                    await websocket.send_json({"type": "answer", "content": answer})
-                    logger.info("Answer sent via WebSocket")
-
-            except WebSocketDisconnect:
-                raise
-            except Exception as e:
-                logger.exception(f"Error during RLM query: {e}")
-                try:
-                    await websocket.send_json({"type": "error", "content": str(e)})
-                except Exception:
-                    pass
+            active = run_registry.active_for_session(key)
+            if active is not None:
+                if not data.get("supersede", settings.ws_supersede_queries):
+                    await websocket.send_json({"type": "error", "content": "A query is already running"})
+                    continue
+                await run_registry.cancel(active, "superseded by a newer query")
+
+            run = run_registry.start(
+                key,
+                RLMBudget.from_settings(),
+                functools.partial(_execute_ws_query, session_id=session_id, data=data),
+            )
+            attachment = await _attach(websocket, run, 0, attachment)
 
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected for session {session_id}")
+        if attachment is not None:
+            _detach(attachment)
+
+
+@dataclass
+class _Attachment:
+    """A socket following one run: the run, its event queue and the forwarding task."""
+    run: Run
+    queue: asyncio.Queue | None
+    forwarder: asyncio.Task
+
+
+async def _attach(
+    websocket: WebSocket,
+    run: Run,
+    after_seq: int,
+    previous: _Attachment | None,
+) -> _Attachment:
+    if previous is not None:
+        if previous.run.done:
+            # Let it deliver the final event first so the client sees events in order
+            await asyncio.wait({previous.forwarder}, timeout=5)
+        _detach(previous)
+    replay, queue, gap = run.subscribe(after_seq)
+    forwarder = asyncio.create_task(_forward(websocket, run, replay, queue, gap))
+    return _Attachment(run, queue, forwarder)
+
+
+def _detach(attachment: _Attachment) -> None:
+    attachment.forwarder.cancel()
+    if attachment.queue is not None:
+        run_registry.detach(attachment.run, attachment.queue)
+
+
+async def _forward(
+    websocket: WebSocket,
+    run: Run,
+    replay: list[dict],
+    queue: asyncio.Queue | None,
+    gap: bool,
+) -> None:
+    """Send missed events, then live ones until the run ends."""
+    try:
+        if gap:
+            # The buffer overflowed; the client should reload persisted messages
+            await websocket.send_json({"type": "resume_gap", "run_id": run.id})
+        for event in replay:
+            await websocket.send_json(event)
+        if queue is None:
+            return
+        while True:
+            event = await queue.get()
+            await websocket.send_json(event)
+            if event["type"] in TERMINAL_EVENTS:
+                return
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.debug(f"Stopped forwarding run {run.id}: {e}")
+        if queue is not None:
+            # The socket is gone; start the grace period as a disconnect would
+            run_registry.detach(run, queue)
+    finally:
+        if queue is not None:
+            run.unsubscribe(queue)
+
+
+async def _execute_ws_query(run: Run, session_id: UUID, data: dict) -> None:
+    """Body of a WebSocket run; events go to the run, not to a socket."""
+    query = data["query"]
+    user_id = data["user_id"]
+    async with get_db_session() as db:
+        msg_repo = ChatMessageRepository(db)
+        await msg_repo.create(session_id=session_id, role="user", content=query)
+
+        milvus = MilvusService()
+        rlm_session = await session_manager.get_or_create(user_id, db, milvus)
+
+        namespace_key = _namespace_key(session_id, data.get("persist_namespace"))
+        embedding, cached = await _lookup_answer(
+            query, rlm_session, namespace_key, bool(data.get("bypass_cache"))
+        )
+        if cached is not None:
+            await _persist_cached_answer(msg_repo, session_id, cached)
+            await db.commit()
+            for step in cached.repl_steps:
+                run.emit({"type": "repl_step", **step, "cached": True})
+            run.emit({"type": "answer", "content": cached.answer, "cached": True})
+            return
+
+        client = _get_openai_client()
+        engine = RLMEngine(
+            client=client,
+            model=settings.llm_model,
+            sub_model=settings.llm_sub_model,
+            executor=get_repl_executor(),
+            namespace_store=session_manager.namespaces,
+            sub_lm_cache=_sub_lm_cache(),
+        )
+
+        repl_steps = []
+
+        async def on_step(step):
+            repl_steps.append(step)
+            run.emit({"type": "repl_step", **step})
+
+        async def on_token(event):
+            run.emit_live({"type": "token", **event})
+
+        answer = await engine.run(
+            query=query,
+            context="",
+            tools=rlm_session.tools,
+            tool_prompt=rlm_session.tool_descriptions,
+            on_repl_step=on_step,
+            on_token=on_token,
+            namespace_key=namespace_key,
+            budget=run.budget,
+            prefetch=_prefetch(rlm_session),
+        )
+        _store_answer(embedding, rlm_session, query, answer, repl_steps, run.budget, engine.stop_reason)
+
+        logger.info(f"RLM engine returned answer ({len(answer)} chars)")
+
+        # Persist before emitting, so a client that reloads messages sees it
+        await msg_repo.create(session_id=session_id, role="assistant", content=answer)
+        await db.commit()
+
+        run.emit({"type": "answer", "content": answer})
+
+
+def _namespace_key(session_id: UUID, persist: bool | None) -> str | None:
+    """Chat sessions keep REPL variables between turns only when opted in."""
+    enabled = settings.repl_persist_namespace if persist is None else persist
+    return str(session_id) if enabled else None
+
+
+async def _lookup_answer(
+    query: str,
+    rlm_session: RLMSession,
+    namespace_key: str | None,
+    bypass: bool,
+) -> tuple[list[float] | None, CachedAnswer | None]:
+    """The query embedding (None when the answer cache doesn't apply) and a cached answer, if any."""
+    # With persisted REPL variables the answer depends on earlier turns
+    if not settings.answer_cache_enabled or namespace_key is not None:
+        return None, None
+    try:
+        embedding = await embed_text(query)
+    except Exception as e:
+        logger.warning(f"Answer cache skipped, query embedding failed: {e}")
+        return None, None
+    if bypass:
+        return embedding, None
+    cached = answer_cache.lookup(rlm_session.answer_fingerprint, embedding)
+    if cached is not None:
+        logger.info(f"Answer cache hit (similarity {cached.similarity:.3f}) for: {cached.query[:80]}")
+    return embedding, cached
+
+
+async def _persist_cached_answer(msg_repo: ChatMessageRepository, session_id: UUID, cached: CachedAnswer) -> None:
+    """Save a replayed answer and its REPL steps like a fresh run's, marked as cached."""
+    for step in cached.repl_steps:
+        await msg_repo.create(
+            session_id=session_id,
+            role="repl_log",
+            content=step["code"],
+            metadata_={**step, "cached": True},
+        )
+    await msg_repo.create(
+        session_id=session_id,
+        role="assistant",
+        content=cached.answer,
+        metadata_={"cached": True, "cached_query": cached.query, "similarity": cached.similarity},
+    )
+
+
+def _store_answer(
+    embedding: list[float] | None,
+    rlm_session: RLMSession,
+    query: str,
+    answer: str,
+    repl_steps: list[dict],
+    budget: RLMBudget,
+    stop_reason: str | None = None,
+) -> None:
+    # Answers cut short by the iteration limit, a loop or the budget are not worth replaying
+    if embedding is None or answer == MAX_ITERATIONS_ANSWER or stop_reason or budget.exceeded():
+        return
+    answer_cache.store(rlm_session.answer_fingerprint, embedding, query, answer, repl_steps)
+
+
+def _sub_lm_cache() -> SubLMCache | None:
+    return sub_lm_cache if settings.sub_lm_cache_enabled else None
+
+
+def _prefetch(rlm_session: RLMSession):
+    return rlm_session.prefetch if settings.rlm_prefetch else None
 
 
 def get_db_session():
@@ -1,14 +1,22 @@
+import logging
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
+from app.repositories.chunk_topic_repository import ChunkTopicRepository
 from app.repositories.file_repository import FileRepository
+from app.repositories.knowledge_base_repository import KnowledgeBaseRepository
 from app.schemas.common import ApiResponse
 from app.schemas.file import FileContentRead, FileRead
+from app.services.clustering_jobs import clustering_jobs
 from app.services.ingest import ingest_file
 from app.services.milvus_service import MilvusService
+from app.services.search_cache import search_cache
+from app.services.topic_assignment import refit_reason
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["files"])
 
@@ -36,6 +44,18 @@ async def upload_files(
             milvus=milvus,
         )
         results.append(FileRead.model_validate(db_file))
+
+    # Incremental assignment covers small uploads; refit once drift or volume passes a threshold
+    kb = await KnowledgeBaseRepository(db).find_by_id(kb_id)
+    if kb:
+        await db.refresh(kb)
+        reason = refit_reason(kb)
+        if reason:
+            # Drift means the topics themselves moved; volume alone only needs the saved model's transform
+            mode = "warm" if reason == "drift" else "transform"
+            logger.info(f"Queueing {mode} topic refit for KB {kb_id} ({reason})")
+            await clustering_jobs.submit(kb_id, db, mode=mode)
+
     return ApiResponse(success=True, data=results)
 
 
@@ -58,14 +78,15 @@ async def delete_file(file_id: UUID, db: AsyncSession = Depends(get_db)):
 
     try:
         milvus = MilvusService()
-        from app.repositories.knowledge_base_repository import KnowledgeBaseRepository
         kb_repo = KnowledgeBaseRepository(db)
         kb = await kb_repo.find_by_id(f.knowledge_base_id)
         if kb:
             milvus.delete_by_file_id(kb.milvus_collection, str(file_id))
+            search_cache.invalidate(kb.milvus_collection)
     except Exception:
         pass
 
+    await ChunkTopicRepository(db).delete_by_file(file_id)
     await repo.delete(file_id)
     await db.commit()
     return ApiResponse(success=True, data=True)
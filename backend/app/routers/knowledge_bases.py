@@ -5,10 +5,13 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
+from app.repositories.chunk_topic_repository import ChunkTopicRepository
 from app.repositories.knowledge_base_repository import KnowledgeBaseRepository
 from app.schemas.common import ApiResponse
 from app.schemas.knowledge_base import KnowledgeBaseCreate, KnowledgeBaseRead
 from app.services.milvus_service import MilvusService
+from app.services.search_cache import search_cache
+from app.services.topic_models import topic_model_store
 
 router = APIRouter(prefix="/api/knowledge-bases", tags=["knowledge_bases"])
 
@@ -60,7 +63,10 @@ async def delete_knowledge_base(kb_id: UUID, db: AsyncSession = Depends(get_db))
         milvus.drop_collection(kb.milvus_collection)
     except Exception:
         pass
+    search_cache.invalidate(kb.milvus_collection)
+    topic_model_store.delete(kb_id)
 
+    await ChunkTopicRepository(db).delete_by_knowledge_base(kb_id)
     await repo.delete(kb_id)
     await db.commit()
     return ApiResponse(success=True, data=True)
@@ -0,0 +1,24 @@
+from fastapi import APIRouter
+
+from app.schemas.common import ApiResponse
+from app.services.answer_cache import answer_cache
+from app.services.rlm.runs import run_registry
+from app.services.rlm.session import session_manager
+from app.services.rlm.sub_lm_cache import sub_lm_cache
+from app.services.search_cache import search_cache
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("", response_model=ApiResponse[dict])
+async def get_metrics():
+    return ApiResponse(
+        success=True,
+        data={
+            "search_cache": search_cache.stats(),
+            "repl_namespaces": session_manager.namespaces.stats(),
+            "sub_lm_cache": sub_lm_cache.stats(),
+            "answer_cache": answer_cache.stats(),
+            "runs": run_registry.stats(),
+        },
+    )
@@ -1,31 +1,50 @@
+from typing import Literal
 from uuid import UUID
 
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
+from app.repositories.clustering_job_repository import ClusteringJobRepository
+from app.repositories.knowledge_base_repository import KnowledgeBaseRepository
 from app.repositories.topic_repository import TopicRepository
+from app.schemas.clustering_job import ClusteringJobRead
 from app.schemas.common import ApiResponse
 from app.schemas.topic import TopicRead
-from app.services.clustering import cluster_knowledge_base
-from app.services.milvus_service import MilvusService
+from app.services.clustering_jobs import clustering_jobs
 
 router = APIRouter(prefix="/api/knowledge-bases", tags=["topics"])
 
 
-@router.post("/{kb_id}/cluster", response_model=ApiResponse[list[TopicRead]])
-async def trigger_clustering(kb_id: UUID, db: AsyncSession = Depends(get_db)):
-    try:
-        milvus = MilvusService()
-        topics = await cluster_knowledge_base(kb_id, db, milvus)
-        return ApiResponse(
-            success=True,
-            data=[TopicRead.model_validate(t) for t in topics],
-        )
-    except ValueError as e:
-        return ApiResponse(success=False, error=str(e))
-    except Exception as e:
-        return ApiResponse(success=False, error=f"Clustering failed: {str(e)}")
+@router.post("/{kb_id}/cluster", response_model=ApiResponse[ClusteringJobRead])
+async def trigger_clustering(
+    kb_id: UUID,
+    mode: Literal["auto", "full", "warm", "transform", "sample"] = "auto",
+    db: AsyncSession = Depends(get_db),
+):
+    """Queue a background clustering job (or return the one already running for this KB)."""
+    kb = await KnowledgeBaseRepository(db).find_by_id(kb_id)
+    if not kb:
+        return ApiResponse(success=False, error="Knowledge base not found")
+
+    job, _created = await clustering_jobs.submit(kb_id, db, mode=mode)
+    return ApiResponse(success=True, data=ClusteringJobRead.model_validate(job))
+
+
+@router.get("/{kb_id}/cluster/jobs", response_model=ApiResponse[list[ClusteringJobRead]])
+async def list_clustering_jobs(kb_id: UUID, db: AsyncSession = Depends(get_db)):
+    repo = ClusteringJobRepository(db)
+    jobs = await repo.find_by_knowledge_base(kb_id)
+    return ApiResponse(success=True, data=[ClusteringJobRead.model_validate(j) for j in jobs])
+
+
+@router.get("/{kb_id}/cluster/jobs/{job_id}", response_model=ApiResponse[ClusteringJobRead])
+async def get_clustering_job(kb_id: UUID, job_id: UUID, db: AsyncSession = Depends(get_db)):
+    repo = ClusteringJobRepository(db)
+    job = await repo.find_by_id(job_id)
+    if not job or job.knowledge_base_id != kb_id:
+        return ApiResponse(success=False, error="Clustering job not found")
+    return ApiResponse(success=True, data=ClusteringJobRead.model_validate(job))
 
 
 @router.get("/{kb_id}/topics", response_model=ApiResponse[list[TopicRead]])
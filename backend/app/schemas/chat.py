@@ -32,3 +32,7 @@ class ChatMessageRead(BaseModel):
 class ChatQueryRequest(BaseModel):
     query: str = Field(min_length=1)
     knowledge_base_ids: list[UUID] | None = None
+    # Keep REPL variables for the next turn of this chat; defaults to REPL_PERSIST_NAMESPACE
+    persist_namespace: bool | None = None
+    # Skip the semantic answer cache and always run the engine (the fresh answer is still cached)
+    bypass_cache: bool = False
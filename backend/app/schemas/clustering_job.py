@@ -0,0 +1,20 @@
+from datetime import datetime
+from uuid import UUID
+
+from pydantic import BaseModel
+
+
+class ClusteringJobRead(BaseModel):
+    id: UUID
+    knowledge_base_id: UUID
+    status: str
+    mode: str
+    progress: float
+    message: str | None
+    error: str | None
+    topic_count: int | None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: datetime | None
+
+    model_config = {"from_attributes": True}
@@ -0,0 +1,129 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.config import settings
+from app.models import KnowledgeBase
+from app.services.search_cache import search_cache
+
+
+def answer_fingerprint(user_id: str, kbs: list[KnowledgeBase]) -> tuple:
+    """What a cached answer depends on besides the query: the user, the root
+    model and the user's collections at their current search-cache generations.
+
+    Ingest, deletion and clustering bump a collection's generation, so any
+    change to a knowledge base makes earlier answers unreachable. The user is
+    part of it so answers never cross accounts, even with no collections.
+    """
+    collections = sorted(
+        (kb.milvus_collection, search_cache.generation(kb.milvus_collection)) for kb in kbs
+    )
+    return (str(user_id), settings.llm_model, tuple(collections))
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    answer: str
+    repl_steps: list[dict]
+    similarity: float
+
+
+@dataclass
+class _Entry:
+    fingerprint: tuple
+    vector: np.ndarray  # unit-normalized query embedding
+    query: str
+    answer: str
+    repl_steps: list[dict]
+    stored_at: float
+
+
+class AnswerCache:
+    """Final answers of earlier runs, found again by query-embedding similarity.
+
+    A lookup only considers entries with the same fingerprint and returns the
+    closest one at or above `threshold` cosine similarity. Entries expire after
+    `ttl_seconds`; at most `max_entries` are kept, least recently used evicted.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400.0, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, fingerprint: tuple, embedding: list[float]) -> CachedAnswer | None:
+        vector = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_score = None, -1.0
+            for entry_id, entry in list(self._entries.items()):
+                if now - entry.stored_at > self.ttl_seconds:
+                    del self._entries[entry_id]
+                    continue
+                if entry.fingerprint != fingerprint:
+                    continue
+                score = float(entry.vector @ vector)
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            entry = self._entries[best_id]
+            return CachedAnswer(entry.query, entry.answer, copy.deepcopy(entry.repl_steps), best_score)
+
+    def store(
+        self,
+        fingerprint: tuple,
+        embedding: list[float],
+        query: str,
+        answer: str,
+        repl_steps: list[dict],
+    ) -> None:
+        entry = _Entry(
+            fingerprint, self._normalize(embedding), query, answer, copy.deepcopy(repl_steps), time.monotonic()
+        )
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.answer_cache_max_entries,
+    ttl_seconds=settings.answer_cache_ttl_seconds,
+    threshold=settings.answer_cache_threshold,
+)
@@ -1,117 +1,581 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+from typing import Awaitable, Callable
 from uuid import UUID
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import CollectionTopic
+from app.config import settings
+from app.models import CollectionTopic, KnowledgeBase
+from app.repositories.chunk_topic_repository import ChunkTopicRepository
 from app.repositories.knowledge_base_repository import KnowledgeBaseRepository
 from app.repositories.topic_repository import TopicRepository
-from app.config import settings
 from app.services.milvus_service import MilvusService
+from app.services.search_cache import search_cache
+from app.services.topic_assignment import assign_to_centroids, compute_centroids, merge_centroids
+from app.services.topic_models import topic_model_store
 
+logger = logging.getLogger(__name__)
 
-async def cluster_knowledge_base(
-    knowledge_base_id: UUID,
-    db: AsyncSession,
-    milvus: MilvusService,
-) -> list[CollectionTopic]:
-    """Run BERTopic clustering on all chunks in a knowledge base, with GPT-powered topic labels."""
-    import numpy as np
+CLUSTERING_MODES = ("auto", "full", "warm", "transform", "sample")
+
+
+def _topic_label_hash(name: str, doc_snippets: list[str]) -> str:
+    """Content hash for a topic's label inputs.
+
+    BERTopic names are "<id>_kw1_kw2_..."; the numeric id changes between fits,
+    so only the keywords take part in the hash.
+    """
+    keywords = name.split("_", 1)[1] if "_" in name else name
+    payload = json.dumps([settings.llm_sub_model, keywords, doc_snippets])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def label_topics(
+    topic_inputs: dict[int, tuple[str, list[str]]],
+    previous_labels: dict[str, str],
+    client=None,
+) -> dict[int, tuple[str, str]]:
+    """Label topics concurrently, reusing cached labels by content hash.
+
+    `topic_inputs` maps topic id -> (BERTopic name, representative doc snippets).
+    Returns topic id -> (label, label_hash). A failed LLM call falls back to the
+    BERTopic name for that topic only, with no hash so it is retried next run.
+    """
     import openai
-    from bertopic import BERTopic
 
-    kb_repo = KnowledgeBaseRepository(db)
-    topic_repo = TopicRepository(db)
+    client = client or openai.AsyncOpenAI(api_key=settings.openai_api_key)
+    semaphore = asyncio.Semaphore(settings.clustering_label_concurrency)
 
-    kb = await kb_repo.find_by_id(knowledge_base_id)
-    if not kb:
-        raise ValueError("Knowledge base not found")
+    async def _label(name: str, doc_snippets: list[str]) -> str:
+        doc_text = "\n".join(doc_snippets)
+        async with semaphore:
+            response = await client.chat.completions.create(
+                model=settings.llm_sub_model,
+                messages=[{
+                    "role": "user",
+                    "content": (
+                        f"I have a topic with these keywords: {name}\n\n"
+                        f"Representative documents:\n{doc_text}\n\n"
+                        "Give me a short, descriptive label for this topic (3-6 words max). "
+                        "Return ONLY the label, nothing else."
+                    ),
+                }],
+                max_completion_tokens=1000,
+            )
+        return response.choices[0].message.content.strip().strip('"')
 
-    # Pull all vectors + text from Milvus (include all fields to preserve on upsert)
-    all_data = milvus.query_all(
-        kb.milvus_collection,
-        output_fields=["id", "text", "vector", "file_id", "chunk_index", "user_id"],
+    hashes = {tid: _topic_label_hash(name, docs) for tid, (name, docs) in topic_inputs.items()}
+    pending = [tid for tid, h in hashes.items() if h not in previous_labels]
+    results = await asyncio.gather(
+        *(_label(*topic_inputs[tid]) for tid in pending),
+        return_exceptions=True,
     )
+    logger.info(f"Labelled {len(pending)} topics, reused {len(hashes) - len(pending)} cached labels")
 
-    if len(all_data) < 5:
-        raise ValueError("Not enough documents for clustering (need at least 5)")
+    labelled = {tid: (previous_labels[h], h) for tid, h in hashes.items() if h in previous_labels}
+    for tid, result in zip(pending, results):
+        if isinstance(result, Exception) or not result:
+            logger.warning(f"Labelling topic {tid} failed: {result!r}")
+            labelled[tid] = (topic_inputs[tid][0], None)
+        else:
+            labelled[tid] = (result, hashes[tid])
+    return labelled
 
-    texts = [d["text"] for d in all_data]
-    embeddings = np.array([d["vector"] for d in all_data])
 
-    # Run BERTopic with precomputed embeddings (default keyword representation)
+def _fit_topic_model(
+    texts: list[str],
+    embeddings,
+    chunk_ids: list[str],
+    warm_model=None,
+    previous_reduced: dict | None = None,
+):
+    """Fit BERTopic, returning (model, topics, reduced embeddings).
+
+    A warm start reuses the saved model's fitted UMAP: chunks seen in the last
+    fit keep their stored reduced embeddings, only new chunks go through
+    `umap.transform`, and just HDBSCAN + c-TF-IDF are refit.
+    """
+    import numpy as np
+    from bertopic import BERTopic
+
+    if warm_model is None:
+        topic_model = BERTopic(
+            embedding_model=None,
+            nr_topics="auto",
+            min_topic_size=5,
+            verbose=False,
+        )
+        topics, _probs = topic_model.fit_transform(texts, embeddings)
+        return topic_model, topics, topic_model.umap_model.embedding_
+
+    from bertopic.dimensionality import BaseDimensionalityReduction
+
+    umap_model = warm_model.umap_model
+    previous_reduced = previous_reduced or {}
+    new_idx = [i for i, cid in enumerate(chunk_ids) if cid not in previous_reduced]
+    new_reduced = umap_model.transform(embeddings[new_idx]) if new_idx else None
+    dim = new_reduced.shape[1] if new_reduced is not None else len(next(iter(previous_reduced.values())))
+    reduced = np.empty((len(chunk_ids), dim), dtype=np.float32)
+    for i, cid in enumerate(chunk_ids):
+        if cid in previous_reduced:
+            reduced[i] = previous_reduced[cid]
+    if new_idx:
+        reduced[new_idx] = new_reduced
+
     topic_model = BERTopic(
         embedding_model=None,
+        umap_model=BaseDimensionalityReduction(),
         nr_topics="auto",
         min_topic_size=5,
         verbose=False,
     )
-    topics, _probs = topic_model.fit_transform(texts, embeddings)
-    topic_info = topic_model.get_topic_info()
+    topics, _probs = topic_model.fit_transform(texts, reduced)
+    # Keep the fitted UMAP so transform() accepts raw embeddings again
+    topic_model.umap_model = umap_model
+    return topic_model, topics, reduced
+
+
+async def _write_assignments(
+    chunk_topic_repo: ChunkTopicRepository,
+    knowledge_base_id: UUID,
+    all_data: list[dict],
+    topics,
+) -> None:
+    # Assignments go to the compact chunk_topics table (chunk id -> topic id);
+    # Milvus rows are never rewritten, so no vectors move.
+    assignments = _assignment_rows(knowledge_base_id, all_data, topics)
+    await chunk_topic_repo.delete_by_knowledge_base(knowledge_base_id)
+    await chunk_topic_repo.insert_many(assignments, batch_size=settings.topic_write_batch_size)
+
+
+def _assignment_rows(knowledge_base_id: UUID, data: list[dict], topics) -> list[dict]:
+    return [
+        {
+            "id": doc_data["id"],
+            "knowledge_base_id": knowledge_base_id,
+            "file_id": UUID(doc_data["file_id"]) if doc_data.get("file_id") else None,
+            "topic_id": int(topic_id),
+        }
+        for doc_data, topic_id in zip(data, topics)
+        if topic_id != -1
+    ]
+
+
+def stratified_sample_ids(
+    batches,
+    per_file_cap: int,
+    total_cap: int,
+    seed: int = 0,
+) -> list[str]:
+    """Pick a sample of chunk ids with at most `per_file_cap` per file.
+
+    Streams `batches` of {"id", "file_id"} rows once, keeping a reservoir per
+    file so memory is bounded by files x cap rather than chunk count. If the
+    capped pool still exceeds `total_cap`, it is downsampled uniformly.
+    """
+    rng = random.Random(seed)
+    reservoirs: dict[str, list[str]] = {}
+    seen: dict[str, int] = {}
+    for batch in batches:
+        for row in batch:
+            file_id = row.get("file_id", "")
+            n = seen.get(file_id, 0) + 1
+            seen[file_id] = n
+            reservoir = reservoirs.setdefault(file_id, [])
+            if len(reservoir) < per_file_cap:
+                reservoir.append(row["id"])
+            else:
+                j = rng.randrange(n)
+                if j < per_file_cap:
+                    reservoir[j] = row["id"]
+    ids = [chunk_id for reservoir in reservoirs.values() for chunk_id in reservoir]
+    if len(ids) > total_cap:
+        ids = rng.sample(ids, total_cap)
+    return ids
+
+
+def _topic_keywords(name: str) -> list[str]:
+    # BERTopic names are "<id>_kw1_kw2_..."
+    return name.split("_")[1:6]
 
-    # Use GPT to generate human-readable labels from the keyword representations
-    client = openai.OpenAI(api_key=settings.openai_api_key)
-    topic_labels = {}
+
+async def _label_fitted_topics(
+    topic_repo: TopicRepository,
+    knowledge_base_id: UUID,
+    topic_model,
+    topic_info,
+    centroids: dict[int, list[float]],
+    doc_counts: dict[int, int],
+) -> tuple[dict[int, tuple[str, str | None]], list[dict], dict[int, int]]:
+    """Label level-1 topics, then merge them into labelled level-2 parents.
+
+    Returns (level-1 labels, parent topic dicts, level-1 topic id -> parent topic id).
+    """
+    # Use GPT to generate human-readable labels from the keyword representations.
+    # Labels from the previous run are reused for topics whose content is unchanged.
+    previous_labels = {
+        t.label_hash: t.topic_label
+        for t in await topic_repo.find_by_knowledge_base(knowledge_base_id)
+        if t.label_hash
+    }
+    topic_inputs = {}
+    names = {}
     for _, row in topic_info.iterrows():
         if row["Topic"] == -1:
             continue
-        keywords = row["Name"]
-        # Get representative docs for this topic
         rep_docs = topic_model.get_representative_docs(row["Topic"])
-        doc_snippets = "\n".join(d[:200] for d in (rep_docs or [])[:3])
-
-        response = client.chat.completions.create(
-            model=settings.llm_sub_model,
-            messages=[{
-                "role": "user",
-                "content": (
-                    f"I have a topic with these keywords: {keywords}\n\n"
-                    f"Representative documents:\n{doc_snippets}\n\n"
-                    "Give me a short, descriptive label for this topic (3-6 words max). "
-                    "Return ONLY the label, nothing else."
-                ),
-            }],
-            max_completion_tokens=1000,
+        topic_inputs[row["Topic"]] = (row["Name"], [d[:200] for d in (rep_docs or [])[:3]])
+        names[row["Topic"]] = row["Name"]
+
+    labelled = await label_topics(topic_inputs, previous_labels)
+    parents, parent_of = await _label_parent_topics(names, labelled, centroids, doc_counts, previous_labels)
+    return labelled, parents, parent_of
+
+
+async def _label_parent_topics(
+    names: dict[int, str],
+    labelled: dict[int, tuple[str, str | None]],
+    centroids: dict[int, list[float]],
+    doc_counts: dict[int, int],
+    previous_labels: dict[str, str],
+) -> tuple[list[dict], dict[int, int]]:
+    # The hierarchy is built from the fitted level-1 centroids alone, so it adds
+    # no pass over the chunks; parents are labelled from their children's labels.
+    child_ids = [t for t in names if t in centroids]
+    if len(child_ids) < settings.topic_l2_min_children:
+        return [], {}
+    n_parents = settings.topic_l2_max_topics or math.ceil(math.sqrt(len(child_ids)))
+    parent_idx, parent_centroids = merge_centroids(
+        [centroids[t] for t in child_ids],
+        [max(doc_counts.get(t, 0), 1) for t in child_ids],
+        n_parents,
+    )
+
+    children: dict[int, list[int]] = {}
+    for topic_id, parent in zip(child_ids, parent_idx):
+        children.setdefault(parent, []).append(topic_id)
+
+    parent_inputs = {}
+    for parent, members in children.items():
+        members.sort(key=lambda t: doc_counts.get(t, 0), reverse=True)
+        keywords = list(dict.fromkeys(kw for t in members for kw in _topic_keywords(names[t])))[:8]
+        parent_inputs[parent] = (
+            "_".join([str(parent)] + keywords),
+            [labelled.get(t, (names[t], None))[0] for t in members],
         )
-        label = response.choices[0].message.content.strip().strip('"')
-        topic_labels[row["Topic"]] = label
+    parent_labels = await label_topics(parent_inputs, previous_labels)
 
-    # Update Milvus metadata with topic labels
-    for doc_data, topic_id in zip(all_data, topics):
-        if topic_id == -1:
-            continue
-        label = topic_labels.get(topic_id, "")
+    parents = [
+        {
+            "topic_id": parent,
+            "topic_label": parent_labels[parent][0],
+            "label_hash": parent_labels[parent][1],
+            "centroid": parent_centroids[parent].tolist(),
+            "doc_count": sum(doc_counts.get(t, 0) for t in members),
+            "sample_keywords": _topic_keywords(parent_inputs[parent][0]),
+        }
+        for parent, members in sorted(children.items())
+    ]
+    parent_of = {t: parent for t, parent in zip(child_ids, parent_idx)}
+    return parents, parent_of
 
-        milvus.upsert(kb.milvus_collection, [{
-            "id": doc_data["id"],
-            "vector": doc_data["vector"],
-            "text": doc_data["text"],
-            "file_id": doc_data.get("file_id", ""),
-            "chunk_index": doc_data.get("chunk_index", 0),
-            "user_id": doc_data.get("user_id", ""),
-            "topic_l1": label,
-            "topic_l2": "",
-            "topic_keywords": label,
-        }])
+
+async def _replace_topics(
+    db: AsyncSession,
+    kb: KnowledgeBase,
+    topic_info,
+    labelled: dict[int, tuple[str, str | None]],
+    centroids: dict[int, list[float]],
+    doc_counts: dict[int, int],
+    parents: list[dict],
+    parent_of: dict[int, int],
+    clustered_chunk_count: int,
+) -> list[CollectionTopic]:
+    topic_repo = TopicRepository(db)
 
     # Clear old topics and insert new ones
-    await topic_repo.delete_by_knowledge_base(knowledge_base_id)
+    await topic_repo.delete_by_knowledge_base(kb.id)
 
     new_topics = []
+    parent_rows = {}
+    for parent in parents:
+        topic = await topic_repo.create(knowledge_base_id=kb.id, topic_level=2, **parent)
+        parent_rows[parent["topic_id"]] = topic
+        new_topics.append(topic)
+
     for _, row in topic_info.iterrows():
         if row["Topic"] == -1:
             continue
-        label = topic_labels.get(row["Topic"], row["Name"])
+        label, label_hash = labelled.get(row["Topic"], (row["Name"], None))
         # Extract keywords from the default Name column for sample_keywords
-        raw_keywords = row["Name"].split("_")[1:6]
+        raw_keywords = _topic_keywords(row["Name"])
+        parent = parent_rows.get(parent_of.get(row["Topic"]))
         topic = await topic_repo.create(
-            knowledge_base_id=knowledge_base_id,
+            knowledge_base_id=kb.id,
             topic_level=1,
             topic_label=label,
             topic_id=row["Topic"],
-            doc_count=row["Count"],
+            doc_count=doc_counts.get(row["Topic"], 0),
             sample_keywords=raw_keywords,
+            label_hash=label_hash,
+            centroid=centroids.get(row["Topic"]),
+            parent_topic_id=parent.id if parent else None,
         )
         new_topics.append(topic)
 
+    await KnowledgeBaseRepository(db).update(
+        kb.id,
+        clustered_chunk_count=clustered_chunk_count,
+        new_chunk_count=0,
+        drifted_chunk_count=0,
+    )
+    return new_topics
+
+
+async def cluster_knowledge_base(
+    knowledge_base_id: UUID,
+    db: AsyncSession,
+    milvus: MilvusService,
+    on_progress: Callable[[float, str], Awaitable[None]] | None = None,
+    mode: str = "auto",
+) -> list[CollectionTopic]:
+    """Run BERTopic clustering on all chunks in a knowledge base, with GPT-powered topic labels.
+
+    Modes:
+    - "full": fit UMAP + HDBSCAN from scratch.
+    - "warm": refit reusing the saved model's UMAP and reduced embeddings.
+    - "transform": map all chunks with the saved model; topics and labels stay as they are.
+    - "sample": fit on a per-file stratified sample, then stream-assign every chunk.
+    - "auto": "sample" above `clustering_sample_threshold` chunks, else "warm"
+      if a saved model exists, otherwise "full".
+    Modes that need a saved model fall back to "full" when there is none.
+
+    `on_progress(fraction, message)` is awaited at each pipeline stage.
+    """
+    import numpy as np
+
+    if mode not in CLUSTERING_MODES:
+        raise ValueError(f"Unknown clustering mode: {mode}")
+
+    async def report(fraction: float, message: str):
+        if on_progress:
+            await on_progress(fraction, message)
+
+    kb_repo = KnowledgeBaseRepository(db)
+    topic_repo = TopicRepository(db)
+    chunk_topic_repo = ChunkTopicRepository(db)
+
+    kb = await kb_repo.find_by_id(knowledge_base_id)
+    if not kb:
+        raise ValueError("Knowledge base not found")
+
+    if mode in ("auto", "sample"):
+        total = milvus.count(kb.milvus_collection)
+        if mode == "sample" or total > settings.clustering_sample_threshold:
+            return await _cluster_sampled(db, kb, milvus, total, report)
+
+    await report(0.05, "Loading vectors")
+
+    # Pull all vectors + text from Milvus; iterate() because a single query
+    # stops at 16,384 rows and the assignments below replace the whole KB's
+    all_data = [
+        row
+        for batch in milvus.iterate(
+            kb.milvus_collection,
+            ["id", "text", "vector", "file_id"],
+            batch_size=settings.clustering_batch_size,
+        )
+        for row in batch
+    ]
+
+    if len(all_data) < 5:
+        raise ValueError("Not enough documents for clustering (need at least 5)")
+
+    texts = [d["text"] for d in all_data]
+    embeddings = np.array([d["vector"] for d in all_data])
+    chunk_ids = [d["id"] for d in all_data]
+
+    saved_model = topic_model_store.load(knowledge_base_id) if mode != "full" else None
+    if mode == "auto":
+        mode = "warm" if saved_model is not None else "full"
+    elif saved_model is None and mode != "full":
+        logger.info(f"No saved topic model for KB {knowledge_base_id}; running a full fit")
+        mode = "full"
+
+    if mode == "transform":
+        await report(0.2, f"Mapping {len(all_data)} chunks with the saved topic model")
+        topics, _probs = saved_model.transform(texts, embeddings)
+        return await _reassign_topics(db, kb, all_data, embeddings, topics, report)
+
+    await report(0.2, f"Fitting topic model on {len(all_data)} chunks ({mode})")
+
+    topic_model, topics, reduced = _fit_topic_model(
+        texts,
+        embeddings,
+        chunk_ids,
+        warm_model=saved_model if mode == "warm" else None,
+        previous_reduced=(
+            topic_model_store.load_reduced_embeddings(knowledge_base_id) if mode == "warm" else None
+        ),
+    )
+    topic_info = topic_model.get_topic_info()
+
+    # Persist per-topic centroids so ingest can assign new chunks without a refit
+    topic_ids = [t for t in topic_info["Topic"] if t != -1]
+    centroids = compute_centroids(embeddings, topics, topic_ids)
+    doc_counts = dict(zip(topic_info["Topic"], topic_info["Count"]))
+
+    await report(0.5, "Labelling topics")
+    labelled, parents, parent_of = await _label_fitted_topics(
+        topic_repo, knowledge_base_id, topic_model, topic_info, centroids, doc_counts
+    )
+
+    await report(0.7, "Writing topic assignments")
+    await _write_assignments(chunk_topic_repo, knowledge_base_id, all_data, topics)
+
+    await report(0.95, "Saving topics")
+    new_topics = await _replace_topics(
+        db, kb, topic_info, labelled, centroids, doc_counts, parents, parent_of,
+        clustered_chunk_count=len(all_data),
+    )
+
     await db.commit()
+    search_cache.invalidate(kb.milvus_collection)
+    # Saved after commit so the model on disk always matches the stored topics
+    topic_model_store.save(knowledge_base_id, topic_model, chunk_ids, reduced)
     return new_topics
+
+
+async def _cluster_sampled(
+    db: AsyncSession,
+    kb: KnowledgeBase,
+    milvus: MilvusService,
+    total: int,
+    report: Callable[[float, str], Awaitable[None]],
+) -> list[CollectionTopic]:
+    """Fit on a stratified sample, then assign every chunk in streamed batches.
+
+    Only the sample (at most `clustering_sample_size` chunks) is held in memory
+    with its vectors; the assignment pass reads `clustering_batch_size` rows at
+    a time and writes their topic ids before fetching the next batch.
+    """
+    import numpy as np
+
+    batch_size = settings.clustering_batch_size
+
+    await report(0.05, f"Sampling {total} chunks")
+    sample_ids = stratified_sample_ids(
+        milvus.iterate(kb.milvus_collection, ["id", "file_id"], batch_size=batch_size),
+        per_file_cap=settings.clustering_sample_per_file,
+        total_cap=settings.clustering_sample_size,
+    )
+    sample = milvus.get_by_ids(kb.milvus_collection, sample_ids, ["id", "text", "vector", "file_id"])
+    if len(sample) < 5:
+        raise ValueError("Not enough documents for clustering (need at least 5)")
+
+    texts = [d["text"] for d in sample]
+    embeddings = np.array([d["vector"] for d in sample])
+    chunk_ids = [d["id"] for d in sample]
+
+    await report(0.15, f"Fitting topic model on a sample of {len(sample)} chunks")
+    topic_model, sample_topics, reduced = _fit_topic_model(texts, embeddings, chunk_ids)
+    topic_info = topic_model.get_topic_info()
+    topic_ids = [t for t in topic_info["Topic"] if t != -1]
+    centroids = compute_centroids(embeddings, sample_topics, topic_ids)
+    del sample, texts, embeddings
+
+    await report(0.35, "Labelling topics")
+    # Sample counts weight the hierarchy merge; stored counts come from the full pass
+    labelled, parents, parent_of = await _label_fitted_topics(
+        TopicRepository(db), kb.id, topic_model, topic_info, centroids,
+        dict(zip(topic_info["Topic"], topic_info["Count"])),
+    )
+
+    # Assign every chunk (sampled ones included) by nearest centroid, or by the
+    # model's own transform when configured; both run vectorized per batch.
+    use_transform = settings.clustering_sample_assign == "transform"
+    fields = ["id", "file_id", "vector"] + (["text"] if use_transform else [])
+    centroid_ids = list(centroids)
+    centroid_matrix = [centroids[t] for t in centroid_ids]
+
+    chunk_topic_repo = ChunkTopicRepository(db)
+    await chunk_topic_repo.delete_by_knowledge_base(kb.id)
+    doc_counts: dict[int, int] = {}
+    processed = 0
+    for batch in milvus.iterate(kb.milvus_collection, fields, batch_size=batch_size):
+        vectors = np.array([d["vector"] for d in batch])
+        if use_transform:
+            topics, _probs = topic_model.transform([d["text"] for d in batch], vectors)
+        else:
+            assigned, _sims = assign_to_centroids(
+                vectors, centroid_ids, centroid_matrix,
+                min_similarity=settings.topic_assign_min_similarity,
+            )
+            topics = [-1 if t is None else t for t in assigned]
+
+        rows = _assignment_rows(kb.id, batch, topics)
+        await chunk_topic_repo.insert_many(rows, batch_size=settings.topic_write_batch_size)
+        for row in rows:
+            doc_counts[row["topic_id"]] = doc_counts.get(row["topic_id"], 0) + 1
+
+        processed += len(batch)
+        await report(0.4 + 0.5 * min(processed / max(total, 1), 1.0), f"Assigned {processed}/{total} chunks")
+
+    await report(0.95, "Saving topics")
+    for parent in parents:
+        parent["doc_count"] = sum(c for t, c in doc_counts.items() if parent_of.get(t) == parent["topic_id"])
+    new_topics = await _replace_topics(
+        db, kb, topic_info, labelled, centroids, doc_counts, parents, parent_of,
+        clustered_chunk_count=processed,
+    )
+
+    await db.commit()
+    search_cache.invalidate(kb.milvus_collection)
+    topic_model_store.save(kb.id, topic_model, chunk_ids, reduced)
+    return new_topics
+
+
+async def _reassign_topics(
+    db: AsyncSession,
+    kb: KnowledgeBase,
+    all_data: list[dict],
+    embeddings,
+    topics,
+    report: Callable[[float, str], Awaitable[None]],
+) -> list[CollectionTopic]:
+    """Store transform() results against the existing topics: counts and centroids move, labels stay."""
+    topic_repo = TopicRepository(db)
+
+    await report(0.7, "Writing topic assignments")
+    await _write_assignments(ChunkTopicRepository(db), kb.id, all_data, topics)
+
+    stored = await topic_repo.find_by_knowledge_base(kb.id)
+    existing = [t for t in stored if t.topic_level == 1]
+    centroids = compute_centroids(embeddings, topics, [t.topic_id for t in existing])
+    counts = {}
+    for topic_id in topics:
+        counts[topic_id] = counts.get(topic_id, 0) + 1
+    parent_counts = {}
+    for topic in existing:
+        topic.doc_count = counts.get(topic.topic_id, 0)
+        topic.centroid = centroids.get(topic.topic_id, topic.centroid)
+        if topic.parent_topic_id:
+            parent_counts[topic.parent_topic_id] = parent_counts.get(topic.parent_topic_id, 0) + topic.doc_count
+    for topic in stored:
+        if topic.topic_level == 2:
+            topic.doc_count = parent_counts.get(topic.id, 0)
+
+    await KnowledgeBaseRepository(db).update(
+        kb.id,
+        clustered_chunk_count=len(all_data),
+        new_chunk_count=0,
+        drifted_chunk_count=0,
+    )
+    await db.commit()
+    search_cache.invalidate(kb.milvus_collection)
+    return existing
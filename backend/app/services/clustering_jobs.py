@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import ClusteringJob
+from app.repositories.clustering_job_repository import ClusteringJobRepository
+from app.repositories.knowledge_base_repository import KnowledgeBaseRepository
+from app.services.search_cache import search_cache
+
+logger = logging.getLogger(__name__)
+
+
+def run_clustering_in_worker(job_id: str, knowledge_base_id: str, mode: str) -> int:
+    """Process-pool entry point: runs one clustering job on a private event loop.
+
+    Workers are spawned, so everything (DB engine, Milvus client) is created
+    here rather than inherited from the API process. Saved topic models are
+    loaded lazily and stay cached in the worker between jobs. Returns the
+    topic count.
+    """
+    return asyncio.run(_run_clustering(UUID(job_id), UUID(knowledge_base_id), mode))
+
+
+async def _run_clustering(job_id: UUID, knowledge_base_id: UUID, mode: str) -> int:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    from app.services.clustering import cluster_knowledge_base
+    from app.services.milvus_service import MilvusService
+
+    engine = create_async_engine(settings.postgres_url, echo=False)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def on_progress(fraction: float, message: str):
+        async with session_factory() as progress_db:
+            await ClusteringJobRepository(progress_db).update(
+                job_id,
+                status="running",
+                progress=fraction,
+                message=message,
+                updated_at=datetime.utcnow(),
+            )
+            await progress_db.commit()
+
+    try:
+        await on_progress(0.0, "Starting")
+        async with session_factory() as db:
+            topics = await cluster_knowledge_base(
+                knowledge_base_id, db, MilvusService(), on_progress=on_progress, mode=mode
+            )
+        return len(topics)
+    finally:
+        await engine.dispose()
+
+
+class ClusteringJobManager:
+    """Runs clustering jobs in a process pool, at most one active job per knowledge base."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession] | None = None,
+        executor: Executor | None = None,
+        runner: Callable[[str, str, str], int] = run_clustering_in_worker,
+    ):
+        self._session_factory = session_factory
+        self._executor = executor
+        self._runner = runner
+        self._active: dict[UUID, UUID] = {}  # knowledge_base_id -> job_id
+        self._tasks: dict[UUID, asyncio.Task] = {}
+        self._lock = asyncio.Lock()
+
+    def _get_session_factory(self) -> Callable[[], AsyncSession]:
+        if self._session_factory is None:
+            from app.database import async_session
+            self._session_factory = async_session
+        return self._session_factory
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.clustering_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def submit(
+        self, knowledge_base_id: UUID, db: AsyncSession, mode: str = "auto"
+    ) -> tuple[ClusteringJob, bool]:
+        """Queue a clustering job, or return the job already running for this KB.
+
+        Returns `(job, created)`.
+        """
+        async with self._lock:
+            repo = ClusteringJobRepository(db)
+
+            job_id = self._active.get(knowledge_base_id)
+            if job_id:
+                job = await repo.find_by_id(job_id)
+                if job:
+                    return job, False
+
+            cutoff = datetime.utcnow() - timedelta(seconds=settings.clustering_job_stale_seconds)
+            job = await repo.find_active_by_knowledge_base(knowledge_base_id, updated_after=cutoff)
+            if job:
+                return job, False
+
+            job = await repo.create(
+                knowledge_base_id=knowledge_base_id,
+                status="pending",
+                mode=mode,
+                progress=0.0,
+                message="Queued",
+            )
+            await db.commit()
+
+            self._active[knowledge_base_id] = job.id
+            self._tasks[job.id] = asyncio.create_task(self._run(job.id, knowledge_base_id, mode))
+            return job, True
+
+    async def _run(self, job_id: UUID, knowledge_base_id: UUID, mode: str):
+        loop = asyncio.get_running_loop()
+        try:
+            topic_count = await loop.run_in_executor(
+                self._get_executor(), self._runner, str(job_id), str(knowledge_base_id), mode
+            )
+        except Exception as e:
+            logger.exception(f"Clustering job {job_id} failed: {e}")
+            await self._finish(job_id, knowledge_base_id, status="failed", error=str(e))
+        else:
+            await self._finish(
+                job_id, knowledge_base_id,
+                status="completed", progress=1.0, message="Done", topic_count=topic_count,
+            )
+        finally:
+            self._active.pop(knowledge_base_id, None)
+            self._tasks.pop(job_id, None)
+
+    async def _finish(self, job_id: UUID, knowledge_base_id: UUID, **fields):
+        now = datetime.utcnow()
+        async with self._get_session_factory()() as db:
+            await ClusteringJobRepository(db).update(job_id, updated_at=now, finished_at=now, **fields)
+            kb = await KnowledgeBaseRepository(db).find_by_id(knowledge_base_id)
+            await db.commit()
+        # The worker process has its own cache; invalidate the API process's copy
+        if kb:
+            search_cache.invalidate(kb.milvus_collection)
+
+    async def wait(self, job_id: UUID):
+        task = self._tasks.get(job_id)
+        if task:
+            await asyncio.shield(task)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+clustering_jobs = ClusteringJobManager()
@@ -1,21 +1,35 @@
 from openai import AsyncOpenAI
 
 from app.config import settings
+from app.services.llm_replay import configured_client
+from app.services.tracing import span
 
 
-def _get_client() -> AsyncOpenAI:
+def _live_client() -> AsyncOpenAI:
     if settings.llm_backend == "vllm" and settings.vllm_url:
         return AsyncOpenAI(base_url=settings.vllm_url, api_key="dummy")
     return AsyncOpenAI(api_key=settings.openai_api_key)
 
 
+def _get_client() -> AsyncOpenAI:
+    return configured_client(_live_client)
+
+
+def _record_usage(embed_span, response) -> None:
+    prompt_tokens = getattr(getattr(response, "usage", None), "prompt_tokens", None)
+    if isinstance(prompt_tokens, int):
+        embed_span.set(prompt_tokens=prompt_tokens)
+
+
 async def embed_text(text: str) -> list[float]:
     """Embed a single text string."""
     client = _get_client()
-    response = await client.embeddings.create(
-        model=settings.embedding_model,
-        input=text,
-    )
+    with span("embedding", model=settings.embedding_model, texts=1) as embed_span:
+        response = await client.embeddings.create(
+            model=settings.embedding_model,
+            input=text,
+        )
+        _record_usage(embed_span, response)
     return response.data[0].embedding
 
 
@@ -24,8 +38,10 @@ async def embed_texts(texts: list[str]) -> list[list[float]]:
     if not texts:
         return []
     client = _get_client()
-    response = await client.embeddings.create(
-        model=settings.embedding_model,
-        input=texts,
-    )
+    with span("embedding", model=settings.embedding_model, texts=len(texts)) as embed_span:
+        response = await client.embeddings.create(
+            model=settings.embedding_model,
+            input=texts,
+        )
+        _record_usage(embed_span, response)
     return [item.embedding for item in sorted(response.data, key=lambda x: x.index)]
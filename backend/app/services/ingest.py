@@ -2,11 +2,16 @@ from uuid import UUID, uuid4
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import settings
 from app.models import File, KnowledgeBase
+from app.repositories.chunk_topic_repository import ChunkTopicRepository
 from app.repositories.file_repository import FileRepository
 from app.repositories.knowledge_base_repository import KnowledgeBaseRepository
+from app.repositories.topic_repository import TopicRepository
 from app.services.embedding import embed_texts
 from app.services.milvus_service import MilvusService
+from app.services.search_cache import search_cache
+from app.services.topic_assignment import assign_to_centroids
 from app.utils.chunking import chunk_text
 from app.utils.text_extraction import extract_text, get_file_type
 
@@ -51,9 +56,10 @@ async def ingest_file(
     kb = await kb_repo.find_by_id(knowledge_base_id)
 
     # 6. Insert into Milvus
+    chunk_ids = [str(uuid4()) for _ in chunks]
     milvus_data = [
         {
-            "id": str(uuid4()),
+            "id": chunk_id,
             "vector": emb,
             "text": chunk.text[:8192],
             "file_id": str(db_file.id),
@@ -63,12 +69,49 @@ async def ingest_file(
             "topic_l2": "",
             "topic_keywords": "",
         }
-        for chunk, emb in zip(chunks, embeddings)
+        for chunk_id, chunk, emb in zip(chunk_ids, chunks, embeddings)
     ]
     milvus.insert(kb.milvus_collection, milvus_data)
 
-    # 7. Update chunk count
+    # 7. Assign new chunks to the nearest existing topic
+    await _assign_topics(db, kb, db_file.id, chunk_ids, embeddings)
+
+    # 8. Update chunk count
     await file_repo.update(db_file.id, chunk_count=len(chunks))
     await db.commit()
+    search_cache.invalidate(kb.milvus_collection)
 
     return db_file
+
+
+async def _assign_topics(
+    db: AsyncSession,
+    kb: KnowledgeBase,
+    file_id: UUID,
+    chunk_ids: list[str],
+    embeddings: list[list[float]],
+) -> None:
+    """Nearest-centroid topic assignment so new chunks are searchable by topic before a refit.
+
+    Also counts new and drifted (no centroid close enough) chunks on the KB,
+    which `refit_reason` uses to decide when a full re-cluster is due.
+    """
+    topics = await TopicRepository(db).find_with_centroids(kb.id, level=1)
+    if not topics:
+        return
+
+    assigned, _sims = assign_to_centroids(
+        embeddings,
+        [t.topic_id for t in topics],
+        [t.centroid for t in topics],
+        min_similarity=settings.topic_assign_min_similarity,
+    )
+    rows = [
+        {"id": chunk_id, "knowledge_base_id": kb.id, "file_id": file_id, "topic_id": topic_id}
+        for chunk_id, topic_id in zip(chunk_ids, assigned)
+        if topic_id is not None
+    ]
+    await ChunkTopicRepository(db).insert_many(rows, batch_size=settings.topic_write_batch_size)
+    await KnowledgeBaseRepository(db).increment_new_chunks(
+        kb.id, new=len(chunk_ids), drifted=len(chunk_ids) - len(rows)
+    )
@@ -0,0 +1,296 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import AsyncIterator
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Request fields that change how a response is delivered, not what it says
+_DELIVERY_FIELDS = {
+    "stream", "stream_options", "encoding_format", "timeout", "extra_headers", "extra_query", "extra_body",
+}
+
+
+class FixtureNotFound(LookupError):
+    """No recorded response matches a request during strict replay."""
+
+
+def request_key(kind: str, request: dict) -> str:
+    """Stable hash of a chat or embedding request, ignoring delivery options like streaming."""
+    content = {k: v for k, v in request.items() if k not in _DELIVERY_FIELDS}
+    canonical = json.dumps({"kind": kind, **content}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _normalize_chat(completion) -> dict:
+    """The parts of a ChatCompletion a replay needs, whichever way it was delivered."""
+    choice = completion.choices[0]
+    usage = getattr(completion, "usage", None)
+    return {
+        "model": completion.model,
+        "content": choice.message.content,
+        "finish_reason": choice.finish_reason,
+        "usage": usage.model_dump() if usage is not None else None,
+    }
+
+
+def _normalize_embedding(response) -> dict:
+    usage = getattr(response, "usage", None)
+    return {
+        "model": response.model,
+        "embeddings": [item.embedding for item in sorted(response.data, key=lambda x: x.index)],
+        "usage": usage.model_dump() if usage is not None else None,
+    }
+
+
+class FixtureWriter:
+    """Appends recorded request/response pairs to a JSON lines fixture file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, kind: str, request: dict, response: dict) -> None:
+        request = {k: v for k, v in request.items() if k not in _DELIVERY_FIELDS}
+        record = {"kind": kind, "key": request_key(kind, request), "request": request, "response": response}
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class RecordingClient:
+    """Wraps an AsyncOpenAI client and records every chat completion and embedding it serves.
+
+    Streaming completions are passed through chunk by chunk and recorded once
+    the stream ends, so a recording replays as either delivery mode.
+    """
+
+    def __init__(self, client, writer: FixtureWriter):
+        self._client = client
+        self._writer = writer
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_chat))
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+
+    async def _create_chat(self, **kwargs):
+        response = await self._client.chat.completions.create(**kwargs)
+        if not kwargs.get("stream"):
+            self._writer.write("chat", kwargs, _normalize_chat(response))
+            return response
+        return self._record_stream(kwargs, response)
+
+    async def _record_stream(self, request: dict, stream) -> AsyncIterator:
+        parts = []
+        record = {"model": request.get("model"), "content": None, "finish_reason": None, "usage": None}
+        async for chunk in stream:
+            record["model"] = chunk.model or record["model"]
+            if getattr(chunk, "usage", None) is not None:
+                record["usage"] = chunk.usage.model_dump()
+            if chunk.choices:
+                choice = chunk.choices[0]
+                if choice.delta.content:
+                    parts.append(choice.delta.content)
+                record["finish_reason"] = choice.finish_reason or record["finish_reason"]
+            yield chunk
+        record["content"] = "".join(parts)
+        self._writer.write("chat", request, record)
+
+    async def _create_embedding(self, **kwargs):
+        response = await self._client.embeddings.create(**kwargs)
+        self._writer.write("embedding", kwargs, _normalize_embedding(response))
+        return response
+
+
+class ReplayStore:
+    """Recorded responses, looked up by request.
+
+    A request matching a recording exactly gets it; a request recorded several
+    times gets its responses in recorded order, repeating the last. Without
+    an exact match, `strict` raises FixtureNotFound; otherwise the earliest
+    recording of the same kind and model not yet served (by either path) is
+    used, or the last one once all have been, which keeps a replay going when
+    prompts drift slightly (e.g. timings in REPL output).
+    """
+
+    def __init__(self, records: list[dict], strict: bool = False):
+        self.strict = strict
+        self._records = records
+        # Positions in `records`, per request key and per (kind, model)
+        self._by_key: dict[str, list[int]] = defaultdict(list)
+        self._by_model: dict[tuple[str, str], list[int]] = defaultdict(list)
+        self._key_cursor: dict[str, int] = defaultdict(int)
+        self._served: set[int] = set()
+        for i, record in enumerate(records):
+            self._by_key[record["key"]].append(i)
+            self._by_model[(record["kind"], record["request"].get("model"))].append(i)
+        self.exact_hits = 0
+        self.fallback_hits = 0
+
+    @classmethod
+    def load(cls, path: str, strict: bool = False) -> "ReplayStore":
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return cls(records, strict=strict)
+
+    def lookup(self, kind: str, request: dict) -> dict:
+        key = request_key(kind, request)
+        recorded = self._by_key.get(key)
+        if recorded:
+            position = recorded[min(self._key_cursor[key], len(recorded) - 1)]
+            self._key_cursor[key] += 1
+            self.exact_hits += 1
+            return self._serve(position)
+        if self.strict:
+            raise FixtureNotFound(f"No recorded {kind} response for request {key[:12]} (model {request.get('model')})")
+        candidates = self._by_model.get((kind, request.get("model")))
+        if not candidates:
+            raise FixtureNotFound(f"No recorded {kind} responses for model {request.get('model')}")
+        position = next((i for i in candidates if i not in self._served), candidates[-1])
+        self.fallback_hits += 1
+        logger.debug(f"Replay fallback for {kind} request {key[:12]}: serving recording {position}")
+        return self._serve(position)
+
+    def _serve(self, position: int) -> dict:
+        self._served.add(position)
+        return self._records[position]["response"]
+
+
+@dataclass
+class ReplayLatency:
+    """Delay injected into replayed responses: before each response, and between stream chunks."""
+
+    request_ms: float = 0.0
+    chunk_ms: float = 0.0
+
+
+def chat_completion_payload(record: dict, request: dict) -> dict:
+    """An OpenAI chat.completion body for a recorded response."""
+    return {
+        "id": "chatcmpl-replay",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": record.get("model") or request.get("model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": record.get("content")},
+            "finish_reason": record.get("finish_reason") or "stop",
+        }],
+        "usage": record.get("usage"),
+    }
+
+
+def chat_chunk_payloads(record: dict, request: dict, chunk_chars: int = 16) -> list[dict]:
+    """OpenAI chat.completion.chunk bodies that stream a recorded response."""
+    base = {
+        "id": "chatcmpl-replay",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": record.get("model") or request.get("model"),
+    }
+    content = record.get("content") or ""
+    chunks = [
+        {**base, "choices": [{"index": 0, "delta": {"content": content[i:i + chunk_chars]}, "finish_reason": None}]}
+        for i in range(0, len(content), chunk_chars)
+    ]
+    chunks.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": record.get("finish_reason") or "stop"}]})
+    if (request.get("stream_options") or {}).get("include_usage") and record.get("usage"):
+        chunks.append({**base, "choices": [], "usage": record["usage"]})
+    return chunks
+
+
+def embedding_payload(record: dict, request: dict) -> dict:
+    """An OpenAI embeddings body for a recorded response.
+
+    The openai client asks for base64 over HTTP unless told otherwise, and
+    decodes it back to floats.
+    """
+    embeddings = record["embeddings"]
+    if request.get("encoding_format") == "base64":
+        embeddings = [base64.b64encode(np.asarray(e, dtype="<f4").tobytes()).decode() for e in embeddings]
+    return {
+        "object": "list",
+        "model": record.get("model") or request.get("model"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": embedding}
+            for i, embedding in enumerate(embeddings)
+        ],
+        "usage": record.get("usage") or {"prompt_tokens": 0, "total_tokens": 0},
+    }
+
+
+class ReplayClient:
+    """In-process stand-in for AsyncOpenAI that serves recorded responses.
+
+    Supports chat.completions.create (plain and streaming) and
+    embeddings.create, returning the openai package's own response types.
+    """
+
+    def __init__(self, store: ReplayStore, latency: ReplayLatency | None = None):
+        self.store = store
+        self.latency = latency or ReplayLatency()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_chat))
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+
+    async def _create_chat(self, **kwargs):
+        from openai.types.chat import ChatCompletion
+
+        record = self.store.lookup("chat", kwargs)
+        await self._sleep(self.latency.request_ms)
+        if kwargs.get("stream"):
+            return self._stream(record, kwargs)
+        return ChatCompletion.model_validate(chat_completion_payload(record, kwargs))
+
+    async def _stream(self, record: dict, request: dict) -> AsyncIterator:
+        from openai.types.chat import ChatCompletionChunk
+
+        for i, payload in enumerate(chat_chunk_payloads(record, request)):
+            if i:
+                await self._sleep(self.latency.chunk_ms)
+            yield ChatCompletionChunk.model_validate(payload)
+
+    async def _create_embedding(self, **kwargs):
+        from openai.types import CreateEmbeddingResponse
+
+        record = self.store.lookup("embedding", kwargs)
+        await self._sleep(self.latency.request_ms)
+        return CreateEmbeddingResponse.model_validate(embedding_payload(record, kwargs))
+
+    @staticmethod
+    async def _sleep(ms: float) -> None:
+        if ms > 0:
+            await asyncio.sleep(ms / 1000)
+
+
+_writer: FixtureWriter | None = None
+_replay_client: ReplayClient | None = None
+
+
+def configured_client(make_client):
+    """The LLM client per settings: replayed (LLM_BACKEND=replay), recorded (LLM_RECORD_FILE) or live.
+
+    `make_client` builds the live AsyncOpenAI client.
+    """
+    global _writer, _replay_client
+    if settings.llm_backend == "replay":
+        if _replay_client is None:
+            _replay_client = ReplayClient(
+                ReplayStore.load(settings.llm_replay_file, strict=settings.llm_replay_strict),
+                ReplayLatency(settings.llm_replay_latency_ms, settings.llm_replay_chunk_latency_ms),
+            )
+        return _replay_client
+    client = make_client()
+    if settings.llm_record_file:
+        if _writer is None or _writer.path != settings.llm_record_file:
+            _writer = FixtureWriter(settings.llm_record_file)
+        return RecordingClient(client, _writer)
+    return client
@@ -0,0 +1,90 @@
+"""OpenAI-compatible stub server that replays recorded fixtures.
+
+    python -m app.services.llm_stub_server --fixtures fixtures.jsonl --port 8001 --latency-ms 300
+
+Point the backend at it with LLM_BACKEND=vllm and VLLM_URL=http://localhost:8001/v1.
+"""
+import argparse
+import asyncio
+import json
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.services.llm_replay import (
+    FixtureNotFound,
+    ReplayLatency,
+    ReplayStore,
+    chat_chunk_payloads,
+    chat_completion_payload,
+    embedding_payload,
+)
+
+
+def create_stub_app(store: ReplayStore, latency: ReplayLatency | None = None) -> FastAPI:
+    latency = latency or ReplayLatency()
+    app = FastAPI(title="LLM replay stub")
+
+    async def sleep(ms: float) -> None:
+        if ms > 0:
+            await asyncio.sleep(ms / 1000)
+
+    def not_found(e: FixtureNotFound) -> JSONResponse:
+        return JSONResponse(status_code=404, content={"error": {"message": str(e), "type": "fixture_not_found"}})
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        try:
+            record = store.lookup("chat", body)
+        except FixtureNotFound as e:
+            return not_found(e)
+        await sleep(latency.request_ms)
+        if not body.get("stream"):
+            return chat_completion_payload(record, body)
+
+        async def events():
+            for i, payload in enumerate(chat_chunk_payloads(record, body)):
+                if i:
+                    await sleep(latency.chunk_ms)
+                yield f"data: {json.dumps(payload)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        try:
+            record = store.lookup("embedding", body)
+        except FixtureNotFound as e:
+            return not_found(e)
+        await sleep(latency.request_ms)
+        return embedding_payload(record, body)
+
+    @app.get("/v1/stats")
+    async def stats():
+        return {"exact_hits": store.exact_hits, "fallback_hits": store.fallback_hits}
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", required=True, help="JSON lines file written with LLM_RECORD_FILE")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before each response")
+    parser.add_argument("--chunk-latency-ms", type=float, default=0.0, help="delay between stream chunks")
+    parser.add_argument("--strict", action="store_true", help="404 on requests with no exact recording")
+    args = parser.parse_args()
+
+    store = ReplayStore.load(args.fixtures, strict=args.strict)
+    app = create_stub_app(store, ReplayLatency(args.latency_ms, args.chunk_latency_ms))
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
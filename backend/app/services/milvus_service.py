@@ -1,6 +1,9 @@
+from typing import Iterator
+
 from pymilvus import CollectionSchema, DataType, FieldSchema, MilvusClient
 
 from app.config import settings
+from app.services.tracing import span
 
 VECTOR_DIM = 1536
 
@@ -59,16 +62,19 @@ class MilvusService:
     ) -> list[dict]:
         if output_fields is None:
             output_fields = ["text", "file_id", "topic_l1", "topic_keywords"]
-        results = self.client.search(
-            collection_name=collection_name,
-            data=[query_vector],
-            filter=filter_expr,
-            limit=top_k,
-            output_fields=output_fields,
-        )
+        with span("milvus.search", collection=collection_name, top_k=top_k) as search_span:
+            results = self.client.search(
+                collection_name=collection_name,
+                data=[query_vector],
+                filter=filter_expr,
+                limit=top_k,
+                output_fields=output_fields,
+            )
+            search_span.set(hits=len(results[0]))
         return [
             {
                 **hit["entity"],
+                "id": hit.get("id"),
                 "score": round(hit["distance"], 4),
             }
             for hit in results[0]
@@ -93,6 +99,54 @@ class MilvusService:
             limit=limit,
         )
 
+    def count(self, collection_name: str) -> int:
+        self.client.load_collection(collection_name=collection_name)
+        result = self.client.query(
+            collection_name=collection_name,
+            filter="",
+            output_fields=["count(*)"],
+        )
+        return int(result[0]["count(*)"]) if result else 0
+
+    def iterate(
+        self,
+        collection_name: str,
+        output_fields: list[str],
+        batch_size: int = 5000,
+    ) -> Iterator[list[dict]]:
+        """Stream every row in batches, without the 16k cap of a single query."""
+        self.client.load_collection(collection_name=collection_name)
+        iterator = self.client.query_iterator(
+            collection_name=collection_name,
+            batch_size=batch_size,
+            filter="",
+            output_fields=output_fields,
+        )
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                yield batch
+        finally:
+            iterator.close()
+
+    def get_by_ids(
+        self,
+        collection_name: str,
+        ids: list[str],
+        output_fields: list[str],
+        batch_size: int = 1000,
+    ) -> list[dict]:
+        rows = []
+        for start in range(0, len(ids), batch_size):
+            rows.extend(self.client.get(
+                collection_name=collection_name,
+                ids=ids[start:start + batch_size],
+                output_fields=output_fields,
+            ))
+        return rows
+
     def delete_by_file_id(self, collection_name: str, file_id: str) -> None:
         self.client.delete(
             collection_name=collection_name,
@@ -0,0 +1,144 @@
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+from app.config import settings
+
+
+class BudgetExceeded(Exception):
+    """Raised at the next checkpoint once a run's budget is spent or it was cancelled."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+@dataclass
+class RLMBudget:
+    """Limits for one `RLMEngine.run`, with the usage counted against them.
+
+    Limits of 0 are unlimited. Tokens and cost cover both the root model and
+    llm_query sub-calls. The engine calls `check()` before every LLM and tool
+    call; `cancel()` makes the next check fail and aborts in-flight LLM calls
+    registered with `on_cancel`, so a run can be stopped from outside.
+    """
+
+    max_tokens: int = 0
+    max_cost_usd: float = 0.0
+    max_sub_calls: int = 0
+    max_tool_calls: int = 0
+    max_seconds: float = 0.0
+
+    root_calls: int = 0
+    sub_calls: int = 0
+    tool_calls: int = 0
+    root_prompt_tokens: int = 0
+    root_completion_tokens: int = 0
+    sub_prompt_tokens: int = 0
+    sub_completion_tokens: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    cancel_reason: str | None = None
+    _cancel_callbacks: list[Callable[[], object]] = field(default_factory=list, repr=False)
+
+    @classmethod
+    def from_settings(cls) -> "RLMBudget":
+        return cls(
+            max_tokens=settings.rlm_max_tokens,
+            max_cost_usd=settings.rlm_max_cost_usd,
+            max_sub_calls=settings.rlm_max_sub_calls,
+            max_tool_calls=settings.rlm_max_tool_calls,
+            max_seconds=settings.rlm_max_seconds,
+        )
+
+    @property
+    def tokens(self) -> int:
+        return (
+            self.root_prompt_tokens + self.root_completion_tokens
+            + self.sub_prompt_tokens + self.sub_completion_tokens
+        )
+
+    @property
+    def cost_usd(self) -> float:
+        return (
+            self.root_prompt_tokens * settings.llm_input_price_per_mtok
+            + self.root_completion_tokens * settings.llm_output_price_per_mtok
+            + self.sub_prompt_tokens * settings.llm_sub_input_price_per_mtok
+            + self.sub_completion_tokens * settings.llm_sub_output_price_per_mtok
+        ) / 1_000_000
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def remaining_seconds(self) -> float | None:
+        """Seconds left on the wall-clock limit, or None if there is none."""
+        if not self.max_seconds:
+            return None
+        return max(self.max_seconds - self.elapsed, 0.0)
+
+    def exceeded(self) -> str | None:
+        """Why the run must stop, or None if it may continue."""
+        if self.cancel_reason:
+            return self.cancel_reason
+        if self.max_seconds and self.elapsed >= self.max_seconds:
+            return f"time budget of {self.max_seconds:g}s exhausted"
+        if self.max_tokens and self.tokens >= self.max_tokens:
+            return f"token budget of {self.max_tokens} exhausted"
+        if self.max_cost_usd and self.cost_usd >= self.max_cost_usd:
+            return f"cost budget of ${self.max_cost_usd:g} exhausted"
+        if self.max_sub_calls and self.sub_calls >= self.max_sub_calls:
+            return f"sub-LM call budget of {self.max_sub_calls} exhausted"
+        if self.max_tool_calls and self.tool_calls >= self.max_tool_calls:
+            return f"tool call budget of {self.max_tool_calls} exhausted"
+        return None
+
+    def check(self) -> None:
+        reason = self.exceeded()
+        if reason:
+            raise BudgetExceeded(reason)
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        self.cancel_reason = reason
+        for callback in list(self._cancel_callbacks):
+            callback()
+
+    def on_cancel(self, callback: Callable[[], object]) -> Callable[[], None]:
+        """Call `callback` if the run is cancelled; returns a function that unregisters it."""
+        self._cancel_callbacks.append(callback)
+
+        def remove() -> None:
+            if callback in self._cancel_callbacks:
+                self._cancel_callbacks.remove(callback)
+
+        return remove
+
+    def record_root(self, usage: dict) -> None:
+        self.root_calls += 1
+        self.root_prompt_tokens += usage.get("prompt_tokens", 0)
+        self.root_completion_tokens += usage.get("completion_tokens", 0)
+
+    def reserve_sub_call(self) -> None:
+        """Check the budget and count a sub-LM call before it is made.
+
+        Counting up front keeps concurrent llm_query_batch calls from all
+        passing the check before any of them is recorded.
+        """
+        self.check()
+        self.sub_calls += 1
+
+    def record_sub(self, usage: dict) -> None:
+        self.sub_prompt_tokens += usage.get("prompt_tokens", 0)
+        self.sub_completion_tokens += usage.get("completion_tokens", 0)
+
+    def record_tool(self) -> None:
+        self.tool_calls += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "tokens": self.tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "root_calls": self.root_calls,
+            "sub_calls": self.sub_calls,
+            "tool_calls": self.tool_calls,
+            "elapsed_seconds": round(self.elapsed, 3),
+        }
@@ -1,15 +1,131 @@
-import contextlib
-import io
+import ast
+import asyncio
+import functools
+import hashlib
 import logging
 import re
-from typing import Any, Callable
+from collections import Counter
+from typing import Awaitable, Callable
 
 from openai import AsyncOpenAI
 
-from app.services.rlm.prompts import build_system_prompt
+from app.config import settings
+from app.services.rlm.budget import BudgetExceeded, RLMBudget
+from app.services.rlm.executor import InProcessExecutor
+from app.services.rlm.history import History
+from app.services.rlm.namespace import NamespaceStore
+from app.services.rlm.prompts import RLM_QUERY_PROMPT, build_prompt_messages
+from app.services.rlm.streaming import CodeFenceTracker
+from app.services.rlm.sub_lm_cache import SubLMCache, sub_lm_cache_key
+from app.services.tracing import Trace, span, start_trace, trace_exporter
 
 logger = logging.getLogger(__name__)
 
+MAX_ITERATIONS_ANSWER = "Max iterations reached without a final answer."
+
+
+def _usage_dict(usage) -> dict:
+    """prompt/completion/cached token counts from a response's usage, where reported."""
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    counts = {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "cached_tokens": getattr(details, "cached_tokens", None) if details is not None else None,
+    }
+    return {key: value for key, value in counts.items() if isinstance(value, int)}
+
+
+async def _within_budget(awaitable, budget: RLMBudget):
+    """Await an LLM call, cut short when the run's time budget runs out or it is cancelled."""
+    call = asyncio.ensure_future(awaitable)
+    remove = budget.on_cancel(call.cancel)
+    try:
+        return await asyncio.wait_for(call, budget.remaining_seconds())
+    except asyncio.TimeoutError:
+        raise BudgetExceeded(f"time budget of {budget.max_seconds:g}s exhausted")
+    except asyncio.CancelledError:
+        # Cancelled through the budget, not by our caller: stop the run cleanly
+        current = asyncio.current_task()
+        if budget.cancel_reason and not (current and current.cancelling()):
+            raise BudgetExceeded(budget.cancel_reason)
+        raise
+    finally:
+        remove()
+
+
+def _guard_tool(fn: Callable, budget: RLMBudget) -> Callable:
+    """Count a tool call against the budget, refusing it once the budget is spent."""
+    @functools.wraps(fn)
+    def guarded(*args, **kwargs):
+        budget.check()
+        budget.record_tool()
+        return fn(*args, **kwargs)
+
+    async_impl = getattr(fn, "async_impl", None)
+    if async_impl is not None:
+        async def guarded_async(*args, **kwargs):
+            budget.check()
+            budget.record_tool()
+            return await async_impl(*args, **kwargs)
+
+        guarded.async_impl = guarded_async
+    return guarded
+
+
+def _error_line(stderr: str) -> str | None:
+    """The exception line the executors write to stderr, if the code raised."""
+    for line in reversed(stderr.splitlines()):
+        if line.startswith("Error: "):
+            return line
+    return None
+
+
+def _normalized_code_hash(code: str) -> str:
+    """Hash that ignores comments, whitespace and formatting."""
+    try:
+        normalized = ast.dump(ast.parse(code))
+    except SyntaxError:
+        normalized = " ".join(code.split())
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def _referenced_names(blocks: list[str]) -> set[str]:
+    """Every bare name the code reads or assigns."""
+    names = set()
+    for code in blocks:
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            continue
+        names.update(node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+    return names
+
+
+class _LoopDetector:
+    """Notices a run going in circles: the same code executed, or the same error
+    raised, `limit` times. A limit of 0 disables it."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._code = Counter()
+        self._errors = Counter()
+
+    def observe(self, blocks: list[str], error: str | None) -> str | None:
+        """Record one message's executed blocks and its error; returns why it is looping, if it is."""
+        if not self.limit:
+            return None
+        code_hash = _normalized_code_hash("\n".join(blocks))
+        self._code[code_hash] += 1
+        if self._code[code_hash] >= self.limit:
+            return f"the same code ran {self._code[code_hash]} times"
+        if error:
+            self._errors[error] += 1
+            if self._errors[error] >= self.limit:
+                return f"the same error occurred {self._errors[error]} times: {error[:200]}"
+        return None
+
 
 class RLMEngine:
     def __init__(
@@ -18,11 +134,23 @@ class RLMEngine:
         model: str,
         sub_model: str,
         max_iterations: int = 15,
+        executor=None,
+        namespace_store: NamespaceStore | None = None,
+        sub_lm_cache: SubLMCache | None = None,
+        depth: int = 0,
     ):
         self.client = client
         self.model = model
         self.sub_model = sub_model
         self.max_iterations = max_iterations
+        # Where model-written code runs; defaults to in-process exec()
+        self.executor = executor or InProcessExecutor()
+        self.namespace_store = namespace_store
+        self.sub_lm_cache = sub_lm_cache
+        # 0 for a user's query, n for a sub-run started by rlm_query at depth n - 1
+        self.depth = depth
+        # Why the last run ended without a submitted or final answer, if it did
+        self.stop_reason: str | None = None
 
     async def run(
         self,
@@ -31,111 +159,415 @@ class RLMEngine:
         tools: dict,
         tool_prompt: str,
         on_repl_step: Callable | None = None,
+        on_token: Callable | None = None,
+        namespace_key: str | None = None,
+        budget: RLMBudget | None = None,
+        prefetch: Callable[[str, int], Awaitable[list[dict]]] | None = None,
     ) -> str:
-        repl_globals: dict[str, Any] = {"__builtins__": __builtins__}
-        final_answer: dict[str, str | None] = {"value": None}
+        """Run the REPL loop until SUBMIT or a code-free reply.
 
-        def submit(answer):
-            final_answer["value"] = str(answer)
+        With `on_token`, completions are streamed and each delta is awaited as
+        {"iteration", "kind", "content"}, where kind is "text", "code",
+        "code_start" (content is the fence language) or "code_end".
 
-        def llm_query(prompt: str, ctx: str = "") -> str:
-            """Sub-LM call available inside the REPL."""
-            from app.services.rlm.tools import _run_async
+        With `namespace_key` (and a `namespace_store`), REPL variables from the
+        previous run under the same key are restored and this run's are saved.
+
+        With a `sub_lm_cache`, identical llm_query calls are answered from the
+        cache; each repl_step carries the run's running "sub_lm_cache" hit and
+        miss counts.
+
+        `budget` (default: from settings) is checked before every root, sub-LM
+        and tool call. Once it is spent or cancelled the run stops and returns
+        a best-effort answer built from what it has so far. Why a run ended
+        this way, or on a detected loop or the iteration limit, is left in
+        `stop_reason`.
+
+        The run is traced: LLM calls, REPL executions, tools, embeddings and
+        Milvus searches are spans, each repl_step carries a "timings" summary
+        of its iteration, and the finished trace goes to `trace_exporter`.
+
+        Below `rlm_max_depth`, rlm_query/rlm_query_batch start child runs
+        with their own REPL, the same tools and this run's budget.
+
+        With `prefetch(query, top_k)`, retrieval for the raw query starts
+        before anything else; its results are bound to `prefetched` in the
+        REPL and summarized in the first user message, so the model usually
+        needs no search round trip of its own.
+        """
+        from app.services.rlm.tools import sync_tool
+
+        self.stop_reason = None
+        budget = budget or RLMBudget.from_settings()
+        sub_params = {"max_completion_tokens": 8000}
+        cache_stats = {"hits": 0, "misses": 0}
+
+        async def _sub_call(prompt: str, ctx: str = "") -> str:
+            with span("llm.sub", model=self.sub_model) as sub_span:
+                budget.check()
+                key = None
+                if self.sub_lm_cache is not None:
+                    key = sub_lm_cache_key(self.sub_model, prompt, ctx, sub_params)
+                    cached = await self.sub_lm_cache.get(key)
+                    if cached is not None:
+                        cache_stats["hits"] += 1
+                        sub_span.set(cache="hit")
+                        return cached
+                    cache_stats["misses"] += 1
+                    sub_span.set(cache="miss")
 
-            async def _call():
                 content = f"{prompt}\n\nContext:\n{ctx}" if ctx else prompt
                 messages = [{"role": "user", "content": content}]
-                response = await self.client.chat.completions.create(
-                    model=self.sub_model,
-                    messages=messages,
-                    max_completion_tokens=8000,
+                budget.reserve_sub_call()
+                response = await _within_budget(
+                    self.client.chat.completions.create(
+                        model=self.sub_model,
+                        messages=messages,
+                        **sub_params,
+                    ),
+                    budget,
                 )
+                usage = _usage_dict(getattr(response, "usage", None))
+                sub_span.set(**usage)
+                budget.record_sub(usage)
                 result = response.choices[0].message.content
                 if not result:
                     logger.warning("llm_query returned empty content")
                     return "(No response from sub-model)"
+                if key is not None:
+                    await self.sub_lm_cache.put(key, self.sub_model, result)
                 return result
 
-            return _run_async(_call())
+        async def llm_query(prompt: str, ctx: str = "") -> str:
+            """Sub-LM call available inside the REPL."""
+            return await _sub_call(prompt, ctx)
+
+        async def llm_query_batch(prompts: list[str], ctxs: list[str] | None = None) -> list[str]:
+            """Concurrent sub-LM calls, at most `llm_batch_concurrency` in flight; results in order."""
+            if ctxs is not None and len(ctxs) != len(prompts):
+                raise ValueError("ctxs must have the same length as prompts")
+            semaphore = asyncio.Semaphore(settings.llm_batch_concurrency)
 
-        # Inject into namespace
-        repl_globals["context"] = context
-        repl_globals["llm_query"] = llm_query
-        repl_globals["SUBMIT"] = submit
-        repl_globals.update(tools)
+            async def _bounded(prompt: str, ctx: str) -> str:
+                async with semaphore:
+                    return await _sub_call(prompt, ctx)
 
-        system_prompt = build_system_prompt(context, tool_prompt)
+            results = await asyncio.gather(
+                *(_bounded(p, ctxs[i] if ctxs else "") for i, p in enumerate(prompts)),
+                return_exceptions=True,
+            )
+            # One failed call must not sink the batch
+            return [
+                f"Error: {type(r).__name__}: {r}" if isinstance(r, Exception) else r
+                for r in results
+            ]
+
+        async def _child_run(question: str, ctx: str) -> str:
+            budget.check()
+            child = RLMEngine(
+                client=self.client,
+                model=self.model,
+                sub_model=self.sub_model,
+                max_iterations=settings.rlm_child_max_iterations,
+                executor=self.executor,
+                sub_lm_cache=self.sub_lm_cache,
+                depth=self.depth + 1,
+            )
+            return await child.run(query=question, context=ctx, tools=tools, tool_prompt=tool_prompt, budget=budget)
 
-        history = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Query: {query}"},
-        ]
+        async def rlm_query(question: str, ctx: str = "") -> str:
+            """Sub-RLM run available inside the REPL."""
+            return await _child_run(question, ctx)
 
-        for iteration in range(self.max_iterations):
+        async def rlm_query_batch(questions: list[str], ctxs: list[str] | None = None) -> list[str]:
+            """Concurrent sub-RLM runs, at most `rlm_query_concurrency` in flight; results in order."""
+            if ctxs is not None and len(ctxs) != len(questions):
+                raise ValueError("ctxs must have the same length as questions")
+            semaphore = asyncio.Semaphore(settings.rlm_query_concurrency)
+
+            async def _bounded(question: str, ctx: str) -> str:
+                async with semaphore:
+                    return await _child_run(question, ctx)
+
+            results = await asyncio.gather(
+                *(_bounded(q, ctxs[i] if ctxs else "") for i, q in enumerate(questions)),
+                return_exceptions=True,
+            )
+            return [
+                f"Error: {type(r).__name__}: {r}" if isinstance(r, Exception) else r
+                for r in results
+            ]
+
+        recursive = self.depth < settings.rlm_max_depth
+
+        try:
+            with start_trace("rlm.run", model=self.model, sub_model=self.sub_model, depth=self.depth) as trace:
+                # Retrieval for the raw query overlaps with the rest of the setup
+                prefetch_task = None
+                if prefetch is not None:
+                    prefetch_task = asyncio.ensure_future(prefetch(query, settings.rlm_prefetch_top_k))
+
+                persist = self.namespace_store is not None and namespace_key is not None
+                restored = self.namespace_store.load(namespace_key) if persist else {}
+
+                repl_tools = {name: _guard_tool(fn, budget) for name, fn in tools.items()}
+                repl_tools.update(llm_query=sync_tool(llm_query), llm_query_batch=sync_tool(llm_query_batch))
+                if recursive:
+                    repl_tools.update(rlm_query=sync_tool(rlm_query), rlm_query_batch=sync_tool(rlm_query_batch))
+                # Every execution's full output is appended to _repl_outputs inside the REPL
+                repl_values = {"context": context, "_repl_outputs": []}
+
+                prefetched = None
+                if prefetch_task is not None:
+                    prefetched = await self._await_prefetch(prefetch_task)
+                if prefetched is not None:
+                    budget.record_tool()
+                    repl_values["prefetched"] = prefetched
+
+                history = History(
+                    keep_recent=settings.history_keep_recent_outputs,
+                    compact_after_tokens=settings.history_compact_after_tokens,
+                    digest_chars=settings.history_digest_chars,
+                )
+                # Static prefix first, then per-user tools, then the query, so the
+                # provider's prompt cache can reuse the longest possible prefix
+                full_tool_prompt = tool_prompt + RLM_QUERY_PROMPT if recursive else tool_prompt
+                for message in build_prompt_messages(context, full_tool_prompt, query, list(restored), prefetched):
+                    history.append(message["role"], message["content"])
+
+                async with self.executor.session(repl_tools, repl_values, restored, nested=self.depth > 0) as repl:
+                    try:
+                        return await self._loop(repl, history, on_repl_step, on_token, cache_stats, budget, trace)
+                    finally:
+                        if persist:
+                            used = _referenced_names([
+                                code
+                                for message in history.messages if message["role"] == "assistant"
+                                for code in self._extract_code_blocks(message["content"])
+                            ])
+                            await self._save_namespace(repl, namespace_key, used)
+        finally:
+            # Sub-runs are spans in their root run's trace
+            if self.depth == 0:
+                await trace_exporter.export(trace)
+
+    async def _await_prefetch(self, task: asyncio.Future) -> list[dict] | None:
+        """The prefetched results, or None if the prefetch failed or ran past its timeout."""
+        try:
+            return await asyncio.wait_for(task, settings.rlm_prefetch_timeout_seconds)
+        except asyncio.TimeoutError:
+            logger.warning(f"Prefetch took over {settings.rlm_prefetch_timeout_seconds:g}s; starting without it")
+        except Exception as e:
+            logger.warning(f"Prefetch failed: {e}")
+        return None
+
+    async def _loop(
+        self,
+        repl,
+        history: History,
+        on_repl_step: Callable | None,
+        on_token: Callable | None,
+        cache_stats: dict,
+        budget: RLMBudget,
+        trace: Trace,
+    ) -> str:
+        prompt_tokens = 0
+        usage_totals = {"prompt_tokens": 0, "cached_tokens": 0}
+        executions = 0
+        loops = _LoopDetector(settings.rlm_loop_repeat_limit)
+        forced_reason: str | None = None
+        try:
+            for iteration in range(self.max_iterations):
+                with span("rlm.iteration", iteration=iteration + 1) as iteration_span:
+                    first_span = len(trace.spans)
+                    history.compact()
+                    prompt_tokens += history.total_tokens
+                    budget.check()
+                    with span("llm.root", model=self.model) as root_span:
+                        assistant_msg, usage = await _within_budget(
+                            self._complete(history.messages, iteration + 1, on_token), budget
+                        )
+                        root_span.set(**usage)
+                    budget.record_root(usage)
+                    for key in usage_totals:
+                        usage_totals[key] += usage.get(key, 0)
+                    if usage:
+                        logger.debug(f"Iteration {iteration + 1} usage: {usage}")
+                    history.append("assistant", assistant_msg)
+
+                    blocks = self._extract_code_blocks(assistant_msg)
+
+                    if blocks:
+                        outputs = []
+                        submitted = None
+                        error = None
+                        for index, code in enumerate(blocks, 1):
+                            with span("repl.exec", code_chars=len(code), block=index):
+                                result = await repl.execute(code)
+
+                            stdout = result.stdout[:8192]
+                            stderr = result.stderr[:2000]
+
+                            repl_output = ""
+                            if stdout:
+                                repl_output += f"stdout:\n{stdout}\n"
+                            if stderr:
+                                repl_output += f"stderr:\n{stderr}\n"
+                            if not repl_output:
+                                repl_output = "(no output)"
+                            outputs.append(repl_output)
+
+                            if on_repl_step:
+                                await on_repl_step({
+                                    "iteration": iteration + 1,
+                                    "block": index,
+                                    "code": code,
+                                    "output": repl_output,
+                                    "has_answer": result.submitted is not None,
+                                    "usage": usage,
+                                    "sub_lm_cache": dict(cache_stats),
+                                    "budget": budget.snapshot(),
+                                    "timings": {
+                                        "iteration_ms": round(iteration_span.duration_ms, 3),
+                                        "spans": trace.summary(first_span),
+                                    },
+                                })
+
+                            submitted = result.submitted
+                            error = _error_line(result.stderr)
+                            # Later blocks were written assuming this one worked
+                            if submitted is not None or error:
+                                break
+
+                        if len(blocks) > 1:
+                            repl_output = "".join(
+                                f"[block {i}/{len(blocks)}]\n{out}" for i, out in enumerate(outputs, 1)
+                            )
+                            if len(outputs) < len(blocks):
+                                repl_output += f"(blocks {len(outputs) + 1}-{len(blocks)} skipped)\n"
+                        history.append(
+                            "user", f"REPL output:\n{repl_output}",
+                            output_index=executions, output_count=len(outputs),
+                        )
+                        # Every executed block appended one entry to _repl_outputs
+                        executions += len(outputs)
+
+                        if submitted is not None:
+                            logger.info(f"SUBMIT called at iteration {iteration + 1}, answer length: {len(submitted)}")
+                            return submitted
+
+                        loop_reason = loops.observe(blocks[:len(outputs)], error)
+                        if forced_reason is not None:
+                            # The model was told to answer and didn't
+                            logger.warning(f"No answer after loop warning: {forced_reason}")
+                            self.stop_reason = forced_reason
+                            return self._best_effort_answer(history, forced_reason)
+                        if loop_reason is not None:
+                            logger.warning(f"Loop detected at iteration {iteration + 1}: {loop_reason}")
+                            forced_reason = loop_reason
+                            history.append(
+                                "user",
+                                f"You are stuck in a loop ({loop_reason}). Do not retry it. "
+                                "Call SUBMIT() now with the best answer you can give from what you have.",
+                            )
+                    else:
+                        # No code block — check for inline SUBMIT with quoted string content
+                        if "SUBMIT" in assistant_msg:
+                            match = re.search(r'SUBMIT\(["\'](.+?)["\']\)', assistant_msg, re.DOTALL)
+                            if match:
+                                logger.info(f"Inline SUBMIT found at iteration {iteration + 1}")
+                                return match.group(1)
+
+                        # Treat full message as final answer
+                        logger.info(f"No code block at iteration {iteration + 1}, treating as final answer")
+                        return assistant_msg
+
+            logger.warning("Max iterations reached without a final answer")
+            self.stop_reason = "max iterations reached"
+            return MAX_ITERATIONS_ANSWER
+        except BudgetExceeded as e:
+            logger.warning(f"Run stopped: {e.reason}")
+            self.stop_reason = e.reason
+            return self._best_effort_answer(history, e.reason)
+        finally:
+            logger.info(
+                f"Run sent {prompt_tokens} prompt tokens; "
+                f"history compaction saved {history.saved_tokens}; "
+                f"provider reported {usage_totals['cached_tokens']}/{usage_totals['prompt_tokens']} "
+                f"prompt tokens served from cache; "
+                f"sub-LM cache {cache_stats['hits']} hits, {cache_stats['misses']} misses; "
+                f"budget used {budget.snapshot()}; "
+                f"trace {trace.trace_id}"
+            )
+
+    def _best_effort_answer(self, history: History, reason: str) -> str:
+        """Answer for a run stopped early: its latest REPL output, else its latest prose."""
+        partial = None
+        for entry in reversed(history.entries):
+            if entry.output_index is not None:
+                partial = entry.message["content"].removeprefix("REPL output:\n")
+                break
+        if partial is None:
+            for message in reversed(history.messages):
+                if message["role"] == "assistant":
+                    prose = re.sub(r"```.*?(```|$)", "", message["content"], flags=re.DOTALL).strip()
+                    if prose:
+                        partial = prose
+                        break
+        if not partial:
+            return f"Stopped early ({reason}) before an answer was found."
+        return f"Stopped early ({reason}). Partial result:\n\n{partial}"
+
+    async def _save_namespace(self, repl, namespace_key: str, used: set[str]) -> None:
+        try:
+            blobs = await repl.snapshot(self.namespace_store.max_value_bytes)
+        except Exception as e:
+            logger.warning(f"REPL namespace snapshot failed: {e}")
+            return
+        if blobs is None:
+            # The worker was lost mid-run; keep the previous turn's variables
+            return
+        evicted = self.namespace_store.save(namespace_key, blobs, used=used)
+        if evicted:
+            logger.info(f"Namespace {namespace_key}: evicted {', '.join(evicted)} over the memory cap")
+
+    async def _complete(self, history: list[dict], iteration: int, on_token: Callable | None) -> tuple[str, dict]:
+        """One root-model completion; returns the text and its token usage."""
+        if on_token is None:
             response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=history,
                 max_completion_tokens=4000,
             )
-            assistant_msg = response.choices[0].message.content
-            history.append({"role": "assistant", "content": assistant_msg})
-
-            code = self._extract_code(assistant_msg)
-
-            if code:
-                stdout_capture = io.StringIO()
-                stderr_capture = io.StringIO()
-
-                try:
-                    with contextlib.redirect_stdout(stdout_capture), \
-                         contextlib.redirect_stderr(stderr_capture):
-                        exec(code, repl_globals, repl_globals)
-                except Exception as e:
-                    stderr_capture.write(f"Error: {type(e).__name__}: {str(e)}")
-
-                stdout = stdout_capture.getvalue()[:8192]
-                stderr = stderr_capture.getvalue()[:2000]
-
-                repl_output = ""
-                if stdout:
-                    repl_output += f"stdout:\n{stdout}\n"
-                if stderr:
-                    repl_output += f"stderr:\n{stderr}\n"
-                if not repl_output:
-                    repl_output = "(no output)"
-
-                if on_repl_step:
-                    await on_repl_step({
-                        "iteration": iteration + 1,
-                        "code": code,
-                        "output": repl_output,
-                        "has_answer": final_answer["value"] is not None,
-                    })
-
-                history.append({
-                    "role": "user",
-                    "content": f"REPL output:\n{repl_output}",
-                })
-
-                if final_answer["value"] is not None:
-                    logger.info(f"SUBMIT called at iteration {iteration + 1}, answer length: {len(final_answer['value'])}")
-                    return final_answer["value"]
-            else:
-                # No code block — check for inline SUBMIT with quoted string content
-                if "SUBMIT" in assistant_msg:
-                    match = re.search(r'SUBMIT\(["\'](.+?)["\']\)', assistant_msg, re.DOTALL)
-                    if match:
-                        logger.info(f"Inline SUBMIT found at iteration {iteration + 1}")
-                        return match.group(1)
-
-                # Treat full message as final answer
-                logger.info(f"No code block at iteration {iteration + 1}, treating as final answer")
-                return assistant_msg
-
-        logger.warning("Max iterations reached without a final answer")
-        return "Max iterations reached without a final answer."
-
-    def _extract_code(self, response: str) -> str | None:
-        """Extract Python code from markdown code blocks."""
-        match = re.search(r'```(?:python|repl)\n(.*?)```', response, re.DOTALL)
-        return match.group(1).strip() if match else None
+            return response.choices[0].message.content, _usage_dict(getattr(response, "usage", None))
+
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=history,
+            max_completion_tokens=4000,
+            stream=True,
+            # Usage arrives in a final chunk with no choices
+            stream_options={"include_usage": True},
+        )
+        tracker = CodeFenceTracker()
+        parts = []
+        usage = {}
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = _usage_dict(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            parts.append(delta)
+            for kind, content in tracker.feed(delta):
+                await on_token({"iteration": iteration, "kind": kind, "content": content})
+        for kind, content in tracker.flush():
+            await on_token({"iteration": iteration, "kind": kind, "content": content})
+        return "".join(parts), usage
+
+    def _extract_code_blocks(self, response: str) -> list[str]:
+        """Every non-empty ```python / ```repl block, in order."""
+        blocks = (m.strip() for m in re.findall(r'```(?:python|repl)\n(.*?)```', response, re.DOTALL))
+        return [block for block in blocks if block]
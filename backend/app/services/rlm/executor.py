@@ -0,0 +1,366 @@
+import asyncio
+import contextlib
+import inspect
+import io
+import logging
+import multiprocessing
+import pickle
+import threading
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable
+
+from app.config import settings
+from app.services.rlm.repl_worker import load_message, record_output, restore_namespace, snapshot_namespace, worker_main
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReplResult:
+    stdout: str
+    stderr: str
+    submitted: str | None = None
+
+
+class InProcessReplSession:
+    """Runs code with exec() on the calling thread; tools are called directly.
+
+    Async tools re-enter the running loop through their sync wrappers
+    (nest_asyncio), which blocks it for the whole call.
+    """
+
+    def __init__(self, tools: dict[str, Callable], values: dict, restored: dict[str, bytes] | None = None):
+        self._submitted: dict[str, str | None] = {"value": None}
+        self._reserved = set(tools) | set(values) | {"SUBMIT"}
+
+        def submit(answer):
+            self._submitted["value"] = str(answer)
+
+        self.namespace: dict = {"__builtins__": __builtins__}
+        self.namespace.update(restore_namespace(restored or {}))
+        self.namespace.update(values)
+        self.namespace.update(tools)
+        self.namespace["SUBMIT"] = submit
+
+    async def execute(self, code: str) -> ReplResult:
+        stdout_capture = io.StringIO()
+        stderr_capture = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(stdout_capture), \
+                 contextlib.redirect_stderr(stderr_capture):
+                exec(code, self.namespace, self.namespace)
+        except Exception as e:
+            stderr_capture.write(f"Error: {type(e).__name__}: {str(e)}")
+        stdout, stderr = stdout_capture.getvalue(), stderr_capture.getvalue()
+        record_output(self.namespace, stdout, stderr)
+        return ReplResult(stdout, stderr, self._submitted["value"])
+
+    async def snapshot(self, max_value_bytes: int) -> dict[str, bytes] | None:
+        return snapshot_namespace(self.namespace, self._reserved, max_value_bytes)
+
+
+class InProcessExecutor:
+    """Executes REPL code on the event loop thread. Used in tests and for local debugging."""
+
+    @asynccontextmanager
+    async def session(
+        self,
+        tools: dict[str, Callable],
+        values: dict,
+        restored: dict[str, bytes] | None = None,
+        nested: bool = False,
+    ) -> AsyncIterator[InProcessReplSession]:
+        yield InProcessReplSession(tools, values, restored)
+
+
+async def _wait_readable(conn, timeout: float) -> bool:
+    """Wait for a message on `conn` on the event loop, without tying up a thread."""
+    if conn.poll():
+        return True
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    fd = conn.fileno()
+    loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+    try:
+        await asyncio.wait_for(ready, max(timeout, 0))
+        return True
+    except TimeoutError:
+        return False
+    finally:
+        loop.remove_reader(fd)
+
+
+class _Worker:
+    def __init__(self, ctx, memory_mb: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=worker_main, args=(child_conn, memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(("stop",))
+        except (OSError, EOFError):
+            pass
+        self.process.join(timeout=1)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=1)
+        self.conn.close()
+
+
+class ProcessReplSession:
+    """A run's REPL, leased from the pool: one worker process for the whole run.
+
+    Tool calls made by the code arrive as IPC messages and are executed here,
+    in the API process, so credentials and DB sessions never leave it. Async
+    tools (`async_impl`) are awaited on the loop and sync ones run in a
+    thread, so a slow call only holds up its own run. A worker
+    that hits the wall-clock limit or dies is killed and replaced; the next
+    execution starts from a fresh namespace.
+    """
+
+    def __init__(
+        self,
+        pool: "ReplProcessPool",
+        tools: dict[str, Callable],
+        values: dict,
+        restored: dict[str, bytes] | None = None,
+    ):
+        self._pool = pool
+        self._tools = tools
+        self._values = values
+        self._restored = restored or {}
+        self._worker: _Worker | None = None
+        self._submitted: str | None = None
+        self._lost_state = False
+
+    async def _ensure_worker(self) -> bool:
+        """Attach a worker if needed; returns True if the namespace is new."""
+        if self._worker is not None:
+            return False
+        self._worker = await self._pool._checkout()
+        # Restored variables are only sent to the first worker; after a crash the
+        # model is told its state is gone
+        restored = {} if self._lost_state else self._restored
+        self._worker.conn.send(("init", self._values, list(self._tools), restored))
+        await self._recv(settings.repl_wall_seconds)
+        return True
+
+    async def _recv(self, timeout: float):
+        conn = self._worker.conn
+        if not await _wait_readable(conn, timeout):
+            raise TimeoutError
+        return load_message(conn.recv_bytes())
+
+    def _discard_worker(self) -> None:
+        if self._worker is not None:
+            self._pool._discard(self._worker)
+            self._worker = None
+            self._lost_state = True
+
+    async def execute(self, code: str) -> ReplResult:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.repl_wall_seconds
+        try:
+            notice = ""
+            if await self._ensure_worker() and self._lost_state:
+                notice = "(REPL state was reset; variables from earlier steps are gone)\n"
+                self._lost_state = False
+            self._worker.conn.send(("exec", code, settings.repl_cpu_seconds))
+            while True:
+                message = await self._recv(deadline - loop.time())
+                if message[0] == "done":
+                    _, stdout, stderr, submitted = message
+                    self._submitted = submitted or self._submitted
+                    return ReplResult(stdout, notice + stderr, self._submitted)
+                if message[0] == "call":
+                    self._reply(await self._call_tool(*message[1:]))
+        except TimeoutError:
+            self._discard_worker()
+            return ReplResult(
+                "",
+                f"Error: TimeoutError: execution exceeded the {settings.repl_wall_seconds:g}s wall-clock limit; "
+                "REPL state was reset",
+                self._submitted,
+            )
+        except asyncio.CancelledError:
+            # The worker may still be running the cancelled code; free the slot now
+            self._discard_worker()
+            raise
+        except pickle.UnpicklingError as e:
+            logger.warning(f"REPL worker sent a disallowed message: {e}")
+            self._discard_worker()
+            return ReplResult(
+                "",
+                "Error: UnsafeMessage: the REPL sent a value that is not a plain builtin type; REPL state was reset",
+                self._submitted,
+            )
+        except (EOFError, OSError) as e:
+            logger.warning(f"REPL worker died: {e!r}")
+            self._discard_worker()
+            return ReplResult(
+                "",
+                "Error: WorkerCrashed: the REPL process exited (likely out of memory); REPL state was reset",
+                self._submitted,
+            )
+
+    async def _call_tool(self, name: str, args: tuple, kwargs: dict) -> tuple:
+        fn = self._tools.get(name)
+        if fn is None:
+            return ("error", f"Unknown tool: {name}")
+        async_impl = getattr(fn, "async_impl", None)
+        if async_impl is None and inspect.iscoroutinefunction(fn):
+            async_impl = fn
+        try:
+            if async_impl is not None:
+                result = await async_impl(*args, **kwargs)
+            else:
+                result = await asyncio.to_thread(fn, *args, **kwargs)
+            return ("ok", result)
+        except Exception as e:
+            return ("error", f"{type(e).__name__}: {str(e)}")
+
+    def _reply(self, reply: tuple) -> None:
+        try:
+            self._worker.conn.send(reply)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            # Unpicklable result: pickling fails before anything is written
+            self._worker.conn.send(("error", f"Tool result could not be sent to the REPL: {e}"))
+
+    async def snapshot(self, max_value_bytes: int) -> dict[str, bytes] | None:
+        """Pickled model variables, or None if the worker (and its state) was lost."""
+        if self._worker is None:
+            return None if self._lost_state else dict(self._restored)
+        try:
+            self._worker.conn.send(("snapshot", max_value_bytes))
+            message = await self._recv(settings.repl_wall_seconds)
+            return message[1]
+        except (TimeoutError, EOFError, OSError, pickle.UnpicklingError):
+            self._discard_worker()
+            return None
+
+    async def close(self) -> None:
+        worker, self._worker = self._worker, None
+        if worker is None:
+            return
+        try:
+            worker.conn.send(("reset",))
+            if await _wait_readable(worker.conn, 5) and load_message(worker.conn.recv_bytes()) == ("ok",):
+                self._pool._checkin(worker)
+                return
+        except (EOFError, OSError, pickle.UnpicklingError):
+            pass
+        self._pool._discard(worker)
+
+
+class ReplProcessPool:
+    """Pre-warmed worker processes for REPL execution, one leased per run.
+
+    Model code never runs on the event loop: each execution has a CPU-time
+    limit (RLIMIT_CPU in the worker), a memory cap (RLIMIT_AS) and a
+    wall-clock limit enforced by the parent, which kills the worker. At most
+    `size` runs execute at once; further runs wait for a free worker.
+    """
+
+    def __init__(self, size: int, memory_mb: int):
+        self.size = size
+        self.memory_mb = memory_mb
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: list[_Worker] = []
+        self._slots: asyncio.Semaphore | None = None
+        self._warming = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._slots is not None:
+                return
+            self._idle = [_Worker(self._ctx, self.memory_mb) for _ in range(self.size)]
+            self._slots = asyncio.Semaphore(self.size)
+        logger.info(f"Started {self.size} REPL workers")
+
+    async def _checkout(self) -> _Worker:
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.process.is_alive():
+                return worker
+            worker.kill()
+        # Spawning blocks until the child is launched; keep it off the loop
+        return await asyncio.to_thread(_Worker, self._ctx, self.memory_mb)
+
+    def _checkin(self, worker: _Worker) -> None:
+        # Nested sessions can lease workers beyond `size`; don't keep the surplus
+        if len(self._idle) >= self.size:
+            worker.kill()
+            return
+        self._idle.append(worker)
+
+    def _discard(self, worker: _Worker) -> None:
+        worker.kill()
+        # Pre-warm the replacement, off the loop, so the next run doesn't pay the spawn cost
+        with self._lock:
+            if len(self._idle) + self._warming >= self.size:
+                return
+            self._warming += 1
+        asyncio.get_running_loop().run_in_executor(None, self._prewarm)
+
+    def _prewarm(self) -> None:
+        try:
+            worker = _Worker(self._ctx, self.memory_mb)
+        except Exception as e:
+            logger.warning(f"Could not pre-warm a REPL worker: {e!r}")
+            worker = None
+        with self._lock:
+            self._warming -= 1
+            if worker is not None and self._slots is not None:
+                self._idle.append(worker)
+                return
+        if worker is not None:
+            # The pool shut down while this worker was starting
+            worker.stop()
+
+    @asynccontextmanager
+    async def session(
+        self,
+        tools: dict[str, Callable],
+        values: dict,
+        restored: dict[str, bytes] | None = None,
+        nested: bool = False,
+    ) -> AsyncIterator[ProcessReplSession]:
+        """Lease a worker for one run.
+
+        A `nested` session belongs to an rlm_query sub-run whose parent already
+        holds a slot. It skips the slot limit, which could otherwise deadlock
+        with every slot held by a parent waiting on its children. The caller
+        bounds how many nested sessions it opens.
+        """
+        if self._slots is None:
+            await asyncio.to_thread(self.start)
+        async with contextlib.nullcontext() if nested else self._slots:
+            repl = ProcessReplSession(self, tools, values, restored)
+            try:
+                yield repl
+            finally:
+                await repl.close()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._slots = None
+        for worker in idle:
+            worker.stop()
+
+
+repl_pool = ReplProcessPool(size=settings.repl_workers, memory_mb=settings.repl_memory_mb)
+
+
+def get_repl_executor():
+    """The executor configured by `repl_executor`: "process" (default) or "inprocess"."""
+    if settings.repl_executor == "inprocess":
+        return InProcessExecutor()
+    return repl_pool
@@ -0,0 +1,110 @@
+import functools
+import logging
+from dataclasses import dataclass, field
+from typing import Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Per-message framing tokens added by the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@functools.lru_cache(maxsize=8)
+def _encoding(model: str):
+    """The model's tiktoken encoding, or None if it can't be loaded (cached either way).
+
+    tiktoken downloads encodings on first use, which fails offline.
+    """
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken encoding for {model} unavailable, estimating tokens: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """Token count for `text` under the model's tokenizer, or a chars/4 estimate."""
+    encoding = _encoding(model or settings.llm_model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+@dataclass
+class _Entry:
+    message: dict
+    tokens: int
+    # Index into the REPL's `_repl_outputs` for REPL output messages, and how
+    # many consecutive outputs (one per executed code block) the message holds
+    output_index: int | None = None
+    output_count: int = 1
+    compacted: bool = False
+
+
+@dataclass
+class History:
+    """The engine's message list with a token count per message.
+
+    `compact()` replaces all but the most recent REPL outputs with short
+    digests once the history grows past `compact_after_tokens`. The system
+    prompt, the query and every assistant message stay verbatim, and the
+    full outputs remain in the REPL as `_repl_outputs[i]`.
+    """
+
+    keep_recent: int
+    compact_after_tokens: int
+    digest_chars: int
+    counter: Callable[[str], int] = count_tokens
+    entries: list[_Entry] = field(default_factory=list)
+    saved_tokens: int = 0
+
+    def append(self, role: str, content: str, output_index: int | None = None, output_count: int = 1) -> None:
+        message = {"role": role, "content": content}
+        self.entries.append(_Entry(message, self._count(content), output_index, output_count))
+
+    @property
+    def messages(self) -> list[dict]:
+        return [entry.message for entry in self.entries]
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(entry.tokens for entry in self.entries)
+
+    def compact(self) -> int:
+        """Digest old REPL outputs if over budget; returns the tokens saved by this call."""
+        if self.total_tokens <= self.compact_after_tokens:
+            return 0
+        outputs = [e for e in self.entries if e.output_index is not None]
+        old = outputs[:-self.keep_recent] if self.keep_recent else outputs
+        saved = 0
+        for entry in old:
+            if entry.compacted:
+                continue
+            digest = self._digest(entry.message["content"], entry.output_index, entry.output_count)
+            tokens = self._count(digest)
+            if tokens >= entry.tokens:
+                continue
+            saved += entry.tokens - tokens
+            entry.message = {**entry.message, "content": digest}
+            entry.tokens = tokens
+            entry.compacted = True
+        self.saved_tokens += saved
+        return saved
+
+    def _count(self, content: str) -> int:
+        return self.counter(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def _digest(self, content: str, output_index: int, output_count: int = 1) -> str:
+        head = content[:self.digest_chars].rstrip()
+        if output_count > 1:
+            where = f"the full texts are in the REPL variable _repl_outputs[{output_index}:{output_index + output_count}]"
+        else:
+            where = f"the full text is in the REPL variable _repl_outputs[{output_index}]"
+        return f"{head}\n... [older REPL output truncated; {where}]"
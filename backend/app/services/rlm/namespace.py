@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+
+@dataclass
+class _SessionNamespace:
+    # name -> pickled value
+    values: dict[str, bytes] = field(default_factory=dict)
+    # name -> turn the value was last written or referenced by the model's code
+    last_used: dict[str, int] = field(default_factory=dict)
+    turn: int = 0
+    touched: float = field(default_factory=time.monotonic)
+
+    @property
+    def size(self) -> int:
+        return sum(len(blob) for blob in self.values.values())
+
+
+class NamespaceStore:
+    """REPL variables kept between turns of a chat session, as pickled bytes.
+
+    Each session is capped at `max_bytes`. When a save goes over it, values
+    are evicted by size times turns since last use, so large values that have
+    gone unused go first. A value counts as used in the turn that writes it or
+    whose code mentions its name. Values over `max_value_bytes` are never kept.
+    Sessions idle for `ttl_seconds` expire, and at most `max_sessions` are
+    held, least recently used evicted first.
+    """
+
+    def __init__(self, max_bytes: int, max_value_bytes: int, ttl_seconds: float, max_sessions: int):
+        self.max_bytes = max_bytes
+        self.max_value_bytes = max_value_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, _SessionNamespace] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, key: str) -> dict[str, bytes]:
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return {}
+            if time.monotonic() - entry.touched > self.ttl_seconds:
+                del self._sessions[key]
+                return {}
+            entry.touched = time.monotonic()
+            self._sessions.move_to_end(key)
+            return dict(entry.values)
+
+    def save(self, key: str, blobs: dict[str, bytes], used: set[str] | None = None) -> list[str]:
+        """Replace the session's variables with `blobs`; returns the names evicted.
+
+        `used` names the variables this turn's code referenced.
+        """
+        used = used or set()
+        with self._lock:
+            previous = self._sessions.get(key)
+            turn = previous.turn + 1 if previous is not None else 1
+            entry = _SessionNamespace(turn=turn, touched=time.monotonic())
+            evicted = []
+            for name, blob in blobs.items():
+                if len(blob) > self.max_value_bytes:
+                    evicted.append(name)
+                    continue
+                entry.values[name] = blob
+                unchanged = previous is not None and previous.values.get(name) == blob
+                if unchanged and name not in used:
+                    entry.last_used[name] = previous.last_used.get(name, turn)
+                else:
+                    entry.last_used[name] = turn
+
+            def weight(name: str) -> int:
+                return len(entry.values[name]) * (turn - entry.last_used[name] + 1)
+
+            while entry.values and entry.size > self.max_bytes:
+                name = max(entry.values, key=weight)
+                del entry.values[name]
+                evicted.append(name)
+
+            self._sessions[key] = entry
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return evicted
+
+    def drop(self, key: str) -> None:
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": sum(entry.size for entry in self._sessions.values()),
+            }
@@ -1,26 +1,29 @@
-def build_system_prompt(context: str, tool_prompt: str) -> str:
-    context_preview = context[:200] + "..." if len(context) > 200 else context
-    return f"""You are an RLM (Recursive Language Model) operating in a Python REPL environment.
+# Byte-identical for every user and query, so it forms a prompt prefix the
+# provider can cache across requests. Nothing request-specific goes in here:
+# per-user tools and per-query context follow in later messages.
+STATIC_SYSTEM_PROMPT = """You are an RLM (Recursive Language Model) operating in a Python REPL environment.
 
-You have a variable `context` available containing the user's input data ({len(context)} characters).
-Preview: {context_preview}
+You have a variable `context` available containing the user's input data. Its size and a preview are given with the query.
 
 You can write Python code in ```python blocks to:
 - Examine and process the context programmatically
 - Call retrieval tools to find additional information
 - Use llm_query(prompt, context) for recursive sub-LM calls on text
+- Use llm_query_batch(prompts, ctxs) to run many sub-LM calls at once
 - Use print() to see intermediate results
 
 When you have your final answer, call SUBMIT("your answer here").
 
-Available tools in the REPL namespace:
-{tool_prompt}
-
 Built-in functions:
 - llm_query(prompt: str, ctx: str = "") -> str
   Call a sub-LM to process or analyze text. Useful for summarizing
   retrieved documents or extracting specific information.
 
+- llm_query_batch(prompts: list[str], ctxs: list[str] | None = None) -> list[str]
+  Run many llm_query calls concurrently; results come back in the same order.
+  A failed call yields a string starting with "Error:" in its slot. Prefer this
+  over a loop of llm_query() when mapping the same question over many chunks.
+
 - SUBMIT(answer: str)
   Call this when you have your final answer.
 
@@ -28,7 +31,88 @@ Strategy:
 1. First understand what the user is asking
 2. If you need specific files, use find_file() for fuzzy matching
 3. If you need conceptual search, use list_knowledge_bases() then search_docs()
-4. Process retrieved content with llm_query() if needed
+4. Process retrieved content with llm_query() or llm_query_batch() if needed
 5. SUBMIT your final answer
 
-Write code to solve the problem step by step. You will see the output of each code block before deciding your next step."""
+Write code to solve the problem step by step. You will see the output of each code block before deciding your next step. Several ```python blocks in one message run in order; execution stops at the first block that raises.
+
+The retrieval tools available to you are listed in the next message."""
+
+
+# Appended to the tools prompt for runs that may still recurse, so the static
+# prefix stays identical at every depth
+RLM_QUERY_PROMPT = """
+- rlm_query(question: str, ctx: str = "") -> str
+  Delegate a sub-problem to a sub-RLM: it gets its own REPL with `context` = ctx,
+  the same tools, and returns its SUBMITted answer. Use it when the sub-problem
+  needs tool calls or several steps; use llm_query for a single completion.
+
+- rlm_query_batch(questions: list[str], ctxs: list[str] | None = None) -> list[str]
+  Run several rlm_query calls concurrently; results come back in the same order.
+  A failed sub-run yields a string starting with "Error:" in its slot.
+"""
+
+
+def build_tools_prompt(tool_prompt: str) -> str:
+    """Per-user part: stable across a user's queries, so it extends the cached prefix."""
+    return f"Available tools in the REPL namespace:\n{tool_prompt}"
+
+
+def build_prefetch_note(results: list[dict], snippet_chars: int = 200) -> str:
+    """Summary of the prefetched search results for the first user message."""
+    if not results:
+        return "search_docs(query) was run ahead of time and found nothing; `prefetched` is an empty list."
+    lines = [
+        f"search_docs(query) was run ahead of time; its {len(results)} results are in the "
+        "`prefetched` variable (full hits, text up to 500 chars). Top results:"
+    ]
+    for i, hit in enumerate(results, 1):
+        if "error" in hit:
+            lines.append(f"[{i}] {hit['error']}")
+            continue
+        text = " ".join(str(hit.get("text", "")).split())
+        if len(text) > snippet_chars:
+            text = text[:snippet_chars] + "..."
+        lines.append(
+            f"[{i}] file_id={hit.get('file_id')} topic={hit.get('topic')!r} score={hit.get('score')}: {text}"
+        )
+    return "\n".join(lines)
+
+
+def build_query_prompt(
+    context: str,
+    query: str,
+    restored_names: list[str] | None = None,
+    prefetched: list[dict] | None = None,
+) -> str:
+    """Per-query part, always last so it never breaks the cached prefix."""
+    context_preview = context[:200] + "..." if len(context) > 200 else context
+    prompt = (
+        f"The `context` variable contains {len(context)} characters.\n"
+        f"Preview: {context_preview}\n\n"
+        f"Query: {query}"
+    )
+    if restored_names:
+        prompt += (
+            "\n\nVariables from earlier turns in this chat are still defined in the REPL: "
+            + ", ".join(sorted(restored_names))
+        )
+    if prefetched is not None:
+        prompt += "\n\n" + build_prefetch_note(prefetched)
+    return prompt
+
+
+def build_prompt_messages(
+    context: str,
+    tool_prompt: str,
+    query: str,
+    restored_names: list[str] | None = None,
+    prefetched: list[dict] | None = None,
+) -> list[dict]:
+    """Initial messages, ordered from most to least shared: static, per-user, per-query."""
+    return [
+        {"role": "system", "content": STATIC_SYSTEM_PROMPT},
+        {"role": "system", "content": build_tools_prompt(tool_prompt)},
+        {"role": "user", "content": build_query_prompt(context, query, restored_names, prefetched)},
+    ]
+
@@ -0,0 +1,191 @@
+"""Child-process side of the REPL pool.
+
+Kept free of app imports so spawned workers start quickly. The parent talks to
+a worker over a multiprocessing Pipe:
+
+    ("init", values, tool_names, restored) -> ("ok",)
+    ("exec", code, cpu_seconds)            -> ("call", name, args, kwargs)*  then  ("done", stdout, stderr, submitted)
+    ("snapshot", max_value_bytes)          -> ("snapshot", {name: pickled bytes})
+    ("reset",)                             -> ("ok",)
+    ("stop",)
+
+While code runs, every tool call is sent to the parent as ("call", ...) and the
+worker blocks until the parent answers ("ok", value) or ("error", message).
+
+The worker runs model-written code, so the parent reads its messages with
+`load_message`, which only rebuilds builtin values; a pickled object whose
+`__reduce__` names any other callable is rejected rather than run.
+"""
+import contextlib
+import io
+import pickle
+import resource
+import signal
+
+# Bounds the size of a single reply; the engine truncates further for the prompt
+MAX_OUTPUT_CHARS = 65536
+
+
+class CpuLimitExceeded(Exception):
+    pass
+
+
+class ToolError(Exception):
+    pass
+
+
+def _on_cpu_limit(signum, frame):
+    raise CpuLimitExceeded("execution exceeded its CPU time limit")
+
+
+def _apply_memory_limit(memory_mb: int) -> None:
+    if memory_mb <= 0:
+        return
+    limit = memory_mb * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+# Globals a worker message may reference; everything else in a message must be
+# a str, bytes, number, bool, None, list, tuple or dict, which need no lookup
+_MESSAGE_GLOBALS = {("builtins", name) for name in ("complex", "set", "frozenset", "bytearray")}
+
+
+class _MessageUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) in _MESSAGE_GLOBALS:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a REPL message")
+
+
+def load_message(data: bytes):
+    """Unpickle a message from a worker, refusing anything but builtin values."""
+    return _MessageUnpickler(io.BytesIO(data)).load()
+
+
+def _tool_proxy(conn, name: str):
+    def call(*args, **kwargs):
+        data = pickle.dumps(("call", name, args, kwargs), protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            load_message(data)
+        except pickle.UnpicklingError as e:
+            raise TypeError(f"{name}() arguments must be plain values (str, numbers, lists, dicts): {e}")
+        conn.send_bytes(data)
+        status, value = conn.recv()
+        if status == "error":
+            raise ToolError(value)
+        return value
+
+    call.__name__ = name
+    return call
+
+
+def restore_namespace(restored: dict[str, bytes]) -> dict:
+    """Unpickle variables kept from earlier turns, skipping any that no longer load."""
+    values = {}
+    for name, blob in restored.items():
+        try:
+            values[name] = pickle.loads(blob)
+        except Exception:
+            pass
+    return values
+
+
+def snapshot_namespace(namespace: dict, exclude: set[str], max_value_bytes: int) -> dict[str, bytes]:
+    """Pickle the variables the model created, for restoring in a later turn.
+
+    Tools, builtins and anything that can't be pickled (modules, functions
+    defined in the REPL, open handles) or is larger than `max_value_bytes`
+    are left out.
+    """
+    blobs = {}
+    for name, value in namespace.items():
+        if name.startswith("__") or name in exclude:
+            continue
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            continue
+        if len(blob) <= max_value_bytes:
+            blobs[name] = blob
+    return blobs
+
+
+def _new_namespace(conn, values: dict, tool_names: list[str], restored: dict[str, bytes], submitted: dict) -> dict:
+    def submit(answer):
+        submitted["value"] = str(answer)
+
+    namespace = {"__builtins__": __builtins__}
+    namespace.update(restore_namespace(restored))
+    namespace.update(values)
+    namespace.update({name: _tool_proxy(conn, name) for name in tool_names})
+    namespace["SUBMIT"] = submit
+    return namespace
+
+
+def _execute(namespace: dict, code: str, cpu_seconds: int) -> tuple[str, str]:
+    stdout_capture = io.StringIO()
+    stderr_capture = io.StringIO()
+
+    # RLIMIT_CPU counts the whole process, so the soft limit is set relative to
+    # what the worker has used so far
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if cpu_seconds > 0:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime) + cpu_seconds
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    try:
+        with contextlib.redirect_stdout(stdout_capture), contextlib.redirect_stderr(stderr_capture):
+            exec(code, namespace, namespace)
+    except BaseException as e:
+        # SystemExit and friends must not end the worker loop
+        stderr_capture.write(f"Error: {type(e).__name__}: {str(e)}")
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+    return stdout_capture.getvalue()[:MAX_OUTPUT_CHARS], stderr_capture.getvalue()[:MAX_OUTPUT_CHARS]
+
+
+def record_output(namespace: dict, stdout: str, stderr: str) -> None:
+    """Keep each execution's full output in `_repl_outputs`, if the run asked for it."""
+    outputs = namespace.get("_repl_outputs")
+    if isinstance(outputs, list):
+        outputs.append(stdout + stderr)
+
+
+def worker_main(conn, memory_mb: int) -> None:
+    _apply_memory_limit(memory_mb)
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    # Ctrl-C in the parent's terminal must not kill workers mid-run
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    namespace: dict = {}
+    reserved: set[str] = set()
+    submitted: dict = {"value": None}
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        op = message[0]
+        if op == "init":
+            submitted = {"value": None}
+            namespace = _new_namespace(conn, message[1], message[2], message[3], submitted)
+            reserved = set(message[1]) | set(message[2]) | {"SUBMIT"}
+            conn.send(("ok",))
+        elif op == "exec":
+            stdout, stderr = _execute(namespace, message[1], message[2])
+            record_output(namespace, stdout, stderr)
+            conn.send(("done", stdout, stderr, submitted["value"]))
+        elif op == "snapshot":
+            conn.send(("snapshot", snapshot_namespace(namespace, reserved, message[1])))
+        elif op == "reset":
+            namespace = {}
+            submitted = {"value": None}
+            conn.send(("ok",))
+        elif op == "stop":
+            return
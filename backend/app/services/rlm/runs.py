@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Awaitable, Callable
+
+from app.config import settings
+from app.services.rlm.budget import RLMBudget
+
+logger = logging.getLogger(__name__)
+
+# Event types that end a run, and the status each one leaves it in
+TERMINAL_EVENTS = {"answer": "completed", "error": "failed", "cancelled": "cancelled"}
+
+
+class Run:
+    """One RLM query executing as a server-side task, detached from any socket.
+
+    Durable events (repl_step, answer, ...) get a sequence number and are kept
+    in a bounded buffer, so a client that reconnects can replay everything
+    after the last sequence number it saw. Token deltas are live-only: they go
+    to current subscribers and are never buffered or numbered.
+    """
+
+    def __init__(self, session_id: str, budget: RLMBudget, buffer_size: int):
+        self.id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.budget = budget
+        self.task: asyncio.Task | None = None
+        self.status = "running"
+        self.events: deque[dict] = deque(maxlen=buffer_size)
+        self.last_seq = 0
+        self.finished_at: float | None = None
+        self._subscribers: set[asyncio.Queue] = set()
+        self._detach_timer: asyncio.TimerHandle | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.status != "running"
+
+    def emit(self, event: dict) -> dict:
+        """Record a durable event and deliver it to subscribers."""
+        if self.done:
+            return event
+        self.last_seq += 1
+        event = {**event, "run_id": self.id, "seq": self.last_seq}
+        self.events.append(event)
+        status = TERMINAL_EVENTS.get(event["type"])
+        if status:
+            self.status = status
+            self.finished_at = time.monotonic()
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+        return event
+
+    def emit_live(self, event: dict) -> None:
+        """Deliver a transient event (token deltas) to current subscribers only."""
+        event = {**event, "run_id": self.id}
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def subscribe(self, after_seq: int = 0) -> tuple[list[dict], asyncio.Queue | None, bool]:
+        """Buffered events after `after_seq`, a queue of live events and whether any were lost.
+
+        The queue is None once the run is done: the replay is then complete.
+        """
+        replay = [event for event in self.events if event["seq"] > after_seq]
+        oldest = self.events[0]["seq"] if self.events else self.last_seq + 1
+        gap = oldest > after_seq + 1
+        queue = None
+        if not self.done:
+            queue = asyncio.Queue()
+            self._subscribers.add(queue)
+            if self._detach_timer is not None:
+                self._detach_timer.cancel()
+                self._detach_timer = None
+        return replay, queue, gap
+
+    def unsubscribe(self, queue: asyncio.Queue) -> bool:
+        """Drop a subscriber; returns True if this left the running run with none."""
+        if queue not in self._subscribers:
+            return False
+        self._subscribers.discard(queue)
+        return not self._subscribers and not self.done
+
+
+class RunRegistry:
+    """Runs by id, at most one running per chat session.
+
+    A run whose last subscriber goes away keeps going for
+    `detach_grace_seconds` so the client can reconnect and resume, then is
+    cancelled. Finished runs stay resumable for `retention_seconds`.
+    """
+
+    def __init__(self, buffer_size: int, retention_seconds: float, detach_grace_seconds: float):
+        self.buffer_size = buffer_size
+        self.retention_seconds = retention_seconds
+        self.detach_grace_seconds = detach_grace_seconds
+        self._runs: dict[str, Run] = {}
+
+    def start(self, session_id: str, budget: RLMBudget, execute: Callable[[Run], Awaitable[None]]) -> Run:
+        self._prune()
+        run = Run(session_id, budget, self.buffer_size)
+        self._runs[run.id] = run
+        run.emit({"type": "run_started"})
+        run.task = asyncio.create_task(self._execute(run, execute))
+        return run
+
+    async def _execute(self, run: Run, execute: Callable[[Run], Awaitable[None]]) -> None:
+        try:
+            await execute(run)
+        except asyncio.CancelledError:
+            run.emit({"type": "cancelled", "reason": run.budget.cancel_reason or "cancelled"})
+            raise
+        except Exception as e:
+            logger.exception(f"Run {run.id} failed: {e}")
+            run.emit({"type": "error", "content": str(e)})
+        finally:
+            if not run.done:
+                run.emit({"type": "error", "content": "Run ended without an answer"})
+
+    def get(self, run_id: str) -> Run | None:
+        self._prune()
+        return self._runs.get(run_id)
+
+    def active_for_session(self, session_id: str) -> Run | None:
+        for run in self._runs.values():
+            if run.session_id == session_id and not run.done:
+                return run
+        return None
+
+    async def cancel(self, run: Run, reason: str) -> None:
+        """Stop a run and wait until its LLM calls and REPL worker are released."""
+        if run.done or run.task is None:
+            return
+        logger.info(f"Cancelling run {run.id}: {reason}")
+        # The budget reaches code the task cancellation can't interrupt (tools and
+        # llm_query called from synchronous REPL code)
+        run.budget.cancel(reason)
+        run.task.cancel()
+        await asyncio.wait({run.task})
+        # A task cancelled before it started never reached its own handler
+        run.emit({"type": "cancelled", "reason": reason})
+
+    def detach(self, run: Run, queue: asyncio.Queue) -> None:
+        """Unsubscribe; cancel the run after the grace period if nobody re-attaches."""
+        if not run.unsubscribe(queue):
+            return
+        if self.detach_grace_seconds <= 0:
+            asyncio.ensure_future(self.cancel(run, "client disconnected"))
+            return
+        run._detach_timer = asyncio.get_running_loop().call_later(
+            self.detach_grace_seconds,
+            lambda: asyncio.ensure_future(self.cancel(run, "client disconnected")),
+        )
+
+    def clear(self) -> None:
+        for run in self._runs.values():
+            if run.task is not None and not run.task.done() and not run.task.get_loop().is_closed():
+                run.task.cancel()
+        self._runs.clear()
+
+    def stats(self) -> dict:
+        running = sum(1 for run in self._runs.values() if not run.done)
+        return {"running": running, "retained": len(self._runs) - running}
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.retention_seconds
+        for run_id in [
+            run_id for run_id, run in self._runs.items()
+            if run.finished_at is not None and run.finished_at < cutoff
+        ]:
+            del self._runs[run_id]
+
+
+run_registry = RunRegistry(
+    buffer_size=settings.run_event_buffer,
+    retention_seconds=settings.run_retention_seconds,
+    detach_grace_seconds=settings.run_detach_grace_seconds,
+)
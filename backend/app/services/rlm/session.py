@@ -1,12 +1,17 @@
 from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Awaitable, Callable
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import settings
 from app.repositories.knowledge_base_repository import KnowledgeBaseRepository
+from app.services.answer_cache import answer_fingerprint
 from app.services.embedding import embed_text
 from app.services.milvus_service import MilvusService
+from app.services.rlm.namespace import NamespaceStore
 from app.services.rlm.tools import create_user_tools
+from app.services.topic_router import topic_router_cache
 
 
 @dataclass
@@ -14,6 +19,10 @@ class RLMSession:
     user_id: str
     tools: dict
     tool_descriptions: str
+    # Retrieval for the raw query, run before the first iteration (see RLMEngine.run)
+    prefetch: Callable[..., Awaitable[list[dict]]] | None = None
+    # Answer-cache fingerprint of the user's KBs when the session was built
+    answer_fingerprint: tuple = ()
     created_at: datetime = field(default_factory=datetime.utcnow)
     last_used: datetime = field(default_factory=datetime.utcnow)
 
@@ -21,6 +30,13 @@ class RLMSession:
 class SessionManager:
     def __init__(self):
         self.sessions: dict[str, RLMSession] = {}
+        # REPL variables kept between turns, keyed by chat session id
+        self.namespaces = NamespaceStore(
+            max_bytes=settings.repl_namespace_max_bytes,
+            max_value_bytes=settings.repl_namespace_max_value_bytes,
+            ttl_seconds=settings.repl_namespace_ttl_seconds,
+            max_sessions=settings.repl_namespace_max_sessions,
+        )
 
     async def get_or_create(
         self,
@@ -33,18 +49,26 @@ class SessionManager:
         kb_repo = KnowledgeBaseRepository(db)
         kbs = await kb_repo.find_by_user(user_id)
 
-        tools, descriptions = create_user_tools(
+        # The router is cached across requests and only rebuilt when a KB changes
+        router = None
+        if settings.topic_router_enabled and len(kbs) > 1:
+            router = await topic_router_cache.get(user_id, kbs, db, embed_text)
+
+        tools, descriptions, prefetch = create_user_tools(
             user_id=user_id,
             db_session=db,
             milvus_client=milvus,
             embed_fn=embed_text,
             knowledge_bases=kbs,
+            router=router,
         )
 
         session = RLMSession(
             user_id=user_id,
             tools=tools,
             tool_descriptions=descriptions,
+            prefetch=prefetch,
+            answer_fingerprint=answer_fingerprint(user_id, kbs),
         )
         self.sessions[user_id] = session
         return session
@@ -52,6 +76,7 @@ class SessionManager:
     def invalidate(self, user_id: str):
         """Call when user's KBs change (new upload, new KB, etc.)"""
         self.sessions.pop(user_id, None)
+        topic_router_cache.invalidate(user_id)
 
 
 session_manager = SessionManager()
@@ -0,0 +1,62 @@
+FENCE = "```"
+
+
+class CodeFenceTracker:
+    """Splits streamed completion text into prose and code segments as tokens arrive.
+
+    Fences often arrive split across tokens ("``" then "`python\n"), so a
+    trailing partial fence or an unfinished fence header is held back until
+    the next delta decides what it is. `feed` returns (kind, content) pairs:
+    "text" and "code" carry content; "code_start" carries the fence language
+    and "code_end" marks the closing fence.
+    """
+
+    def __init__(self):
+        self.in_code = False
+        self._pending = ""
+
+    def feed(self, delta: str) -> list[tuple[str, str]]:
+        text = self._pending + delta
+        self._pending = ""
+        segments: list[tuple[str, str]] = []
+
+        while text:
+            idx = text.find(FENCE)
+            if idx == -1:
+                # Hold back up to two trailing backticks: they may open a fence
+                held = len(text) - len(text.rstrip("`"))
+                if held:
+                    self._pending = text[-held:]
+                    text = text[:-held]
+                if text:
+                    segments.append((self._kind, text))
+                break
+
+            if idx:
+                segments.append((self._kind, text[:idx]))
+            rest = text[idx + len(FENCE):]
+            if self.in_code:
+                segments.append(("code_end", ""))
+                self.in_code = False
+                text = rest
+                continue
+
+            newline = rest.find("\n")
+            if newline == -1:
+                # Language tag not finished yet
+                self._pending = text[idx:]
+                break
+            segments.append(("code_start", rest[:newline].strip()))
+            self.in_code = True
+            text = rest[newline + 1:]
+
+        return segments
+
+    def flush(self) -> list[tuple[str, str]]:
+        """Emit whatever is still held back once the stream ends."""
+        pending, self._pending = self._pending, ""
+        return [(self._kind, pending)] if pending else []
+
+    @property
+    def _kind(self) -> str:
+        return "code" if self.in_code else "text"
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable
+
+from app.config import settings
+from app.database import async_session
+from app.repositories.sub_lm_cache_repository import SubLMCacheRepository
+
+logger = logging.getLogger(__name__)
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def sub_lm_cache_key(sub_model: str, prompt: str, ctx: str, params: dict) -> str:
+    """Content address of one sub-LM call: (sub_model, prompt hash, ctx hash, params)."""
+    payload = json.dumps([sub_model, _sha256(prompt), _sha256(ctx), params], sort_keys=True)
+    return _sha256(payload)
+
+
+class SubLMCache:
+    """Memoized llm_query responses: an in-memory LRU in front of a Postgres table.
+
+    Both tiers expire entries after `ttl_seconds`. A database hit is promoted
+    into memory. The database tier is best-effort: failures are logged and
+    the call simply goes to the sub-model.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        ttl_seconds: float = 7 * 24 * 3600.0,
+        session_factory: Callable | None = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Each lookup opens its own session: llm_query_batch runs lookups concurrently
+        self.session_factory = session_factory
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> str | None:
+        value = self._get_memory(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        value = await self._get_db(key)
+        if value is not None:
+            self.db_hits += 1
+            self._put_memory(key, value)
+            return value
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, sub_model: str, response: str) -> None:
+        self._put_memory(key, response)
+        if self.session_factory is None:
+            return
+        try:
+            async with self.session_factory() as db:
+                await SubLMCacheRepository(db).put(key, sub_model, response)
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Sub-LM cache write failed: {e}")
+
+    async def purge_expired(self) -> int:
+        """Delete expired rows from the database tier; returns the number removed."""
+        if self.session_factory is None:
+            return 0
+        async with self.session_factory() as db:
+            removed = await SubLMCacheRepository(db).delete_older_than(self._cutoff())
+            await db.commit()
+        return removed
+
+    def clear(self) -> None:
+        """Empty the in-memory tier and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.memory_hits = self.db_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+
+    def _get_memory(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _put_memory(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def _get_db(self, key: str) -> str | None:
+        if self.session_factory is None:
+            return None
+        try:
+            async with self.session_factory() as db:
+                entry = await SubLMCacheRepository(db).find_fresh(key, self._cutoff())
+                return entry.response if entry is not None else None
+        except Exception as e:
+            logger.warning(f"Sub-LM cache lookup failed: {e}")
+            return None
+
+
+sub_lm_cache = SubLMCache(
+    max_entries=settings.sub_lm_cache_max_entries,
+    ttl_seconds=settings.sub_lm_cache_ttl_seconds,
+    session_factory=async_session if settings.sub_lm_cache_persist else None,
+)
@@ -1,11 +1,22 @@
 import asyncio
+import functools
+import json
+import logging
 from uuid import UUID
 
 import nest_asyncio
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import settings
+from app.repositories.chunk_topic_repository import ChunkTopicRepository
+from app.repositories.topic_repository import TopicRepository
 from app.services.milvus_service import MilvusService
+from app.services.search_cache import SearchCache, search_cache
+from app.services.topic_router import TopicRouter
+from app.services.tracing import span, traced
+
+logger = logging.getLogger(__name__)
 
 _nest_applied = False
 
@@ -33,20 +44,47 @@ def _run_async(coro):
         return asyncio.run(coro)
 
 
+def sync_tool(async_fn):
+    """Sync REPL entry point for an async tool.
+
+    Code exec()'d on the event loop thread calls it through _run_async; the
+    coroutine function stays reachable as `async_impl`, so callers already on
+    the loop (the process pool relaying a worker's tool call) await it instead.
+    """
+    @functools.wraps(async_fn)
+    def call(*args, **kwargs):
+        return _run_async(async_fn(*args, **kwargs))
+
+    call.async_impl = async_fn
+    return call
+
+
 def create_user_tools(
     user_id: str,
     db_session: AsyncSession,
     milvus_client: MilvusService,
     embed_fn,
     knowledge_bases: list,
+    cache: SearchCache | None = None,
+    router: TopicRouter | None = None,
 ):
-    """Factory that returns REPL-safe tool functions with credentials bound in closures."""
+    """Factory that returns REPL-safe tool functions with credentials bound in closures.
+
+    Returns the tools, their prompt descriptions and an async `prefetch(query,
+    top_k)` the engine can run before the model's first turn.
+    """
     _user_id = user_id
     _db = db_session
+    # One AsyncSession can't run two statements at once, and rlm_query_batch
+    # runs sibling sub-runs (sharing these tools) concurrently
+    _db_lock = asyncio.Lock()
     _milvus = milvus_client
     _embed = embed_fn
+    _cache = cache if cache is not None else search_cache
+    _router = router
     _kb_map = {kb.name: kb for kb in knowledge_bases}
     _kb_collections = {kb.name: kb.milvus_collection for kb in knowledge_bases}
+    _kb_by_collection = {kb.milvus_collection: kb for kb in knowledge_bases}
 
     def list_knowledge_bases() -> list[dict]:
         """List all your knowledge bases and their descriptions."""
@@ -59,23 +97,83 @@ def create_user_tools(
             for kb in knowledge_bases
         ]
 
-    def search_docs(
+    async def list_topics(knowledge_base: str = "all") -> list[dict]:
+        """List the topic hierarchy: broad level-2 topics with their level-1 subtopics."""
+        if knowledge_base == "all":
+            kbs = knowledge_bases
+        else:
+            kbs = [_kb_map[knowledge_base]] if knowledge_base in _kb_map else []
+        out = []
+        for kb in kbs:
+            async with _db_lock:
+                with span("postgres.query", op="find_topics"):
+                    topics = await TopicRepository(_db).find_by_knowledge_base(kb.id)
+            parents = {t.id: t for t in topics if t.topic_level == 2}
+            children: dict = {}
+            for t in sorted(topics, key=lambda t: -(t.doc_count or 0)):
+                if t.topic_level == 1:
+                    children.setdefault(t.parent_topic_id, []).append(
+                        {"label": t.topic_label, "doc_count": t.doc_count}
+                    )
+            for parent_id, subtopics in children.items():
+                parent = parents.get(parent_id)
+                out.append({
+                    "knowledge_base": kb.name,
+                    "label": parent.topic_label if parent else None,
+                    "doc_count": parent.doc_count if parent else sum(s["doc_count"] or 0 for s in subtopics),
+                    "subtopics": subtopics,
+                })
+        return out
+
+    async def _topic_chunk_ids(coll: str, labels: list[str], topic_level: int | None) -> list[str] | None:
+        """Chunk ids in any of `labels` for this collection, or None if unavailable."""
+        kb = _kb_by_collection.get(coll)
+        if kb is None:
+            return None
+        try:
+            async with _db_lock:
+                with span("postgres.query", op="topic_chunk_ids"):
+                    return await ChunkTopicRepository(_db).find_ids_by_labels(
+                        kb.id, labels, limit=settings.topic_filter_max_ids + 1, level=topic_level
+                    )
+        except Exception as e:
+            logger.warning(f"Topic lookup failed for {coll}: {e}")
+            return None
+
+    async def _chunk_labels(coll: str, chunk_ids: list[str]) -> dict[str, tuple[str, str | None]]:
+        kb = _kb_by_collection.get(coll)
+        if kb is None or not chunk_ids:
+            return {}
+        try:
+            async with _db_lock:
+                with span("postgres.query", op="chunk_labels"):
+                    return await ChunkTopicRepository(_db).find_label_paths(kb.id, chunk_ids)
+        except Exception as e:
+            logger.warning(f"Topic label lookup failed for {coll}: {e}")
+            return {}
+
+    def _legacy_topic_clause(labels: list[str], topic_level: int | None) -> str:
+        # Pre-side-table filter on the Milvus topic fields
+        def field_clause(field_name):
+            if len(labels) == 1:
+                return f'{field_name} == "{labels[0]}"'
+            return f"{field_name} in {json.dumps(labels)}"
+
+        if topic_level == 1:
+            return field_clause("topic_l1")
+        if topic_level == 2:
+            return field_clause("topic_l2")
+        return f"({field_clause('topic_l1')} or {field_clause('topic_l2')})"
+
+    async def _search(
         query: str,
         knowledge_base: str = "all",
         topic_filter: str | None = None,
         top_k: int = 5,
+        topic_level: int | None = None,
     ) -> list[dict]:
-        """Semantic search across your documents. Returns matching text chunks."""
         top_k = min(top_k, 20)
-
-        filter_parts = [f'user_id == "{_user_id}"']
-        if topic_filter:
-            filter_parts.append(
-                f'(topic_l1 == "{topic_filter}" or topic_l2 == "{topic_filter}")'
-            )
-        filter_expr = " and ".join(filter_parts)
-
-        query_vector = _run_async(_embed(query))
+        user_clause = f'user_id == "{_user_id}"'
 
         collections = (
             list(_kb_collections.values())
@@ -83,87 +181,186 @@ def create_user_tools(
             else [_kb_collections.get(knowledge_base, knowledge_base)]
         )
 
+        # Embed lazily: a query fully served from cache needs no embedding call
+        query_vector = None
+
+        async def get_query_vector():
+            nonlocal query_vector
+            if query_vector is None:
+                query_vector = await _embed(query)
+            return query_vector
+
+        async def search_collection(coll: str, labels: list[str] | None, level: int | None) -> list[dict]:
+            # The user filter is part of the key: the cache is shared by every user
+            cache_key = (user_clause, query, tuple(labels) if labels else None, level, top_k)
+            generation = _cache.generation(coll)
+            cached = _cache.get(coll, cache_key)
+            if cached is not None:
+                return cached
+
+            # Topic assignments live in Postgres (chunk_topics). Small topics are
+            # pushed down to Milvus as an id filter; large ones are post-filtered.
+            filter_expr = user_clause
+            limit = top_k
+            post_filter = False
+            if labels:
+                topic_ids = await _topic_chunk_ids(coll, labels, level)
+                if topic_ids is None:
+                    filter_expr += " and " + _legacy_topic_clause(labels, level)
+                elif len(topic_ids) <= settings.topic_filter_max_ids:
+                    filter_expr += f" and id in {json.dumps(topic_ids)}"
+                else:
+                    limit = top_k * settings.topic_filter_oversample
+                    post_filter = True
+
+            vector = await get_query_vector()
+            results = await asyncio.to_thread(
+                _milvus.search,
+                collection_name=coll,
+                query_vector=vector,
+                top_k=limit,
+                filter_expr=filter_expr,
+                output_fields=["text", "file_id", "topic_l1", "topic_l2", "topic_keywords"],
+            )
+            chunk_labels = await _chunk_labels(coll, [h["id"] for h in results if h.get("id")])
+            hits = []
+            for hit in results:
+                topic, topic_l2 = chunk_labels.get(hit.get("id"), (hit.get("topic_l1", ""), hit.get("topic_l2")))
+                hits.append({
+                    "text": hit["text"][:500],
+                    "file_id": hit["file_id"],
+                    "topic": topic,
+                    "topic_l2": topic_l2,
+                    "score": hit.get("score", 0),
+                    "collection": coll,
+                })
+            if post_filter:
+                hits = [
+                    h for h in hits
+                    if (level != 2 and h["topic"] in labels)
+                    or (level != 1 and h["topic_l2"] in labels)
+                ][:top_k]
+            _cache.put(coll, cache_key, hits, generation=generation)
+            return hits
+
+        # (collection, topic labels or None, topic level, routed) per search
+        if topic_filter:
+            targets = [(coll, [topic_filter], topic_level, False) for coll in collections]
+        elif knowledge_base == "all" and _router is not None and len(collections) > 1:
+            # Unscoped search: the router narrows it to the closest collections
+            # and, within them, to the closest level-1 topics.
+            routes = _router.route(
+                await get_query_vector(),
+                max_collections=settings.topic_router_max_collections,
+                max_topics=settings.topic_router_max_topics,
+                min_similarity=settings.topic_router_min_similarity,
+            )
+            targets = [(r.collection, r.topic_labels, 1 if r.topic_labels else None, True) for r in routes]
+        else:
+            targets = [(coll, None, None, False) for coll in collections]
+
         all_results = []
-        for coll in collections:
+        for coll, labels, level, routed in targets:
             try:
-                results = _milvus.search(
-                    collection_name=coll,
-                    query_vector=query_vector,
-                    top_k=top_k,
-                    filter_expr=filter_expr,
-                    output_fields=["text", "file_id", "topic_l1", "topic_keywords"],
-                )
-                for hit in results:
-                    all_results.append({
-                        "text": hit["text"][:500],
-                        "file_id": hit["file_id"],
-                        "topic": hit.get("topic_l1", ""),
-                        "score": hit.get("score", 0),
-                        "collection": coll,
-                    })
+                hits = await search_collection(coll, labels, level)
+                if routed and labels:
+                    # Outliers and chunks not yet assigned a topic carry no label,
+                    # so the whole collection's best hits are ranked alongside
+                    seen = {(h["file_id"], h["text"]) for h in hits}
+                    hits += [
+                        h for h in await search_collection(coll, None, None)
+                        if (h["file_id"], h["text"]) not in seen
+                    ]
+                all_results.extend(hits)
             except Exception as e:
                 all_results.append({"error": f"Search failed on {coll}: {str(e)}"})
 
         all_results.sort(key=lambda r: r.get("score", 0), reverse=True)
         return all_results[:top_k]
 
-    def find_file(query: str, file_type: str | None = None, top_k: int = 5) -> list[dict]:
+    async def search_docs(
+        query: str,
+        knowledge_base: str = "all",
+        topic_filter: str | None = None,
+        top_k: int = 5,
+        topic_level: int | None = None,
+    ) -> list[dict]:
+        """Semantic search across your documents. Returns matching text chunks.
+
+        `topic_filter` matches a level-1 or level-2 topic label; `topic_level`
+        (1 or 2) restricts the match to one level.
+        """
+        return await _search(query, knowledge_base, topic_filter, top_k, topic_level)
+
+    async def prefetch(query: str, top_k: int = 5) -> list[dict]:
+        """search_docs(query) for the raw user query, run by the engine before its first iteration."""
+        with span("tool.prefetch", top_k=top_k) as prefetch_span:
+            results = await _search(query, top_k=top_k)
+            prefetch_span.set(hits=len(results))
+            return results
+
+    async def find_file(query: str, file_type: str | None = None, top_k: int = 5) -> list[dict]:
         """Find specific files by name using fuzzy matching."""
+        type_clause = "AND f.file_type = :file_type" if file_type else ""
+        params = {"user_id": str(_user_id), "query": query, "top_k": top_k}
+        if file_type:
+            params["file_type"] = file_type
 
-        async def _query():
-            type_clause = "AND f.file_type = :file_type" if file_type else ""
-            params = {"user_id": str(_user_id), "query": query, "top_k": top_k}
-            if file_type:
-                params["file_type"] = file_type
-
-            sql = f"""
-                SELECT f.id, f.filename, f.title, f.file_type,
-                       LEFT(f.content, 200) as content_preview
-                FROM files f
-                WHERE f.user_id = :user_id {type_clause}
-                ORDER BY f.filename
-                LIMIT :top_k
-            """
-            result = await _db.execute(text(sql), params)
+        sql = f"""
+            SELECT f.id, f.filename, f.title, f.file_type,
+                   LEFT(f.content, 200) as content_preview
+            FROM files f
+            WHERE f.user_id = :user_id {type_clause}
+            ORDER BY f.filename
+            LIMIT :top_k
+        """
+        async with _db_lock:
+            with span("postgres.query", op="find_file"):
+                result = await _db.execute(text(sql), params)
             return [dict(r._mapping) for r in result.fetchall()]
 
-        return _run_async(_query())
-
-    def get_file(file_id: str) -> dict:
+    async def get_file(file_id: str) -> dict:
         """Retrieve the full text content of a file by its ID."""
-
-        async def _query():
-            result = await _db.execute(
-                text("SELECT id, filename, title, content, metadata FROM files WHERE id = :id AND user_id = :uid"),
-                {"id": file_id, "uid": str(_user_id)},
-            )
+        async with _db_lock:
+            with span("postgres.query", op="get_file"):
+                result = await _db.execute(
+                    text("SELECT id, filename, title, content, metadata FROM files WHERE id = :id AND user_id = :uid"),
+                    {"id": file_id, "uid": str(_user_id)},
+                )
             row = result.fetchone()
-            if not row:
-                return {"error": "File not found or access denied"}
-            return {
-                "file_id": str(row.id),
-                "filename": row.filename,
-                "title": row.title,
-                "content": row.content,
-                "metadata": row.metadata,
-            }
-
-        return _run_async(_query())
+        if not row:
+            return {"error": "File not found or access denied"}
+        return {
+            "file_id": str(row.id),
+            "filename": row.filename,
+            "title": row.title,
+            "content": row.content,
+            "metadata": row.metadata,
+        }
 
     tools = {
-        "list_knowledge_bases": list_knowledge_bases,
-        "search_docs": search_docs,
-        "find_file": find_file,
-        "get_file": get_file,
+        name: traced(f"tool.{name}")(fn)
+        for name, fn in {
+            "list_knowledge_bases": list_knowledge_bases,
+            "list_topics": sync_tool(list_topics),
+            "search_docs": sync_tool(search_docs),
+            "find_file": sync_tool(find_file),
+            "get_file": sync_tool(get_file),
+        }.items()
     }
 
     tool_descriptions = """
 - list_knowledge_bases() -> list[dict]
   List all available knowledge bases with their descriptions.
 
-- search_docs(query: str, knowledge_base: str = "all", topic_filter: str = None, top_k: int = 5) -> list[dict]
+- list_topics(knowledge_base: str = "all") -> list[dict]
+  Topic hierarchy per knowledge base: broad topics (label, doc_count) with their subtopics.
+  Use it to pick a topic_filter before searching a large knowledge base.
+
+- search_docs(query: str, knowledge_base: str = "all", topic_filter: str = None, top_k: int = 5, topic_level: int = None) -> list[dict]
   Semantic search across document chunks. Use for conceptual queries.
-  Returns: text snippet, file_id, topic, relevance score.
+  topic_filter narrows the search to one topic or subtopic label; topic_level=1 or 2 restricts it to subtopics or broad topics.
+  Returns: text snippet, file_id, topic, topic_l2 (broad topic), relevance score.
 
 - find_file(query: str, file_type: str = None, top_k: int = 5) -> list[dict]
   Fuzzy filename/title matching. Use when looking for a SPECIFIC document by name.
@@ -173,4 +370,4 @@ def create_user_tools(
   Retrieve the full text of a file by its ID.
 """
 
-    return tools, tool_descriptions
+    return tools, tool_descriptions, prefetch
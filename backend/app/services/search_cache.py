@@ -0,0 +1,92 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from app.config import settings
+
+
+class SearchCache:
+    """Bounded, TTL'd cache for per-collection search results.
+
+    Every collection has a generation counter that is part of each cache key.
+    Writers (ingest, file/KB deletion, clustering) call ``invalidate()`` to bump
+    it, which makes all earlier results for that collection unreachable.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def generation(self, collection: str) -> int:
+        return self._generations.get(collection, 0)
+
+    def invalidate(self, collection: str) -> int:
+        """Bump the collection's generation and drop its cached results."""
+        with self._lock:
+            gen = self._generations.get(collection, 0) + 1
+            self._generations[collection] = gen
+            for key in [k for k in self._entries if k[0] == collection]:
+                del self._entries[key]
+            return gen
+
+    def get(self, collection: str, key: Hashable) -> Any | None:
+        full_key = (collection, self.generation(collection), key)
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[full_key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(full_key)
+            self.hits += 1
+        # Callers (REPL code) may mutate results, so never hand out the cached object
+        return copy.deepcopy(value)
+
+    def put(self, collection: str, key: Hashable, value: Any, generation: int | None = None) -> None:
+        """Store `value`; pass the `generation` read before computing it so a
+        result that raced an invalidation is dropped instead of cached."""
+        with self._lock:
+            current = self.generation(collection)
+            if generation is not None and generation != current:
+                return
+            full_key = (collection, current, key)
+            self._entries[full_key] = (time.monotonic(), copy.deepcopy(value))
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+search_cache = SearchCache(
+    max_entries=settings.search_cache_max_entries,
+    ttl_seconds=settings.search_cache_ttl_seconds,
+)
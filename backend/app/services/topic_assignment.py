@@ -0,0 +1,99 @@
+import numpy as np
+
+from app.config import settings
+from app.models import KnowledgeBase
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """L2-normalize each row so dot products are cosine similarities."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def compute_centroids(embeddings, labels, topic_ids) -> dict[int, list[float]]:
+    """Unit-length mean direction of each topic's member embeddings."""
+    unit = normalize_rows(embeddings)
+    labels = np.asarray(labels)
+    centroids = {}
+    for topic_id in topic_ids:
+        members = unit[labels == topic_id]
+        if len(members):
+            centroids[topic_id] = normalize_rows(members.mean(axis=0, keepdims=True))[0].tolist()
+    return centroids
+
+
+def assign_to_centroids(
+    embeddings,
+    centroid_ids: list[int],
+    centroids,
+    min_similarity: float,
+) -> tuple[list[int | None], np.ndarray]:
+    """Nearest-centroid assignment by cosine similarity, vectorized over all rows.
+
+    Returns (topic id or None per row, best similarity per row). Rows whose best
+    similarity is below `min_similarity` are left unassigned.
+    """
+    sims = normalize_rows(embeddings) @ normalize_rows(centroids).T
+    best = sims.argmax(axis=1)
+    best_sims = sims[np.arange(len(best)), best]
+    assigned = [
+        centroid_ids[idx] if score >= min_similarity else None
+        for idx, score in zip(best, best_sims)
+    ]
+    return assigned, best_sims
+
+
+def merge_centroids(
+    centroids,
+    weights,
+    n_parents: int,
+) -> tuple[list[int], np.ndarray]:
+    """Agglomerative (centroid-linkage) merge of topic centroids into `n_parents` groups.
+
+    Works on the k fitted centroids only (k is in the tens to hundreds), so it
+    never touches chunk embeddings. Merged centroids are the weight-averaged
+    member directions. Returns (parent index per input row, parent centroids).
+    """
+    unit = normalize_rows(centroids)
+    k = len(unit)
+    n_parents = max(1, min(n_parents, k))
+    sums = unit * np.asarray(weights, dtype=np.float32)[:, None]
+    members = [[i] for i in range(k)]
+    alive = list(range(k))
+
+    sims = unit @ unit.T
+    np.fill_diagonal(sims, -np.inf)
+    while len(alive) > n_parents:
+        sub = sims[np.ix_(alive, alive)]
+        a, b = np.unravel_index(np.argmax(sub), sub.shape)
+        keep, drop = alive[min(a, b)], alive[max(a, b)]
+        members[keep].extend(members[drop])
+        sums[keep] += sums[drop]
+        alive.remove(drop)
+        # Only the merged group's row changes; every other pair keeps its similarity
+        merged = normalize_rows(sums[keep:keep + 1])[0]
+        row = normalize_rows(sums[alive]) @ merged
+        sims[keep, alive] = row
+        sims[alive, keep] = row
+        sims[keep, keep] = -np.inf
+
+    parent_of = [0] * k
+    for parent_idx, group in enumerate(alive):
+        for child in members[group]:
+            parent_of[child] = parent_idx
+    return parent_of, normalize_rows(sums[alive])
+
+
+def refit_reason(kb: KnowledgeBase) -> str | None:
+    """Why the KB's topic model should be refit, or None if incremental assignment is still fine."""
+    clustered = kb.clustered_chunk_count or 0
+    new = kb.new_chunk_count or 0
+    if not clustered or new < settings.topic_refit_min_new_chunks:
+        return None
+    if (kb.drifted_chunk_count or 0) / new >= settings.topic_refit_drift_ratio:
+        return "drift"
+    if new / clustered >= settings.topic_refit_new_ratio:
+        return "volume"
+    return None
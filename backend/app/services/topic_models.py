@@ -0,0 +1,99 @@
+import json
+import logging
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Callable
+from uuid import UUID
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model.pkl"
+REDUCED_FILE = "reduced_embeddings.npy"
+IDS_FILE = "chunk_ids.json"
+
+
+def _load_bertopic(path: str) -> Any:
+    from bertopic import BERTopic
+
+    return BERTopic.load(path)
+
+
+class TopicModelStore:
+    """Fitted topic models per knowledge base on local disk.
+
+    Each KB directory holds the pickled BERTopic model (which keeps the fitted
+    UMAP and HDBSCAN, so `transform` works on new data) plus the reduced
+    embeddings of the chunks it was fit on, keyed by chunk id. Models load
+    lazily and are cached per process; a newer file on disk (e.g. written by
+    another worker) replaces the cached copy.
+    """
+
+    def __init__(self, root: str, loader: Callable[[str], Any] = _load_bertopic):
+        self.root = Path(root)
+        self._loader = loader
+        self._cache: dict[UUID, tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, knowledge_base_id: UUID) -> Path:
+        return self.root / str(knowledge_base_id)
+
+    def exists(self, knowledge_base_id: UUID) -> bool:
+        return (self.path_for(knowledge_base_id) / MODEL_FILE).exists()
+
+    def save(
+        self,
+        knowledge_base_id: UUID,
+        model: Any,
+        chunk_ids: list[str],
+        reduced_embeddings: np.ndarray,
+    ) -> None:
+        """Write to a temp dir then swap it in, so readers never see a partial model."""
+        final = self.path_for(knowledge_base_id)
+        tmp = final.with_name(final.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        model.save(str(tmp / MODEL_FILE), serialization="pickle")
+        np.save(tmp / REDUCED_FILE, np.asarray(reduced_embeddings, dtype=np.float32))
+        (tmp / IDS_FILE).write_text(json.dumps(chunk_ids))
+
+        shutil.rmtree(final, ignore_errors=True)
+        tmp.rename(final)
+        with self._lock:
+            self._cache[knowledge_base_id] = ((final / MODEL_FILE).stat().st_mtime, model)
+
+    def load(self, knowledge_base_id: UUID) -> Any | None:
+        model_path = self.path_for(knowledge_base_id) / MODEL_FILE
+        if not model_path.exists():
+            return None
+        mtime = model_path.stat().st_mtime
+        with self._lock:
+            cached = self._cache.get(knowledge_base_id)
+            if cached and cached[0] == mtime:
+                return cached[1]
+        model = self._loader(str(model_path))
+        with self._lock:
+            self._cache[knowledge_base_id] = (mtime, model)
+        return model
+
+    def load_reduced_embeddings(self, knowledge_base_id: UUID) -> dict[str, np.ndarray]:
+        """Chunk id -> reduced embedding from the last fit (empty if none saved)."""
+        path = self.path_for(knowledge_base_id)
+        if not (path / REDUCED_FILE).exists():
+            return {}
+        reduced = np.load(path / REDUCED_FILE)
+        chunk_ids = json.loads((path / IDS_FILE).read_text())
+        return dict(zip(chunk_ids, reduced))
+
+    def delete(self, knowledge_base_id: UUID) -> None:
+        with self._lock:
+            self._cache.pop(knowledge_base_id, None)
+        shutil.rmtree(self.path_for(knowledge_base_id), ignore_errors=True)
+
+
+topic_model_store = TopicModelStore(settings.topic_model_dir)
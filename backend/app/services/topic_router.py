@@ -0,0 +1,179 @@
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from uuid import UUID
+
+import numpy as np
+
+from app.config import settings
+from app.models import KnowledgeBase
+from app.repositories.topic_repository import TopicRepository
+from app.services.search_cache import search_cache
+from app.services.topic_assignment import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RouteTarget:
+    collection: str
+    score: float | None
+    # Level-1 topic labels to restrict the search to; None searches the whole collection
+    topic_labels: list[str] | None = None
+
+
+@dataclass
+class _RouterEntry:
+    collection: str
+    description_vector: list[float] | None
+    topic_labels: list[str] = field(default_factory=list)
+    topic_centroids: list[list[float]] = field(default_factory=list)
+
+
+class TopicRouter:
+    """In-memory router over a user's KB description embeddings and topic centroids.
+
+    All topic centroids are stacked into one matrix, so routing a query is a
+    single matrix-vector product however many KBs and topics the user has.
+    """
+
+    def __init__(self, entries: list[_RouterEntry]):
+        self.collections = [e.collection for e in entries]
+        self._has_signal = [bool(e.description_vector or e.topic_centroids) for e in entries]
+
+        desc_rows = [(i, e.description_vector) for i, e in enumerate(entries) if e.description_vector]
+        self._desc_owner = np.array([i for i, _ in desc_rows], dtype=int)
+        self._desc_matrix = normalize_rows([v for _, v in desc_rows]) if desc_rows else None
+
+        self._topic_owner = np.array(
+            [i for i, e in enumerate(entries) for _ in e.topic_centroids], dtype=int
+        )
+        self._topic_labels = [label for e in entries for label in e.topic_labels]
+        centroids = [c for e in entries for c in e.topic_centroids]
+        self._topic_matrix = normalize_rows(centroids) if centroids else None
+
+    def route(
+        self,
+        query_vector: list[float],
+        max_collections: int,
+        max_topics: int,
+        min_similarity: float,
+    ) -> list[RouteTarget]:
+        """Pick the collections (and topics within them) most similar to the query.
+
+        A collection scores the best of its description and topic similarities.
+        Collections with nothing to score (no description, never clustered) are
+        always searched in full so routing never hides them.
+        """
+        query = normalize_rows([query_vector])[0]
+        scores = np.full(len(self.collections), -np.inf)
+        if self._desc_matrix is not None:
+            np.maximum.at(scores, self._desc_owner, self._desc_matrix @ query)
+        topic_sims = None
+        if self._topic_matrix is not None:
+            topic_sims = self._topic_matrix @ query
+            np.maximum.at(scores, self._topic_owner, topic_sims)
+
+        scored = sorted(
+            (i for i, has in enumerate(self._has_signal) if has),
+            key=lambda i: scores[i],
+            reverse=True,
+        )[:max_collections]
+
+        targets = []
+        for i in scored:
+            labels = None
+            if topic_sims is not None:
+                own = np.flatnonzero(self._topic_owner == i)
+                ranked = own[np.argsort(-topic_sims[own])][:max_topics]
+                matched = [self._topic_labels[j] for j in ranked if topic_sims[j] >= min_similarity]
+                labels = matched or None
+            targets.append(RouteTarget(self.collections[i], float(scores[i]), labels))
+        targets.extend(
+            RouteTarget(c, None) for c, has in zip(self.collections, self._has_signal) if not has
+        )
+        return targets
+
+
+class TopicRouterCache:
+    """Per-user routers, rebuilt when a KB's search-cache generation changes.
+
+    Ingest, deletion and clustering all bump the generation, so a cached router
+    never routes on stale topics. Description embeddings are kept by text and
+    survive rebuilds; at most `max_descriptions` are kept, least recently used
+    evicted.
+    """
+
+    def __init__(self, max_descriptions: int = 1024):
+        self.max_descriptions = max_descriptions
+        self._routers: dict[str, tuple[tuple, TopicRouter]] = {}
+        self._description_vectors: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fingerprint(kbs: list[KnowledgeBase]) -> tuple:
+        return tuple(
+            (kb.id, kb.milvus_collection, kb.description, search_cache.generation(kb.milvus_collection))
+            for kb in kbs
+        )
+
+    async def get(self, user_id: str, kbs: list[KnowledgeBase], db, embed_fn) -> TopicRouter:
+        fingerprint = self._fingerprint(kbs)
+        with self._lock:
+            cached = self._routers.get(user_id)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+        router = TopicRouter(await self._build_entries(kbs, db, embed_fn))
+        with self._lock:
+            self._routers[user_id] = (fingerprint, router)
+        return router
+
+    async def _build_entries(self, kbs: list[KnowledgeBase], db, embed_fn) -> list[_RouterEntry]:
+        topics_by_kb: dict[UUID, list] = {}
+        for topic in await TopicRepository(db).find_centroids_for_knowledge_bases([kb.id for kb in kbs]):
+            topics_by_kb.setdefault(topic.knowledge_base_id, []).append(topic)
+
+        entries = []
+        for kb in kbs:
+            topics = topics_by_kb.get(kb.id, [])
+            entries.append(_RouterEntry(
+                collection=kb.milvus_collection,
+                description_vector=await self._description_vector(kb, embed_fn),
+                topic_labels=[t.topic_label for t in topics],
+                topic_centroids=[t.centroid for t in topics],
+            ))
+        return entries
+
+    async def _description_vector(self, kb: KnowledgeBase, embed_fn) -> list[float] | None:
+        if not kb.description:
+            return None
+        text = f"{kb.name}: {kb.description}"
+        with self._lock:
+            vector = self._description_vectors.get(text)
+            if vector is not None:
+                self._description_vectors.move_to_end(text)
+                return vector
+        try:
+            vector = await embed_fn(text)
+        except Exception as e:
+            logger.warning(f"Embedding description of KB {kb.id} failed: {e}")
+            return None
+        with self._lock:
+            self._description_vectors[text] = vector
+            while len(self._description_vectors) > self.max_descriptions:
+                self._description_vectors.popitem(last=False)
+        return vector
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._routers.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._routers.clear()
+            self._description_vectors.clear()
+
+
+topic_router_cache = TopicRouterCache(max_descriptions=settings.topic_router_description_cache_size)
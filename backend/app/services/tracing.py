@@ -0,0 +1,253 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "rlm-backend"
+
+_current_trace: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+    """One timed operation in a trace, with free-form attributes (token counts, sizes, ...)."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.attributes = attributes
+        self.error: str | None = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Stands in for a span outside any trace (ingest, clustering, ...)."""
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """The spans of one RLM run, in the order they finished."""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: list[Span] = []
+
+    def summary(self, since: int = 0) -> dict:
+        """Count, total milliseconds and token sums per span name, for spans finished after index `since`."""
+        out: dict[str, dict] = {}
+        for s in self.spans[since:]:
+            entry = out.setdefault(s.name, {"count": 0, "ms": 0.0})
+            entry["count"] += 1
+            entry["ms"] += s.duration_ms
+            for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+                value = s.attributes.get(key)
+                if isinstance(value, int):
+                    entry[key] = entry.get(key, 0) + value
+        for entry in out.values():
+            entry["ms"] = round(entry["ms"], 3)
+        return out
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.trace_id, "spans": [s.to_dict() for s in self.spans]}
+
+    def to_otlp(self) -> dict:
+        """The trace as an OTLP/HTTP JSON ExportTraceServiceRequest."""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [
+                        {
+                            "traceId": self.trace_id,
+                            "spanId": s.span_id,
+                            "parentSpanId": s.parent_id or "",
+                            "name": s.name,
+                            "kind": 1,  # SPAN_KIND_INTERNAL
+                            "startTimeUnixNano": str(s.start_ns),
+                            "endTimeUnixNano": str(s.end_ns or s.start_ns),
+                            "attributes": _otlp_attributes(s.attributes),
+                            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+                        }
+                        for s in self.spans
+                    ],
+                }],
+            }],
+        }
+
+
+def _otlp_attributes(attributes: dict) -> list[dict]:
+    out = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        out.append({"key": key, "value": typed})
+    return out
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span | _NoopSpan]:
+    """Time the enclosed block as a child of the current span.
+
+    Works in sync and async code; outside a trace it does nothing. Spans
+    follow the context, so tool calls made from REPL code and tasks spawned
+    by asyncio.gather nest under the span that was current when they started.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield _NOOP_SPAN
+        return
+    parent = _current_span.get()
+    current = Span(name, trace.trace_id, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        trace.spans.append(current)
+
+
+@contextmanager
+def start_trace(name: str, **attributes) -> Iterator[Trace]:
+    """Start a new trace whose root span covers the enclosed block.
+
+    Inside an active trace (a sub-run started from a run) this opens a child
+    span and yields the enclosing trace instead.
+    """
+    active = _current_trace.get()
+    if active is not None:
+        with span(name, **attributes):
+            yield active
+        return
+    trace = Trace()
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        with span(name, **attributes):
+            yield trace
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Decorator that runs a synchronous function inside a span.
+
+    A tool's `async_impl` (see tools.sync_tool) is wrapped as well, so the
+    call is traced whichever entry point is used.
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        async_impl = getattr(fn, "async_impl", None)
+        if async_impl is not None:
+            async def traced_async(*args, **kwargs):
+                with span(name):
+                    return await async_impl(*args, **kwargs)
+
+            wrapper.async_impl = traced_async
+        return wrapper
+
+    return decorator
+
+
+class TraceExporter:
+    """Writes finished traces as JSON lines to `path` and/or POSTs them to an OTLP/HTTP collector.
+
+    `format` picks the file encoding: "json" (this module's own shape) or
+    "otlp" (one ExportTraceServiceRequest per line, as the OpenTelemetry
+    collector's file receiver reads it). The collector always gets OTLP.
+    """
+
+    def __init__(self, path: str = "", otlp_endpoint: str = "", format: str = "json", timeout: float = 5.0):
+        self.path = path
+        self.otlp_endpoint = otlp_endpoint
+        self.format = format
+        self.timeout = timeout
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path or self.otlp_endpoint)
+
+    async def export(self, trace: Trace) -> None:
+        if not self.enabled:
+            return
+        try:
+            await asyncio.to_thread(self._export, trace)
+        except Exception as e:
+            logger.warning(f"Trace {trace.trace_id} export failed: {e}")
+
+    def _export(self, trace: Trace) -> None:
+        if self.path:
+            payload = trace.to_otlp() if self.format == "otlp" else trace.to_dict()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, default=str) + "\n")
+        if self.otlp_endpoint:
+            request = urllib.request.Request(
+                self.otlp_endpoint,
+                data=json.dumps(trace.to_otlp(), default=str).encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+
+
+trace_exporter = TraceExporter(
+    path=settings.trace_file,
+    otlp_endpoint=settings.trace_otlp_endpoint,
+    format=settings.trace_format,
+)
@@ -13,6 +13,9 @@ CREATE TABLE knowledge_bases (
     name VARCHAR NOT NULL,
     description TEXT,
     milvus_collection VARCHAR UNIQUE NOT NULL,
+    clustered_chunk_count INT DEFAULT 0,
+    new_chunk_count INT DEFAULT 0,
+    drifted_chunk_count INT DEFAULT 0,
     created_at TIMESTAMP DEFAULT NOW()
 );
 
@@ -49,9 +52,48 @@ CREATE TABLE collection_topics (
     doc_count INT DEFAULT 0,
     sample_keywords JSONB,
     parent_topic_id UUID REFERENCES collection_topics(id),
+    label_hash VARCHAR(64),
+    centroid JSONB,
     updated_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Per-chunk topic assignments (labels resolved via collection_topics)
+CREATE TABLE chunk_topics (
+    id VARCHAR(36) PRIMARY KEY,             -- Milvus chunk id
+    knowledge_base_id UUID NOT NULL REFERENCES knowledge_bases(id) ON DELETE CASCADE,
+    file_id UUID,
+    topic_id INT NOT NULL                   -- level-1 BERTopic topic id
+);
+
+CREATE INDEX idx_chunk_topics_kb_topic ON chunk_topics (knowledge_base_id, topic_id);
+CREATE INDEX idx_chunk_topics_file ON chunk_topics (file_id);
+
+CREATE TABLE clustering_jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    knowledge_base_id UUID NOT NULL REFERENCES knowledge_bases(id) ON DELETE CASCADE,
+    status VARCHAR NOT NULL DEFAULT 'pending',  -- pending, running, completed, failed
+    mode VARCHAR NOT NULL DEFAULT 'auto',       -- auto, full, warm, transform, sample
+    progress REAL DEFAULT 0,
+    message TEXT,
+    error TEXT,
+    topic_count INT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX idx_clustering_jobs_kb ON clustering_jobs (knowledge_base_id, created_at DESC);
+
+-- Memoized llm_query responses (see app/services/rlm/sub_lm_cache.py)
+CREATE TABLE sub_lm_cache (
+    id VARCHAR(64) PRIMARY KEY,             -- sha256 of (sub_model, prompt hash, ctx hash, params)
+    sub_model VARCHAR NOT NULL,
+    response TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX idx_sub_lm_cache_created ON sub_lm_cache (created_at);
+
 CREATE TABLE chat_sessions (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     user_id UUID NOT NULL REFERENCES users(id),
@@ -5,6 +5,24 @@ from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_asyn
 from app.database import get_db
 from app.main import app
 from app.models import Base
+from app.services.answer_cache import answer_cache
+from app.services.rlm.sub_lm_cache import sub_lm_cache
+from app.services.search_cache import search_cache
+from app.services.topic_router import topic_router_cache
+
+
+@pytest.fixture(autouse=True)
+def _reset_search_cache():
+    """The search, router, sub-LM and answer caches are process-global; keep tests independent."""
+    search_cache.clear()
+    topic_router_cache.clear()
+    sub_lm_cache.clear()
+    answer_cache.clear()
+    yield
+    search_cache.clear()
+    topic_router_cache.clear()
+    sub_lm_cache.clear()
+    answer_cache.clear()
 
 
 @pytest.fixture
@@ -0,0 +1,116 @@
+from uuid import uuid4
+
+import pytest
+
+from app.models import CollectionTopic, KnowledgeBase, User
+from app.repositories.chunk_topic_repository import ChunkTopicRepository
+
+
+@pytest.fixture
+async def setup(db_session):
+    user = User(username="chunktopicuser")
+    db_session.add(user)
+    await db_session.flush()
+
+    kb = KnowledgeBase(user_id=user.id, name="Chunk Topic KB", milvus_collection="kb_chunktopic")
+    db_session.add(kb)
+    await db_session.flush()
+
+    db_session.add_all([
+        CollectionTopic(knowledge_base_id=kb.id, topic_level=1, topic_label="Machine Learning", topic_id=0),
+        CollectionTopic(knowledge_base_id=kb.id, topic_level=1, topic_label="Cooking", topic_id=1),
+    ])
+    await db_session.flush()
+    return kb
+
+
+@pytest.mark.asyncio
+async def test_insert_many_in_batches(db_session, setup):
+    kb = setup
+    repo = ChunkTopicRepository(db_session)
+    rows = [
+        {"id": f"chunk-{i}", "knowledge_base_id": kb.id, "file_id": None, "topic_id": i % 2}
+        for i in range(7)
+    ]
+    assert await repo.insert_many(rows, batch_size=3) == 7
+    assert len(await repo.find_all(knowledge_base_id=kb.id)) == 7
+
+
+@pytest.mark.asyncio
+async def test_find_ids_by_labels(db_session, setup):
+    kb = setup
+    repo = ChunkTopicRepository(db_session)
+    await repo.insert_many([
+        {"id": "a", "knowledge_base_id": kb.id, "topic_id": 0},
+        {"id": "b", "knowledge_base_id": kb.id, "topic_id": 1},
+        {"id": "c", "knowledge_base_id": kb.id, "topic_id": 0},
+    ])
+    assert sorted(await repo.find_ids_by_labels(kb.id, ["Machine Learning"])) == ["a", "c"]
+    assert len(await repo.find_ids_by_labels(kb.id, ["Machine Learning"], limit=1)) == 1
+    assert await repo.find_ids_by_labels(kb.id, ["Unknown"]) == []
+
+
+@pytest.mark.asyncio
+async def test_find_label_paths(db_session, setup):
+    kb = setup
+    repo = ChunkTopicRepository(db_session)
+    await repo.insert_many([
+        {"id": "a", "knowledge_base_id": kb.id, "topic_id": 0},
+        {"id": "b", "knowledge_base_id": kb.id, "topic_id": 1},
+    ])
+    assert await repo.find_label_paths(kb.id, ["a", "b", "missing"]) == {
+        "a": ("Machine Learning", None),
+        "b": ("Cooking", None),
+    }
+    assert await repo.find_label_paths(kb.id, []) == {}
+
+
+@pytest.mark.asyncio
+async def test_delete_by_file_and_knowledge_base(db_session, setup):
+    kb = setup
+    repo = ChunkTopicRepository(db_session)
+    file_id = uuid4()
+    await repo.insert_many([
+        {"id": "a", "knowledge_base_id": kb.id, "file_id": file_id, "topic_id": 0},
+        {"id": "b", "knowledge_base_id": kb.id, "file_id": uuid4(), "topic_id": 1},
+    ])
+    assert await repo.delete_by_file(file_id) == 1
+    assert await repo.delete_by_knowledge_base(kb.id) == 1
+
+
+@pytest.mark.asyncio
+async def test_level2_lookup_through_parent(db_session, setup):
+    kb = setup
+    parent = CollectionTopic(knowledge_base_id=kb.id, topic_level=2, topic_label="Technology", topic_id=0)
+    db_session.add(parent)
+    await db_session.flush()
+    db_session.add(CollectionTopic(
+        knowledge_base_id=kb.id, topic_level=1, topic_label="Databases", topic_id=2, parent_topic_id=parent.id,
+    ))
+    await db_session.flush()
+
+    repo = ChunkTopicRepository(db_session)
+    await repo.insert_many([
+        {"id": "a", "knowledge_base_id": kb.id, "topic_id": 0},
+        {"id": "b", "knowledge_base_id": kb.id, "topic_id": 2},
+    ])
+
+    assert await repo.find_ids_by_labels(kb.id, ["Technology"], level=2) == ["b"]
+    assert await repo.find_ids_by_labels(kb.id, ["Technology"], level=1) == []
+    assert await repo.find_ids_by_labels(kb.id, ["Technology"]) == ["b"]
+    assert await repo.find_ids_by_labels(kb.id, ["Databases"], level=1) == ["b"]
+    assert await repo.find_label_paths(kb.id, ["a", "b"]) == {
+        "a": ("Machine Learning", None),
+        "b": ("Databases", "Technology"),
+    }
+
+
+@pytest.mark.asyncio
+async def test_find_ids_by_labels_unions_topics(db_session, setup):
+    kb = setup
+    repo = ChunkTopicRepository(db_session)
+    await repo.insert_many([
+        {"id": "a", "knowledge_base_id": kb.id, "topic_id": 0},
+        {"id": "b", "knowledge_base_id": kb.id, "topic_id": 1},
+    ])
+    assert sorted(await repo.find_ids_by_labels(kb.id, ["Machine Learning", "Cooking"], level=1)) == ["a", "b"]
@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import SubLMCacheEntry
+from app.repositories.sub_lm_cache_repository import SubLMCacheRepository
+
+
+@pytest.mark.asyncio
+async def test_put_then_find_fresh(db_session):
+    repo = SubLMCacheRepository(db_session)
+    await repo.put("k1", "sub", "first")
+    await repo.put("k1", "sub", "second")
+
+    entry = await repo.find_fresh("k1", datetime.utcnow() - timedelta(minutes=1))
+    assert entry.response == "second"
+    assert await repo.find_fresh("missing", datetime.utcnow() - timedelta(minutes=1)) is None
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_not_found_and_purged(db_session):
+    db_session.add(SubLMCacheEntry(
+        id="old", sub_model="sub", response="stale", created_at=datetime.utcnow() - timedelta(days=30)
+    ))
+    await db_session.flush()
+    repo = SubLMCacheRepository(db_session)
+    cutoff = datetime.utcnow() - timedelta(days=7)
+
+    assert await repo.find_fresh("old", cutoff) is None
+    assert await repo.delete_older_than(cutoff) == 1
+    assert await repo.find_by_id("old") is None
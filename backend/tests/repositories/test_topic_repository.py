@@ -71,3 +71,21 @@ async def test_delete_by_knowledge_base(db_session, setup):
     assert count == 1
     remaining = await repo.find_by_knowledge_base(kb.id)
     assert len(remaining) == 0
+
+
+@pytest.mark.asyncio
+async def test_find_centroids_for_knowledge_bases(db_session, setup):
+    user, kb = setup
+    other = KnowledgeBase(user_id=user.id, name="Other KB", milvus_collection="kb_topicrepo_other")
+    db_session.add(other)
+    await db_session.flush()
+
+    repo = TopicRepository(db_session)
+    await repo.create(knowledge_base_id=kb.id, topic_level=1, topic_label="a", topic_id=0, centroid=[1.0, 0.0])
+    await repo.create(knowledge_base_id=other.id, topic_level=1, topic_label="b", topic_id=0, centroid=[0.0, 1.0])
+    await repo.create(knowledge_base_id=other.id, topic_level=1, topic_label="no centroid", topic_id=1)
+    await repo.create(knowledge_base_id=other.id, topic_level=2, topic_label="parent", topic_id=0, centroid=[0.0, 1.0])
+
+    topics = await repo.find_centroids_for_knowledge_bases([kb.id, other.id])
+    assert sorted(t.topic_label for t in topics) == ["a", "b"]
+    assert await repo.find_centroids_for_knowledge_bases([]) == []
@@ -0,0 +1,67 @@
+import time
+from types import SimpleNamespace
+
+from app.services.answer_cache import AnswerCache, answer_fingerprint
+from app.services.search_cache import search_cache
+
+FP = ("model", (("kb_a", 0),))
+
+
+def test_near_duplicate_query_hits():
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, threshold=0.9)
+    cache.store(FP, [1.0, 0.0, 0.0], "what is x?", "x is 1", [{"code": "print(1)", "output": "1"}])
+
+    hit = cache.lookup(FP, [0.99, 0.1, 0.0])
+    assert hit.answer == "x is 1"
+    assert hit.query == "what is x?"
+    assert hit.repl_steps == [{"code": "print(1)", "output": "1"}]
+    assert hit.similarity > 0.9
+    assert cache.lookup(FP, [0.0, 1.0, 0.0]) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_fingerprint_must_match():
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, threshold=0.9)
+    cache.store(FP, [1.0, 0.0], "q", "a", [])
+    assert cache.lookup(("model", (("kb_a", 1),)), [1.0, 0.0]) is None
+
+
+def test_closest_entry_wins_and_steps_are_copies():
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, threshold=0.5)
+    cache.store(FP, [1.0, 0.0], "far", "far answer", [])
+    cache.store(FP, [0.8, 0.6], "near", "near answer", [{"code": "c"}])
+
+    hit = cache.lookup(FP, [0.7, 0.7])
+    assert hit.answer == "near answer"
+    hit.repl_steps[0]["code"] = "mutated"
+    assert cache.lookup(FP, [0.7, 0.7]).repl_steps[0]["code"] == "c"
+
+
+def test_ttl_and_capacity(monkeypatch):
+    cache = AnswerCache(max_entries=1, ttl_seconds=60, threshold=0.9)
+    cache.store(FP, [1.0, 0.0], "q1", "a1", [])
+    cache.store(FP, [0.0, 1.0], "q2", "a2", [])
+    assert cache.lookup(FP, [1.0, 0.0]) is None
+    assert cache.lookup(FP, [0.0, 1.0]).answer == "a2"
+
+    now = time.monotonic()
+    monkeypatch.setattr("app.services.answer_cache.time.monotonic", lambda: now + 120)
+    assert cache.lookup(FP, [0.0, 1.0]) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_fingerprint_changes_when_a_collection_is_invalidated():
+    kbs = [SimpleNamespace(milvus_collection="kb_b"), SimpleNamespace(milvus_collection="kb_a")]
+    before = answer_fingerprint("u1", kbs)
+    assert before == answer_fingerprint("u1", list(reversed(kbs)))
+    search_cache.invalidate("kb_a")
+    assert answer_fingerprint("u1", kbs) != before
+
+
+def test_users_without_knowledge_bases_do_not_share_answers():
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, threshold=0.9)
+    cache.store(answer_fingerprint("alice", []), [1.0, 0.0], "q", "alice's answer", [])
+
+    assert cache.lookup(answer_fingerprint("bob", []), [1.0, 0.0]) is None
+    assert cache.lookup(answer_fingerprint("alice", []), [1.0, 0.0]).answer == "alice's answer"
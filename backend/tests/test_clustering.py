@@ -0,0 +1,166 @@
+"""Tests for the clustering helpers that don't need BERTopic."""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.services.clustering import (
+    _topic_label_hash,
+    cluster_knowledge_base,
+    label_topics,
+    stratified_sample_ids,
+)
+
+
+def _make_response(content: str):
+    choice = MagicMock()
+    choice.message.content = content
+    resp = MagicMock()
+    resp.choices = [choice]
+    return resp
+
+
+def test_label_hash_ignores_topic_id_prefix():
+    docs = ["doc one", "doc two"]
+    assert _topic_label_hash("0_ai_ml_deep", docs) == _topic_label_hash("7_ai_ml_deep", docs)
+    assert _topic_label_hash("0_ai_ml_deep", docs) != _topic_label_hash("0_ai_ml_deep", ["other"])
+
+
+@pytest.mark.asyncio
+async def test_label_topics_concurrent_and_bounded(monkeypatch):
+    monkeypatch.setattr("app.services.clustering.settings.clustering_label_concurrency", 2)
+    in_flight = 0
+    peak = 0
+
+    async def create(**kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return _make_response('"Label"')
+
+    client = MagicMock()
+    client.chat.completions.create = create
+
+    inputs = {i: (f"{i}_kw{i}_x", [f"doc {i}"]) for i in range(6)}
+    result = await label_topics(inputs, previous_labels={}, client=client)
+
+    assert peak == 2
+    assert {label for label, _ in result.values()} == {"Label"}
+    assert all(h for _, h in result.values())
+
+
+@pytest.mark.asyncio
+async def test_label_topics_reuses_cached_labels():
+    inputs = {0: ("0_ai_ml", ["doc a"]), 1: ("1_cooking_food", ["doc b"])}
+    cached_hash = _topic_label_hash("3_ai_ml", ["doc a"])
+
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(return_value=_make_response("Cooking"))
+
+    result = await label_topics(inputs, previous_labels={cached_hash: "Machine Learning"}, client=client)
+
+    assert result[0] == ("Machine Learning", cached_hash)
+    assert result[1][0] == "Cooking"
+    client.chat.completions.create.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_label_topics_failure_falls_back_to_name():
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(side_effect=RuntimeError("rate limited"))
+
+    result = await label_topics({0: ("0_ai_ml", [])}, previous_labels={}, client=client)
+
+    assert result[0] == ("0_ai_ml", None)
+
+
+def test_stratified_sample_caps_per_file_and_total():
+    batches = [
+        [{"id": f"big-{i}", "file_id": "big"} for i in range(500)],
+        [{"id": f"big-{i}", "file_id": "big"} for i in range(500, 1000)]
+        + [{"id": f"small-{i}", "file_id": "small"} for i in range(3)],
+    ]
+
+    ids = stratified_sample_ids(iter(batches), per_file_cap=10, total_cap=100)
+
+    assert len(ids) == 13
+    assert sum(i.startswith("big-") for i in ids) == 10
+    assert {"small-0", "small-1", "small-2"} <= set(ids)
+    assert len(set(ids)) == len(ids)
+
+    capped = stratified_sample_ids(iter(batches), per_file_cap=10, total_cap=5)
+    assert len(capped) == 5
+
+
+def test_stratified_sample_is_deterministic_for_seed():
+    rows = [[{"id": str(i), "file_id": str(i % 4)} for i in range(1000)]]
+    assert stratified_sample_ids(iter(rows), 20, 50, seed=3) == stratified_sample_ids(iter(rows), 20, 50, seed=3)
+
+
+@pytest.mark.asyncio
+async def test_label_parent_topics_merges_children(monkeypatch):
+    from app.services import clustering
+
+    monkeypatch.setattr(clustering.settings, "topic_l2_min_children", 2)
+    monkeypatch.setattr(clustering.settings, "topic_l2_max_topics", 2)
+
+    async def fake_label(inputs, previous):
+        return {pid: (f"parent {pid}", f"hash-{pid}") for pid in inputs}
+
+    monkeypatch.setattr(clustering, "label_topics", fake_label)
+    names = {0: "0_sql_index", 1: "1_postgres_query", 2: "2_bread_oven", 3: "3_dough_yeast"}
+    labelled = {0: ("SQL", "h0"), 1: ("Postgres", "h1"), 2: ("Bread", "h2"), 3: ("Dough", "h3")}
+    centroids = {0: [1.0, 0.0], 1: [0.9, 0.1], 2: [0.0, 1.0], 3: [0.1, 0.9]}
+    counts = {0: 5, 1: 3, 2: 4, 3: 1}
+
+    parents, parent_of = await clustering._label_parent_topics(names, labelled, centroids, counts, {})
+
+    assert len(parents) == 2
+    assert parent_of[0] == parent_of[1] != parent_of[2] == parent_of[3]
+    by_id = {p["topic_id"]: p for p in parents}
+    assert by_id[parent_of[0]]["doc_count"] == 8
+    assert by_id[parent_of[0]]["sample_keywords"][:2] == ["sql", "index"]
+
+
+@pytest.mark.asyncio
+async def test_label_parent_topics_skips_small_hierarchies(monkeypatch):
+    from app.services import clustering
+
+    monkeypatch.setattr(clustering.settings, "topic_l2_min_children", 6)
+    parents, parent_of = await clustering._label_parent_topics(
+        {0: "0_a"}, {0: ("A", None)}, {0: [1.0, 0.0]}, {0: 1}, {}
+    )
+    assert parents == [] and parent_of == {}
+
+
+@pytest.mark.asyncio
+async def test_unsampled_modes_load_past_single_query_limit(monkeypatch):
+    """A KB above one query's 16,384-row cap but under the sample threshold is clustered whole."""
+    total = 16384 + 10
+    monkeypatch.setattr("app.services.clustering.settings.clustering_sample_threshold", 50000)
+    monkeypatch.setattr("app.services.clustering.settings.clustering_batch_size", 5000)
+    rows = [{"id": f"c{i}", "text": "t", "vector": [0.0, 1.0], "file_id": "f"} for i in range(total)]
+
+    milvus = MagicMock()
+    milvus.count.return_value = total
+    milvus.query_all.return_value = rows[:16384]
+    milvus.iterate.return_value = iter([rows[i:i + 5000] for i in range(0, total, 5000)])
+
+    kb = MagicMock(id="kb-id", milvus_collection="kb_big")
+    monkeypatch.setattr(
+        "app.services.clustering.KnowledgeBaseRepository",
+        MagicMock(return_value=MagicMock(find_by_id=AsyncMock(return_value=kb))),
+    )
+    saved = MagicMock()
+    saved.transform.side_effect = lambda texts, embeddings: ([0] * len(texts), None)
+    monkeypatch.setattr("app.services.clustering.topic_model_store.load", lambda kb_id: saved)
+    reassign = AsyncMock(return_value=[])
+    monkeypatch.setattr("app.services.clustering._reassign_topics", reassign)
+
+    await cluster_knowledge_base("kb-id", MagicMock(), milvus, mode="transform")
+
+    all_data = reassign.await_args.args[2]
+    assert len(all_data) == total
+    milvus.query_all.assert_not_called()
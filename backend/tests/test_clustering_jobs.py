@@ -0,0 +1,115 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.models import ClusteringJob, KnowledgeBase, User
+from app.repositories.clustering_job_repository import ClusteringJobRepository
+from app.services.clustering_jobs import ClusteringJobManager
+from app.services.search_cache import search_cache
+
+
+@pytest.fixture
+async def kb(db_session):
+    user = User(username="jobuser")
+    db_session.add(user)
+    await db_session.flush()
+    kb = KnowledgeBase(user_id=user.id, name="Jobs KB", milvus_collection="kb_jobs")
+    db_session.add(kb)
+    await db_session.commit()
+    return kb
+
+
+def _manager(db_engine, runner):
+    factory = async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+    return ClusteringJobManager(
+        session_factory=factory,
+        executor=ThreadPoolExecutor(max_workers=2),
+        runner=runner,
+    )
+
+
+@pytest.mark.asyncio
+async def test_submit_runs_job_to_completion(db_engine, db_session, kb):
+    manager = _manager(db_engine, lambda job_id, kb_id, mode: 7)
+
+    job, created = await manager.submit(kb.id, db_session)
+    assert created is True
+    assert job.status == "pending"
+
+    await manager.wait(job.id)
+    done = await ClusteringJobRepository(db_session).find_by_id(job.id)
+    await db_session.refresh(done)
+    assert done.status == "completed"
+    assert done.progress == 1.0
+    assert done.topic_count == 7
+    assert done.finished_at is not None
+    assert search_cache.generation("kb_jobs") == 1
+    manager.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_submits_are_deduplicated(db_engine, db_session, kb):
+    release = threading.Event()
+    calls = []
+
+    def runner(job_id, kb_id, mode):
+        calls.append(job_id)
+        release.wait(timeout=5)
+        return 3
+
+    manager = _manager(db_engine, runner)
+    first, created_first = await manager.submit(kb.id, db_session)
+    second, created_second = await manager.submit(kb.id, db_session)
+
+    assert created_first is True
+    assert created_second is False
+    assert second.id == first.id
+
+    release.set()
+    await manager.wait(first.id)
+    assert len(calls) == 1
+    manager.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_failed_job_records_error(db_engine, db_session, kb):
+    def runner(job_id, kb_id, mode):
+        raise ValueError("Not enough documents for clustering (need at least 5)")
+
+    manager = _manager(db_engine, runner)
+    job, _ = await manager.submit(kb.id, db_session)
+    await manager.wait(job.id)
+
+    failed = await ClusteringJobRepository(db_session).find_by_id(job.id)
+    await db_session.refresh(failed)
+    assert failed.status == "failed"
+    assert "Not enough documents" in failed.error
+
+    # A failed job no longer blocks new submissions
+    retry, created = await manager.submit(kb.id, db_session)
+    assert created is True
+    assert retry.id != job.id
+    await manager.wait(retry.id)
+    manager.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_stale_running_job_does_not_block(db_session, kb):
+    repo = ClusteringJobRepository(db_session)
+    stale = ClusteringJob(
+        knowledge_base_id=kb.id,
+        status="running",
+        updated_at=datetime.utcnow() - timedelta(hours=2),
+    )
+    db_session.add(stale)
+    await db_session.flush()
+
+    cutoff = datetime.utcnow() - timedelta(minutes=15)
+    assert await repo.find_active_by_knowledge_base(kb.id, updated_after=cutoff) is None
+
+    await repo.update(stale.id, updated_at=datetime.utcnow())
+    active = await repo.find_active_by_knowledge_base(kb.id, updated_after=cutoff)
+    assert active.id == stale.id
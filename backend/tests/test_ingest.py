@@ -64,3 +64,57 @@ async def test_ingest_empty_file(db_session, setup):
 
     assert result.filename == "empty.txt"
     assert result.chunk_count == 0
+
+
+@pytest.mark.asyncio
+async def test_ingest_invalidates_search_cache(db_session, setup):
+    from app.services.search_cache import search_cache
+
+    user, kb = setup
+    before = search_cache.generation(kb.milvus_collection)
+
+    with patch("app.services.ingest.embed_texts", new_callable=AsyncMock) as mock_embed:
+        mock_embed.return_value = [[0.1] * 1536]
+        await ingest_file(
+            content=b"Some new content",
+            filename="new.txt",
+            knowledge_base_id=kb.id,
+            user_id=user.id,
+            db=db_session,
+            milvus=MagicMock(),
+        )
+
+    assert search_cache.generation(kb.milvus_collection) == before + 1
+
+
+@pytest.mark.asyncio
+async def test_ingest_assigns_nearest_topic(db_session, setup):
+    from app.models import ChunkTopic, CollectionTopic
+    from app.repositories.chunk_topic_repository import ChunkTopicRepository
+
+    user, kb = setup
+    db_session.add_all([
+        CollectionTopic(knowledge_base_id=kb.id, topic_level=1, topic_label="X", topic_id=0,
+                        centroid=[1.0] + [0.0] * 1535),
+        CollectionTopic(knowledge_base_id=kb.id, topic_level=1, topic_label="Y", topic_id=1,
+                        centroid=[0.0, 1.0] + [0.0] * 1534),
+    ])
+    await db_session.flush()
+
+    with patch("app.services.ingest.embed_texts", new_callable=AsyncMock) as mock_embed:
+        mock_embed.return_value = [[0.1, 0.9] + [0.0] * 1534]
+        result = await ingest_file(
+            content=b"Chunk close to topic Y",
+            filename="y.txt",
+            knowledge_base_id=kb.id,
+            user_id=user.id,
+            db=db_session,
+            milvus=MagicMock(),
+        )
+
+    rows = await ChunkTopicRepository(db_session).find_all(knowledge_base_id=kb.id)
+    assert [(r.file_id, r.topic_id) for r in rows] == [(result.id, 1)]
+
+    await db_session.refresh(kb)
+    assert kb.new_chunk_count == 1
+    assert kb.drifted_chunk_count == 0
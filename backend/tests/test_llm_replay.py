@@ -0,0 +1,229 @@
+import json
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+from openai.types import CreateEmbeddingResponse
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from app.services.llm_replay import (
+    FixtureNotFound,
+    FixtureWriter,
+    RecordingClient,
+    ReplayClient,
+    ReplayLatency,
+    ReplayStore,
+    chat_chunk_payloads,
+    chat_completion_payload,
+    configured_client,
+    embedding_payload,
+    request_key,
+)
+from app.services.llm_stub_server import create_stub_app
+from app.services.rlm.engine import RLMEngine
+
+
+def _completion(content: str, prompt_tokens: int = 10) -> ChatCompletion:
+    return ChatCompletion.model_validate(chat_completion_payload(
+        {"model": "m", "content": content, "finish_reason": "stop",
+         "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 5, "total_tokens": prompt_tokens + 5}},
+        {},
+    ))
+
+
+def _live_client(responses: list) -> MagicMock:
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(side_effect=responses)
+    client.embeddings.create = AsyncMock(return_value=CreateEmbeddingResponse.model_validate(
+        embedding_payload({"model": "e", "embeddings": [[0.1, 0.2]]}, {})
+    ))
+    return client
+
+
+def _records(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_request_key_ignores_delivery_options():
+    request = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    assert request_key("chat", request) == request_key(
+        "chat", {**request, "stream": True, "stream_options": {"include_usage": True}}
+    )
+    assert request_key("chat", request) != request_key("chat", {**request, "model": "other"})
+    assert request_key("chat", request) != request_key("embedding", request)
+
+
+@pytest.mark.asyncio
+async def test_recording_client_writes_plain_streamed_and_embedding_calls(tmp_path):
+    path = tmp_path / "fixtures.jsonl"
+
+    async def stream():
+        for payload in chat_chunk_payloads(
+            {"model": "m", "content": "streamed answer", "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}},
+            {"stream_options": {"include_usage": True}},
+        ):
+            yield ChatCompletionChunk.model_validate(payload)
+
+    client = RecordingClient(_live_client([_completion("plain"), stream()]), FixtureWriter(str(path)))
+    messages = [{"role": "user", "content": "q"}]
+
+    plain = await client.chat.completions.create(model="m", messages=messages)
+    chunks = [c async for c in await client.chat.completions.create(model="m", messages=messages, stream=True)]
+    await client.embeddings.create(model="e", input="text")
+
+    assert plain.choices[0].message.content == "plain"
+    assert "".join(c.choices[0].delta.content or "" for c in chunks if c.choices) == "streamed answer"
+    plain_rec, stream_rec, embed_rec = _records(path)
+    assert plain_rec["response"]["content"] == "plain"
+    assert stream_rec["response"]["content"] == "streamed answer"
+    assert stream_rec["response"]["usage"]["prompt_tokens"] == 3
+    assert "stream" not in stream_rec["request"]
+    assert plain_rec["key"] == stream_rec["key"]
+    assert embed_rec["response"]["embeddings"] == [[0.1, 0.2]]
+
+
+@pytest.mark.asyncio
+async def test_recorded_engine_run_replays_deterministically(tmp_path):
+    path = tmp_path / "fixtures.jsonl"
+    scripted = [
+        _completion('```python\nprint(llm_query("sum", "abc"))\n```'),
+        _completion("S"),
+        _completion('```python\nSUBMIT("final")\n```', prompt_tokens=30),
+    ]
+    recorder = RecordingClient(_live_client(scripted), FixtureWriter(str(path)))
+    recorded = await RLMEngine(recorder, "m", "sub").run(query="q", context="", tools={}, tool_prompt="")
+
+    store = ReplayStore.load(str(path), strict=True)
+    steps = []
+
+    async def on_step(step):
+        steps.append(step)
+
+    replayed = await RLMEngine(ReplayClient(store), "m", "sub").run(
+        query="q", context="", tools={}, tool_prompt="", on_repl_step=on_step
+    )
+
+    assert recorded == replayed == "final"
+    assert store.exact_hits == 3
+    assert steps[-1]["usage"]["prompt_tokens"] == 30
+
+
+@pytest.mark.asyncio
+async def test_replay_streams_and_injects_latency():
+    record = {"kind": "chat", "request": {"model": "m", "messages": []}, "response": {
+        "model": "m", "content": "x" * 40, "finish_reason": "stop",
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }}
+    record["key"] = request_key("chat", record["request"])
+    client = ReplayClient(ReplayStore([record]), ReplayLatency(request_ms=30, chunk_ms=5))
+
+    started = time.monotonic()
+    stream = await client.chat.completions.create(
+        model="m", messages=[], stream=True, stream_options={"include_usage": True}
+    )
+    chunks = [c async for c in stream]
+    elapsed = time.monotonic() - started
+
+    assert "".join(c.choices[0].delta.content or "" for c in chunks if c.choices) == "x" * 40
+    assert chunks[-1].usage.prompt_tokens == 1
+    # 30ms up front, then 5ms before each of the 4 chunks after the first
+    assert elapsed >= 0.045
+
+
+def test_unmatched_requests_fall_back_in_order_unless_strict():
+    records = []
+    for text in ("first", "second"):
+        request = {"model": "m", "messages": [{"role": "user", "content": text}]}
+        records.append({"kind": "chat", "key": request_key("chat", request), "request": request,
+                        "response": {"content": text}})
+
+    drifted = {"model": "m", "messages": [{"role": "user", "content": "changed"}]}
+    store = ReplayStore(records)
+    # Once every recording has been served, the last one repeats
+    assert [store.lookup("chat", drifted)["content"] for _ in range(3)] == ["first", "second", "second"]
+    assert store.fallback_hits == 3
+
+    with pytest.raises(FixtureNotFound):
+        ReplayStore(records, strict=True).lookup("chat", drifted)
+    with pytest.raises(FixtureNotFound):
+        ReplayStore(records).lookup("chat", {**drifted, "model": "unknown"})
+
+
+def test_fallback_skips_recordings_served_by_exact_match():
+    records = []
+    for text in ("first", "second", "third"):
+        request = {"model": "m", "messages": [{"role": "user", "content": text}]}
+        records.append({"kind": "chat", "key": request_key("chat", request), "request": request,
+                        "response": {"content": text}})
+
+    drifted = {"model": "m", "messages": [{"role": "user", "content": "changed"}]}
+    store = ReplayStore(records)
+    assert store.lookup("chat", records[0]["request"])["content"] == "first"
+    assert store.lookup("chat", drifted)["content"] == "second"
+    assert store.lookup("chat", drifted)["content"] == "third"
+    assert (store.exact_hits, store.fallback_hits) == (1, 2)
+
+
+def test_repeated_request_replays_recordings_in_order():
+    request = {"model": "m", "messages": []}
+    records = [
+        {"kind": "chat", "key": request_key("chat", request), "request": request, "response": {"content": text}}
+        for text in ("a", "b")
+    ]
+    store = ReplayStore(records, strict=True)
+    assert [store.lookup("chat", request)["content"] for _ in range(3)] == ["a", "b", "b"]
+
+
+@pytest.mark.asyncio
+async def test_stub_server_serves_the_openai_client(tmp_path):
+    path = tmp_path / "fixtures.jsonl"
+    writer = FixtureWriter(str(path))
+    messages = [{"role": "user", "content": "q"}]
+    writer.write("chat", {"model": "m", "messages": messages}, {
+        "model": "m", "content": "hello from the stub", "finish_reason": "stop",
+        "usage": {"prompt_tokens": 4, "completion_tokens": 4, "total_tokens": 8},
+    })
+    writer.write("embedding", {"model": "e", "input": "text"}, {"model": "e", "embeddings": [[0.5, 0.5]]})
+    app = create_stub_app(ReplayStore.load(str(path), strict=True))
+    client = AsyncOpenAI(
+        base_url="http://stub/v1",
+        api_key="dummy",
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app)),
+    )
+
+    plain = await client.chat.completions.create(model="m", messages=messages)
+    stream = await client.chat.completions.create(
+        model="m", messages=messages, stream=True, stream_options={"include_usage": True}
+    )
+    chunks = [c async for c in stream]
+    embedding = await client.embeddings.create(model="e", input="text")
+
+    assert plain.choices[0].message.content == "hello from the stub"
+    assert "".join(c.choices[0].delta.content or "" for c in chunks if c.choices) == "hello from the stub"
+    assert chunks[-1].usage.total_tokens == 8
+    assert embedding.data[0].embedding == [0.5, 0.5]
+
+    with pytest.raises(Exception) as missing:
+        await client.chat.completions.create(model="m", messages=[{"role": "user", "content": "other"}])
+    assert "fixture_not_found" in str(missing.value)
+
+
+def test_configured_client_records_or_replays(tmp_path, monkeypatch):
+    import app.services.llm_replay as llm_replay
+
+    live = MagicMock()
+    monkeypatch.setattr(llm_replay, "_writer", None)
+    monkeypatch.setattr(llm_replay, "_replay_client", None)
+    assert configured_client(lambda: live) is live
+
+    monkeypatch.setattr(llm_replay.settings, "llm_record_file", str(tmp_path / "rec.jsonl"))
+    assert isinstance(configured_client(lambda: live), RecordingClient)
+
+    (tmp_path / "replay.jsonl").write_text("")
+    monkeypatch.setattr(llm_replay.settings, "llm_backend", "replay")
+    monkeypatch.setattr(llm_replay.settings, "llm_replay_file", str(tmp_path / "replay.jsonl"))
+    replay = configured_client(lambda: live)
+    assert isinstance(replay, ReplayClient)
+    assert configured_client(lambda: live) is replay
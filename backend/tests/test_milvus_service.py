@@ -56,3 +56,34 @@ def test_upsert():
     data = [{"id": "1", "topic_l1": "ai"}]
     service.upsert("test_collection", data)
     mock_client.upsert.assert_called_once_with(collection_name="test_collection", data=data)
+
+
+def test_count():
+    mock_client = MagicMock()
+    mock_client.query.return_value = [{"count(*)": 42}]
+    service = MilvusService(client=mock_client)
+    assert service.count("test_collection") == 42
+
+
+def test_iterate_streams_batches():
+    mock_client = MagicMock()
+    iterator = MagicMock()
+    iterator.next.side_effect = [[{"id": "1"}, {"id": "2"}], [{"id": "3"}], []]
+    mock_client.query_iterator.return_value = iterator
+    service = MilvusService(client=mock_client)
+
+    batches = list(service.iterate("test_collection", ["id"], batch_size=2))
+
+    assert batches == [[{"id": "1"}, {"id": "2"}], [{"id": "3"}]]
+    iterator.close.assert_called_once()
+
+
+def test_get_by_ids_batches():
+    mock_client = MagicMock()
+    mock_client.get.side_effect = lambda collection_name, ids, output_fields: [{"id": i} for i in ids]
+    service = MilvusService(client=mock_client)
+
+    rows = service.get_by_ids("test_collection", ["a", "b", "c"], ["id"], batch_size=2)
+
+    assert [r["id"] for r in rows] == ["a", "b", "c"]
+    assert mock_client.get.call_count == 2
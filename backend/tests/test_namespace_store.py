@@ -0,0 +1,73 @@
+import pickle
+
+from app.services.rlm.namespace import NamespaceStore
+
+
+def _blob(value):
+    return pickle.dumps(value)
+
+
+def _store(**overrides):
+    options = {"max_bytes": 10_000, "max_value_bytes": 5_000, "ttl_seconds": 60, "max_sessions": 4}
+    options.update(overrides)
+    return NamespaceStore(**options)
+
+
+def test_save_and_load_roundtrip():
+    store = _store()
+    store.save("s1", {"rows": _blob([1, 2, 3])})
+    assert pickle.loads(store.load("s1")["rows"]) == [1, 2, 3]
+    assert store.load("other") == {}
+
+
+def test_oversized_values_are_never_kept():
+    store = _store(max_value_bytes=100)
+    evicted = store.save("s1", {"small": _blob(1), "big": _blob("x" * 1000)})
+    assert evicted == ["big"]
+    assert set(store.load("s1")) == {"small"}
+
+
+def test_memory_cap_evicts_least_recently_used():
+    store = _store(max_bytes=2_500)
+    store.save("s1", {"old": _blob("a" * 1000), "mid": _blob("b" * 1000)})
+    # "old" is unchanged and unreferenced so it keeps its age; "new" pushes the session over the cap
+    evicted = store.save("s1", {"old": _blob("a" * 1000), "mid": _blob("c" * 1000), "new": _blob("d" * 1000)})
+    assert evicted == ["old"]
+    assert set(store.load("s1")) == {"mid", "new"}
+
+
+def test_referenced_values_count_as_used():
+    store = _store(max_bytes=2_500)
+    store.save("s1", {"old": _blob("a" * 1000), "mid": _blob("b" * 1000)})
+    store.save("s1", {"old": _blob("a" * 1000), "mid": _blob("b" * 1000)}, used={"old"})
+    evicted = store.save("s1", {"old": _blob("a" * 1000), "mid": _blob("b" * 1000), "new": _blob("d" * 1000)})
+    assert evicted == ["mid"]
+
+
+def test_large_values_evicted_before_small_ones_of_the_same_age():
+    store = _store(max_bytes=3_000)
+    store.save("s1", {"big": _blob("a" * 2000), "small": _blob("b" * 200)})
+    evicted = store.save(
+        "s1", {"big": _blob("a" * 2000), "small": _blob("b" * 200), "new": _blob("c" * 1000)}
+    )
+    assert evicted == ["big"]
+    assert set(store.load("s1")) == {"small", "new"}
+
+
+def test_ttl_expires_idle_sessions(monkeypatch):
+    store = _store(ttl_seconds=10)
+    now = [100.0]
+    monkeypatch.setattr("app.services.rlm.namespace.time.monotonic", lambda: now[0])
+    store.save("s1", {"x": _blob(1)})
+    now[0] += 11
+    assert store.load("s1") == {}
+    assert store.stats()["sessions"] == 0
+
+
+def test_session_count_is_bounded():
+    store = _store(max_sessions=2)
+    for key in ("a", "b", "c"):
+        store.save(key, {"x": _blob(key)})
+    assert store.load("a") == {}
+    assert set(store.stats()) == {"sessions", "bytes"}
+    assert store.stats()["sessions"] == 2
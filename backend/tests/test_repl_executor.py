@@ -0,0 +1,227 @@
+"""Tests for the REPL executors, including real spawned worker processes."""
+import pytest
+
+from app.services.rlm.executor import InProcessExecutor, ReplProcessPool
+from app.services.rlm.tools import sync_tool
+
+
+@pytest.fixture
+def pool():
+    pool = ReplProcessPool(size=1, memory_mb=1024)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_in_process_session_keeps_namespace_and_submit():
+    async with InProcessExecutor().session({"double": lambda x: x * 2}, {"context": "ctx"}) as repl:
+        await repl.execute("x = double(21)")
+        result = await repl.execute("print(x, context)\nSUBMIT(x)")
+
+    assert result.stdout == "42 ctx\n"
+    assert result.submitted == "42"
+
+
+@pytest.mark.asyncio
+async def test_process_session_proxies_tools(pool):
+    calls = []
+
+    def search_docs(query, top_k=5):
+        calls.append((query, top_k))
+        return [{"text": f"hit for {query}"}]
+
+    async with pool.session({"search_docs": search_docs}, {"context": "ctx"}) as repl:
+        first = await repl.execute("hits = search_docs('ai', top_k=2)\nprint(hits[0]['text'], context)")
+        second = await repl.execute("SUBMIT(len(hits))")
+
+    assert first.stdout == "hit for ai ctx\n"
+    assert first.submitted is None
+    assert second.submitted == "1"
+    assert calls == [("ai", 2)]
+
+
+@pytest.mark.asyncio
+async def test_process_session_reports_errors(pool):
+    def broken():
+        raise ValueError("boom")
+
+    async with pool.session({"broken": broken}, {}) as repl:
+        result = await repl.execute("1/0")
+        tool_error = await repl.execute("broken()")
+        exiting = await repl.execute("raise SystemExit(3)")
+        alive = await repl.execute("print('still here')")
+
+    assert "ZeroDivisionError" in result.stderr
+    assert "ValueError: boom" in tool_error.stderr
+    assert "SystemExit" in exiting.stderr
+    assert alive.stdout == "still here\n"
+
+
+@pytest.mark.asyncio
+async def test_wall_clock_limit_kills_and_replaces_worker(pool, monkeypatch):
+    monkeypatch.setattr("app.services.rlm.executor.settings.repl_wall_seconds", 1.0)
+
+    async with pool.session({}, {}) as repl:
+        await repl.execute("y = 1")
+        result = await repl.execute("import time\ntime.sleep(30)")
+        after = await repl.execute("print(globals().get('y'))")
+
+    assert "wall-clock limit" in result.stderr
+    assert after.stdout == "None\n"
+    assert "REPL state was reset" in after.stderr
+
+
+@pytest.mark.asyncio
+async def test_cpu_limit_interrupts_busy_loop(pool, monkeypatch):
+    monkeypatch.setattr("app.services.rlm.executor.settings.repl_cpu_seconds", 1)
+
+    async with pool.session({}, {}) as repl:
+        result = await repl.execute("while True:\n    pass")
+        after = await repl.execute("print('ok')")
+
+    assert "CpuLimitExceeded" in result.stderr
+    assert after.stdout == "ok\n"
+
+
+@pytest.mark.asyncio
+async def test_worker_namespace_is_reset_between_runs(pool):
+    async with pool.session({}, {}) as repl:
+        await repl.execute("secret = 'from run one'")
+    async with pool.session({}, {}) as repl:
+        result = await repl.execute("print(globals().get('secret'))")
+
+    assert result.stdout == "None\n"
+
+
+@pytest.mark.asyncio
+async def test_process_session_snapshot_and_restore(pool):
+    async with pool.session({"tool": lambda: 1}, {"context": "c"}) as repl:
+        await repl.execute("import json\ndata = {'a': [1, 2]}\ndef helper():\n    return 1")
+        blobs = await repl.snapshot(max_value_bytes=10_000)
+
+    # Modules, REPL-defined functions, tools and the context are not carried over
+    assert set(blobs) == {"data"}
+
+    async with pool.session({}, {}, restored=blobs) as repl:
+        result = await repl.execute("print(data['a'])")
+    assert result.stdout == "[1, 2]\n"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_execution_frees_the_worker(pool):
+    import asyncio
+    import time
+
+    async def runaway():
+        async with pool.session({}, {}) as repl:
+            await repl.execute("while True:\n    pass")
+
+    task = asyncio.create_task(runaway())
+    await asyncio.sleep(0.5)
+    started = time.monotonic()
+    task.cancel()
+    await asyncio.wait({task})
+
+    # The busy worker is killed rather than waited on, and the slot is free again
+    assert time.monotonic() - started < 2
+    async with pool.session({}, {}) as repl:
+        result = await repl.execute("SUBMIT('free')")
+    assert result.submitted == "free"
+
+
+@pytest.mark.asyncio
+async def test_nested_session_skips_slot_limit_and_surplus_is_not_kept(pool):
+    async with pool.session({}, {}) as outer:
+        # The only slot is held; a nested session must not wait for it
+        async with pool.session({}, {}, nested=True) as inner:
+            inner_result = await inner.execute("SUBMIT('inner')")
+        outer_result = await outer.execute("SUBMIT('outer')")
+
+    assert inner_result.submitted == "inner"
+    assert outer_result.submitted == "outer"
+    assert len(pool._idle) == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_tool_call_does_not_hold_up_other_runs():
+    import asyncio
+
+    pool = ReplProcessPool(size=2, memory_mb=1024)
+    release = asyncio.Event()
+
+    async def quick():
+        await asyncio.sleep(0.3)
+        return "quick"
+
+    async def stuck():
+        await release.wait()
+        return "stuck"
+
+    try:
+        async with pool.session({"quick": sync_tool(quick)}, {}) as a, \
+                pool.session({"stuck": sync_tool(stuck)}, {}) as b:
+            await asyncio.gather(a.execute("pass"), b.execute("pass"))
+            quick_run = asyncio.create_task(a.execute("SUBMIT(quick())"))
+            await asyncio.sleep(0.1)
+            stuck_run = asyncio.create_task(b.execute("SUBMIT(stuck())"))
+            # A tool call re-entering the loop would have to wait for the later,
+            # stuck one to unwind first; an awaited one returns on its own
+            await asyncio.wait({quick_run}, timeout=5)
+            assert quick_run.done()
+            assert not stuck_run.done()
+            release.set()
+            stuck_result = await asyncio.wait_for(stuck_run, 10)
+    finally:
+        release.set()
+        pool.shutdown()
+
+    assert quick_run.result().submitted == "quick"
+    assert stuck_result.submitted == "stuck"
+
+
+@pytest.mark.asyncio
+async def test_worker_messages_cannot_run_code_in_the_parent(pool, tmp_path):
+    marker = tmp_path / "pwned"
+    calls = []
+
+    def search_docs(query):
+        calls.append(query)
+        return []
+
+    payload = (
+        "import os\n"
+        "class Payload:\n"
+        f"    def __reduce__(self): return (os.system, ('touch {marker}',))\n"
+    )
+    # Bypass the proxy's own check by writing to the pipe it closes over
+    raw_send = (
+        "conn = next(c.cell_contents for c in search_docs.__closure__ if hasattr(c.cell_contents, 'send'))\n"
+        "conn.send(('call', 'search_docs', (Payload(),), {}))\n"
+        "conn.recv()"
+    )
+    async with pool.session({"search_docs": search_docs}, {}) as repl:
+        rejected = await repl.execute(payload + "search_docs(Payload())")
+        smuggled = await repl.execute(payload + raw_send)
+        after = await repl.execute("print('fresh')")
+
+    assert "TypeError" in rejected.stderr
+    assert "UnsafeMessage" in smuggled.stderr
+    assert after.stdout == "fresh\n"
+    assert calls == []
+    assert not marker.exists()
+
+
+@pytest.mark.asyncio
+async def test_waiting_on_a_worker_holds_no_thread(pool, monkeypatch):
+    import asyncio
+
+    async with pool.session({}, {}) as repl:
+        await repl.execute("pass")
+
+        def no_threads(*args, **kwargs):
+            raise AssertionError("waited on the worker from a thread")
+
+        monkeypatch.setattr(asyncio, "to_thread", no_threads)
+        result = await repl.execute("import time\ntime.sleep(0.2)\nSUBMIT('slept')")
+
+    assert result.submitted == "slept"
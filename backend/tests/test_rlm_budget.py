@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from app.services.rlm.budget import BudgetExceeded, RLMBudget
+
+
+def test_unlimited_by_default():
+    budget = RLMBudget()
+    budget.record_root({"prompt_tokens": 10**6, "completion_tokens": 10**6})
+    budget.record_sub({"prompt_tokens": 10**6})
+    budget.check()
+
+
+def test_tokens_count_root_and_sub_calls():
+    budget = RLMBudget(max_tokens=1000)
+    budget.record_root({"prompt_tokens": 600, "completion_tokens": 100})
+    budget.check()
+    budget.record_sub({"prompt_tokens": 250, "completion_tokens": 50})
+    with pytest.raises(BudgetExceeded, match="token budget"):
+        budget.check()
+
+
+def test_cost_uses_configured_prices(monkeypatch):
+    monkeypatch.setattr("app.services.rlm.budget.settings.llm_input_price_per_mtok", 1.0)
+    monkeypatch.setattr("app.services.rlm.budget.settings.llm_output_price_per_mtok", 2.0)
+    monkeypatch.setattr("app.services.rlm.budget.settings.llm_sub_input_price_per_mtok", 0.5)
+    monkeypatch.setattr("app.services.rlm.budget.settings.llm_sub_output_price_per_mtok", 0.5)
+    budget = RLMBudget(max_cost_usd=0.01)
+    budget.record_root({"prompt_tokens": 2000, "completion_tokens": 1000})
+    budget.record_sub({"prompt_tokens": 2000, "completion_tokens": 2000})
+
+    assert budget.cost_usd == pytest.approx(0.006)
+    budget.record_sub({"prompt_tokens": 8000})
+    assert budget.exceeded() == "cost budget of $0.01 exhausted"
+
+
+def test_call_limits():
+    budget = RLMBudget(max_sub_calls=1, max_tool_calls=2)
+    budget.record_tool()
+    budget.reserve_sub_call()
+    assert "sub-LM call budget" in budget.exceeded()
+    with pytest.raises(BudgetExceeded):
+        budget.reserve_sub_call()
+    assert budget.sub_calls == 1
+
+
+def test_time_limit(monkeypatch):
+    budget = RLMBudget(max_seconds=5)
+    assert budget.remaining_seconds() == pytest.approx(5, abs=0.1)
+    now = time.monotonic()
+    monkeypatch.setattr("app.services.rlm.budget.time.monotonic", lambda: now + 10)
+    assert budget.remaining_seconds() == 0
+    assert "time budget" in budget.exceeded()
+
+
+def test_cancel_wins():
+    budget = RLMBudget()
+    budget.cancel("superseded by a newer query")
+    with pytest.raises(BudgetExceeded) as info:
+        budget.check()
+    assert info.value.reason == "superseded by a newer query"
@@ -1,3 +1,4 @@
+import asyncio
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
@@ -164,3 +165,714 @@ async def test_tools_available_in_repl(engine):
         tool_prompt="",
     )
     assert result == "tool_output"
+
+
+def _stream(*deltas):
+    async def gen():
+        for delta in deltas:
+            chunk = MagicMock()
+            chunk.choices = [MagicMock()]
+            chunk.choices[0].delta.content = delta
+            yield chunk
+    return gen()
+
+
+@pytest.mark.asyncio
+async def test_streaming_emits_tokens_with_code_boundaries(engine):
+    engine.client.chat.completions.create = AsyncMock(side_effect=[
+        _stream("Checking.\n``", "`python\nSUBMIT(", '"streamed")\n```'),
+    ])
+    events = []
+
+    async def on_token(event):
+        events.append(event)
+
+    result = await engine.run(query="q", context="", tools={}, tool_prompt="", on_token=on_token)
+
+    assert result == "streamed"
+    assert engine.client.chat.completions.create.call_args.kwargs["stream"] is True
+    kinds = [e["kind"] for e in events]
+    assert kinds.index("code_start") < kinds.index("code") < kinds.index("code_end")
+    assert "".join(e["content"] for e in events if e["kind"] == "code") == 'SUBMIT("streamed")\n'
+    assert all(e["iteration"] == 1 for e in events)
+
+
+@pytest.mark.asyncio
+async def test_streaming_final_answer_without_code(engine):
+    engine.client.chat.completions.create = AsyncMock(side_effect=[_stream("The ", "answer.")])
+    events = []
+
+    async def on_token(event):
+        events.append(event)
+
+    result = await engine.run(query="q", context="", tools={}, tool_prompt="", on_token=on_token)
+
+    assert result == "The answer."
+    assert [e["content"] for e in events] == ["The ", "answer."]
+
+
+@pytest.mark.asyncio
+async def test_namespace_persists_across_runs(engine):
+    from app.services.rlm.namespace import NamespaceStore
+
+    engine.namespace_store = NamespaceStore(max_bytes=10_000, max_value_bytes=5_000, ttl_seconds=60, max_sessions=4)
+    engine.client.chat.completions.create = AsyncMock(side_effect=[
+        _make_response('```python\nrows = [1, 2, 3]\nimport json\nSUBMIT("stored")\n```'),
+        _make_response('```python\nSUBMIT(sum(rows))\n```'),
+    ])
+
+    await engine.run(query="q1", context="", tools={}, tool_prompt="", namespace_key="chat-1")
+    result = await engine.run(query="q2", context="", tools={}, tool_prompt="", namespace_key="chat-1")
+
+    assert result == "6"
+    second_prompt = engine.client.chat.completions.create.call_args.kwargs["messages"][2]["content"]
+    assert "still defined in the REPL: rows" in second_prompt
+
+
+@pytest.mark.asyncio
+async def test_namespace_save_reports_referenced_names(engine):
+    from app.services.rlm.namespace import NamespaceStore
+
+    engine.namespace_store = NamespaceStore(max_bytes=10_000, max_value_bytes=5_000, ttl_seconds=60, max_sessions=4)
+    engine.namespace_store.save = MagicMock(return_value=[])
+    engine.client.chat.completions.create = AsyncMock(side_effect=[
+        _make_response('```python\ntotal = len(context)\nSUBMIT(total)\n```'),
+    ])
+
+    await engine.run(query="q", context="", tools={}, tool_prompt="", namespace_key="chat-1")
+
+    used = engine.namespace_store.save.call_args.kwargs["used"]
+    assert {"context", "total", "SUBMIT"} <= used
+
+
+@pytest.mark.asyncio
+async def test_namespace_not_shared_without_key(engine):
+    from app.services.rlm.namespace import NamespaceStore
+
+    engine.namespace_store = NamespaceStore(max_bytes=10_000, max_value_bytes=5_000, ttl_seconds=60, max_sessions=4)
+    engine.client.chat.completions.create = AsyncMock(side_effect=[
+        _make_response('```python\nrows = [1]\nSUBMIT("x")\n```'),
+        _make_response('```python\nSUBMIT(str("rows" in globals()))\n```'),
+    ])
+
+    await engine.run(query="q1", context="", tools={}, tool_prompt="")
+    assert await engine.run(query="q2", context="", tools={}, tool_prompt="") == "False"
+
+
+@pytest.mark.asyncio
+async def test_llm_query_batch_concurrent_ordered_and_isolated(engine, monkeypatch):
+    import asyncio
+
+    monkeypatch.setattr("app.services.rlm.engine.settings.llm_batch_concurrency", 2)
+    in_flight = 0
+    peak = 0
+    main_responses = iter([
+        _make_response(
+            '```python\n'
+            'out = llm_query_batch(["a", "b", "fail", "d"], ["1", "2", "3", "4"])\n'
+            'SUBMIT(" | ".join(out))\n'
+            '```'
+        ),
+    ])
+
+    async def create(**kwargs):
+        nonlocal in_flight, peak
+        if kwargs["model"] == "test-model":
+            return next(main_responses)
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        content = kwargs["messages"][0]["content"]
+        if content.startswith("fail"):
+            raise RuntimeError("rate limited")
+        return _make_response(content.split("\n")[0].upper())
+
+    engine.client.chat.completions.create = create
+    result = await engine.run(query="q", context="", tools={}, tool_prompt="")
+
+    assert result == "A | B | Error: RuntimeError: rate limited | D"
+    assert peak == 2
+
+
+def test_system_prompt_advertises_llm_query_batch():
+    from app.services.rlm.prompts import STATIC_SYSTEM_PROMPT
+
+    assert "llm_query_batch(prompts" in STATIC_SYSTEM_PROMPT
+
+
+@pytest.mark.asyncio
+async def test_old_repl_outputs_are_compacted(engine, monkeypatch):
+    monkeypatch.setattr("app.services.rlm.engine.settings.history_compact_after_tokens", 0)
+    monkeypatch.setattr("app.services.rlm.engine.settings.history_keep_recent_outputs", 1)
+    monkeypatch.setattr("app.services.rlm.engine.settings.history_digest_chars", 30)
+    monkeypatch.setattr("app.services.rlm.history._encoding", lambda model: None)
+    sent = []
+    responses = iter([
+        _make_response('```python\nprint("A" * 3000)\n```'),
+        _make_response('```python\nprint("B" * 3000)\n```'),
+        _make_response('```python\nSUBMIT(len(_repl_outputs[0]))\n```'),
+    ])
+
+    async def create(**kwargs):
+        sent.append([m["content"] for m in kwargs["messages"]])
+        return next(responses)
+
+    engine.client.chat.completions.create = create
+    result = await engine.run(query="q", context="", tools={}, tool_prompt="")
+
+    # The REPL still holds the full first output
+    assert result == "3001"
+    last_prompt = sent[-1]
+    assert "_repl_outputs[0]" in last_prompt[4]
+    assert "B" * 3000 in last_prompt[6]
+
+
+@pytest.mark.asyncio
+async def test_compacted_outputs_index_every_executed_block(engine, monkeypatch):
+    monkeypatch.setattr("app.services.rlm.engine.settings.history_compact_after_tokens", 0)
+    monkeypatch.setattr("app.services.rlm.engine.settings.history_keep_recent_outputs", 1)
+    monkeypatch.setattr("app.services.rlm.engine.settings.history_digest_chars", 30)
+    monkeypatch.setattr("app.services.rlm.history._encoding", lambda model: None)
+    sent = []
+    responses = iter([
+        _make_response('```python\nprint("A" * 3000)\n```\n```python\nprint("B" * 3000)\n```'),
+        _make_response('```python\nprint("C" * 3000)\n```'),
+        _make_response('```python\nprint("D")\n```'),
+        _make_response('```python\nSUBMIT(",".join(o[0] for o in _repl_outputs))\n```'),
+    ])
+
+    async def create(**kwargs):
+        sent.append([m["content"] for m in kwargs["messages"]])
+        return next(responses)
+
+    engine.client.chat.completions.create = create
+    result = await engine.run(query="q", context="", tools={}, tool_prompt="")
+
+    # One _repl_outputs entry per executed block, in order
+    assert result == "A,B,C,D"
+    last_prompt = sent[-1]
+    assert "_repl_outputs[0:2]" in last_prompt[4]
+    assert "_repl_outputs[2]" in last_prompt[6]
+
+
+def _usage(prompt_tokens: int, cached_tokens: int):
+    usage = MagicMock()
+    usage.prompt_tokens = prompt_tokens
+    usage.completion_tokens = 10
+    usage.prompt_tokens_details.cached_tokens = cached_tokens
+    return usage
+
+
+@pytest.mark.asyncio
+async def test_prompt_prefix_is_identical_across_users_and_queries(engine):
+    sent = []
+
+    async def create(**kwargs):
+        sent.append(kwargs["messages"])
+        return _make_response("done")
+
+    engine.client.chat.completions.create = create
+    await engine.run(query="first", context="short", tools={}, tool_prompt="tools for alice")
+    await engine.run(query="second", context="x" * 5000, tools={}, tool_prompt="tools for bob")
+
+    assert sent[0][0] == sent[1][0]
+    assert sent[0][0]["role"] == "system"
+    assert "5000 characters" not in sent[1][0]["content"]
+    assert "tools for bob" in sent[1][1]["content"]
+    assert sent[1][2]["role"] == "user"
+    assert "5000 characters" in sent[1][2]["content"]
+    assert "Query: second" in sent[1][2]["content"]
+
+
+@pytest.mark.asyncio
+async def test_cached_tokens_recorded_per_iteration(engine):
+    first = _make_response('```python\nprint("hi")\n```')
+    first.usage = _usage(1200, 0)
+    second = _make_response('```python\nSUBMIT("ok")\n```')
+    second.usage = _usage(1300, 1024)
+    engine.client.chat.completions.create = AsyncMock(side_effect=[first, second])
+    steps = []
+
+    async def on_step(step):
+        steps.append(step)
+
+    await engine.run(query="q", context="", tools={}, tool_prompt="", on_repl_step=on_step)
+
+    assert steps[0]["usage"] == {"prompt_tokens": 1200, "completion_tokens": 10, "cached_tokens": 0}
+    assert steps[1]["usage"]["cached_tokens"] == 1024
+
+
+@pytest.mark.asyncio
+async def test_streaming_records_usage_from_final_chunk(engine):
+    async def gen():
+        chunk = MagicMock()
+        chunk.choices = [MagicMock()]
+        chunk.choices[0].delta.content = '```python\nSUBMIT("ok")\n```'
+        chunk.usage = None
+        yield chunk
+        final = MagicMock()
+        final.choices = []
+        final.usage = _usage(900, 512)
+        yield final
+
+    engine.client.chat.completions.create = AsyncMock(side_effect=[gen()])
+    steps = []
+
+    async def on_step(step):
+        steps.append(step)
+
+    async def on_token(event):
+        pass
+
+    await engine.run(query="q", context="", tools={}, tool_prompt="", on_repl_step=on_step, on_token=on_token)
+
+    kwargs = engine.client.chat.completions.create.call_args.kwargs
+    assert kwargs["stream_options"] == {"include_usage": True}
+    assert steps[0]["usage"]["cached_tokens"] == 512
+
+
+@pytest.mark.asyncio
+async def test_repeated_llm_query_served_from_sub_lm_cache(engine):
+    from app.services.rlm.sub_lm_cache import SubLMCache
+
+    engine.sub_lm_cache = SubLMCache(max_entries=10, ttl_seconds=60)
+    sub_calls = []
+    main_responses = iter([
+        _make_response('```python\na = llm_query("summarize", "doc")\nprint(a)\n```'),
+        _make_response('```python\nb = llm_query("summarize", "doc")\nSUBMIT(a + b)\n```'),
+    ])
+
+    async def create(**kwargs):
+        if kwargs["model"] == "test-model":
+            return next(main_responses)
+        sub_calls.append(kwargs)
+        return _make_response("S")
+
+    engine.client.chat.completions.create = create
+    steps = []
+
+    async def on_step(step):
+        steps.append(step)
+
+    result = await engine.run(query="q", context="", tools={}, tool_prompt="", on_repl_step=on_step)
+
+    assert result == "SS"
+    assert len(sub_calls) == 1
+    assert steps[0]["sub_lm_cache"] == {"hits": 0, "misses": 1}
+    assert steps[1]["sub_lm_cache"] == {"hits": 1, "misses": 1}
+
+
+@pytest.mark.asyncio
+async def test_token_budget_stops_run_with_partial_answer(engine):
+    from app.services.rlm.budget import RLMBudget
+
+    first = _make_response('```python\nprint("found: 7 files")\n```')
+    first.usage = _usage(900, 0)
+    engine.client.chat.completions.create = AsyncMock(side_effect=[first])
+
+    result = await engine.run(
+        query="q", context="", tools={}, tool_prompt="", budget=RLMBudget(max_tokens=500)
+    )
+
+    assert engine.client.chat.completions.create.await_count == 1
+    assert result.startswith("Stopped early (token budget of 500 exhausted)")
+    assert "found: 7 files" in result
+
+
+@pytest.mark.asyncio
+async def test_tool_calls_refused_once_budget_spent(engine):
+    from app.services.rlm.budget import RLMBudget
+
+    calls = []
+
+    def find_file(name):
+        calls.append(name)
+        return name
+
+    engine.client.chat.completions.create = AsyncMock(side_effect=[
+        _make_response('```python\nfind_file("a")\nfind_file("b")\n```'),
+    ])
+    steps = []
+
+    async def on_step(step):
+        steps.append(step)
+
+    result = await engine.run(
+        query="q", context="", tools={"find_file": find_file}, tool_prompt="",
+        on_repl_step=on_step, budget=RLMBudget(max_tool_calls=1),
+    )
+
+    assert calls == ["a"]
+    assert "BudgetExceeded: tool call budget of 1 exhausted" in steps[0]["output"]
+    assert steps[0]["budget"]["tool_calls"] == 1
+    assert result.startswith("Stopped early (tool call budget of 1 exhausted)")
+
+
+@pytest.mark.asyncio
+async def test_sub_calls_counted_and_capped(engine):
+    from app.services.rlm.budget import RLMBudget
+
+    main = iter([_make_response(
+        '```python\nout = llm_query_batch(["a", "b", "c"])\nprint(out)\n```'
+    )])
+    sub_calls = []
+
+    async def create(**kwargs):
+        if kwargs["model"] == "test-model":
+            return next(main)
+        sub_calls.append(kwargs)
+        return _make_response("ok")
+
+    engine.client.chat.completions.create = create
+    budget = RLMBudget(max_sub_calls=2)
+    result = await engine.run(query="q", context="", tools={}, tool_prompt="", budget=budget)
+
+    assert len(sub_calls) == 2
+    assert budget.sub_calls == 2
+    assert "Error: BudgetExceeded" in result
+
+
+@pytest.mark.asyncio
+async def test_budget_cancel_aborts_in_flight_call(engine):
+    import asyncio
+
+    from app.services.rlm.budget import RLMBudget
+
+    budget = RLMBudget()
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            return _make_response('```python\nprint("working")\n```')
+        asyncio.get_running_loop().call_later(0.01, budget.cancel, "cancelled by user")
+        await asyncio.sleep(10)
+
+    engine.client.chat.completions.create = create
+    result = await asyncio.wait_for(
+        engine.run(query="q", context="", tools={}, tool_prompt="", budget=budget), timeout=5
+    )
+
+    assert result.startswith("Stopped early (cancelled by user)")
+    assert "working" in result
+    assert budget.root_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_repl_steps_carry_timings_and_trace_is_exported(engine, monkeypatch):
+    from app.services.milvus_service import MilvusService
+    from app.services.tracing import TraceExporter
+
+    milvus_client = MagicMock()
+    milvus_client.search.return_value = [[{"entity": {"text": "t"}, "distance": 0.9}]]
+    milvus = MilvusService(client=milvus_client)
+    exported = []
+
+    class Recorder(TraceExporter):
+        async def export(self, trace):
+            exported.append(trace)
+
+    monkeypatch.setattr("app.services.rlm.engine.trace_exporter", Recorder())
+    main = _make_response('```python\nhits = search("kb", [0.1])\nSUBMIT(llm_query("x"))\n```')
+    main.usage = _usage(100, 0)
+
+    async def create(**kwargs):
+        return main if kwargs["model"] == "test-model" else _make_response("done")
+
+    engine.client.chat.completions.create = create
+    steps = []
+
+    async def on_step(step):
+        steps.append(step)
+
+    result = await engine.run(
+        query="q", context="", tools={"search": milvus.search}, tool_prompt="", on_repl_step=on_step
+    )
+
+    assert result == "done"
+    spans = steps[0]["timings"]["spans"]
+    assert spans["llm.root"]["count"] == 1
+    assert spans["llm.root"]["prompt_tokens"] == 100
+    assert spans["milvus.search"]["count"] == 1
+    assert spans["llm.sub"]["count"] == 1
+    assert spans["repl.exec"]["count"] == 1
+    assert steps[0]["timings"]["iteration_ms"] >= spans["repl.exec"]["ms"]
+
+    (trace,) = exported
+    by_name = {s.name: s for s in trace.spans}
+    assert by_name["milvus.search"].parent_id == by_name["repl.exec"].span_id
+    assert by_name["repl.exec"].parent_id == by_name["rlm.iteration"].span_id
+    assert by_name["rlm.iteration"].parent_id == by_name["rlm.run"].span_id
+    assert by_name["milvus.search"].attributes["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_prefetch_results_in_repl_and_first_message(engine):
+    engine.client.chat.completions.create = AsyncMock(
+        return_value=_make_response('```python\nSUBMIT(prefetched[0]["file_id"])\n```')
+    )
+    prefetch = AsyncMock(return_value=[{"text": "alpha beta", "file_id": "f1", "topic": "t", "score": 0.8}])
+
+    result = await engine.run(query="what?", context="", tools={}, tool_prompt="", prefetch=prefetch)
+
+    assert result == "f1"
+    prefetch.assert_awaited_once_with("what?", 5)
+    first_user = engine.client.chat.completions.create.call_args.kwargs["messages"][2]["content"]
+    assert "`prefetched`" in first_user
+    assert "[1] file_id=f1 topic='t' score=0.8: alpha beta" in first_user
+
+
+@pytest.mark.asyncio
+async def test_failed_or_slow_prefetch_is_skipped(engine, monkeypatch):
+    monkeypatch.setattr("app.services.rlm.engine.settings.rlm_prefetch_timeout_seconds", 0.01)
+    engine.client.chat.completions.create = AsyncMock(
+        return_value=_make_response('```python\nSUBMIT(str("prefetched" in globals()))\n```')
+    )
+
+    async def slow(query, top_k):
+        await asyncio.sleep(1)
+
+    for prefetch in (AsyncMock(side_effect=RuntimeError("milvus down")), slow):
+        result = await engine.run(query="q", context="", tools={}, tool_prompt="", prefetch=prefetch)
+        assert result == "False"
+        first_user = engine.client.chat.completions.create.call_args.kwargs["messages"][2]["content"]
+        assert "prefetched" not in first_user
+
+
+def _query_of(kwargs) -> str:
+    return kwargs["messages"][2]["content"].split("Query: ", 1)[1].split("\n", 1)[0]
+
+
+@pytest.mark.asyncio
+async def test_rlm_query_runs_child_with_tools_and_shared_budget(engine, monkeypatch):
+    from app.services.rlm.budget import RLMBudget
+
+    monkeypatch.setattr("app.services.rlm.engine.settings.rlm_max_depth", 1)
+    lookups = []
+
+    def lookup(name):
+        lookups.append(name)
+        return f"value of {name}"
+
+    async def create(**kwargs):
+        if _query_of(kwargs) == "find x":
+            # The child sees the context it was given and has no rlm_query of its own
+            return _make_response('```python\nSUBMIT(lookup(context) + " " + str("rlm_query" in globals()))\n```')
+        return _make_response('```python\nSUBMIT(rlm_query("find x", "x"))\n```')
+
+    engine.client.chat.completions.create = AsyncMock(side_effect=create)
+    budget = RLMBudget()
+
+    result = await engine.run(query="q", context="", tools={"lookup": lookup}, tool_prompt="", budget=budget)
+
+    assert result == "value of x False"
+    assert lookups == ["x"]
+    assert budget.root_calls == 2
+    assert budget.tool_calls == 1
+    parent_tools_prompt = engine.client.chat.completions.create.call_args_list[0].kwargs["messages"][1]["content"]
+    assert "rlm_query(question" in parent_tools_prompt
+
+
+@pytest.mark.asyncio
+async def test_rlm_query_unavailable_at_max_depth(engine, monkeypatch):
+    monkeypatch.setattr("app.services.rlm.engine.settings.rlm_max_depth", 0)
+    engine.client.chat.completions.create = AsyncMock(
+        return_value=_make_response('```python\nSUBMIT(str("rlm_query" in globals()))\n```')
+    )
+
+    assert await engine.run(query="q", context="", tools={}, tool_prompt="") == "False"
+    tools_prompt = engine.client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+    assert "rlm_query" not in tools_prompt
+
+
+@pytest.mark.asyncio
+async def test_rlm_query_batch_runs_siblings_concurrently(engine, monkeypatch):
+    monkeypatch.setattr("app.services.rlm.engine.settings.rlm_max_depth", 1)
+    monkeypatch.setattr("app.services.rlm.engine.settings.rlm_query_concurrency", 2)
+    in_flight = {"now": 0, "max": 0}
+
+    async def create(**kwargs):
+        query = _query_of(kwargs)
+        if query.startswith("part"):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            if query == "part 2":
+                return _make_response('```python\nraise ValueError("bad part")\n```')
+            return _make_response(f'```python\nSUBMIT("{query} done")\n```')
+        return _make_response(
+            '```python\nSUBMIT(" | ".join(rlm_query_batch(["part 1", "part 2", "part 3"])))\n```'
+        )
+
+    engine.client.chat.completions.create = create
+    engine.max_iterations = 2
+    monkeypatch.setattr("app.services.rlm.engine.settings.rlm_child_max_iterations", 1)
+
+    result = await engine.run(query="q", context="", tools={}, tool_prompt="")
+
+    parts = result.split(" | ")
+    assert parts[0] == "part 1 done"
+    assert parts[2] == "part 3 done"
+    assert parts[1] == "Max iterations reached without a final answer."
+    assert in_flight["max"] == 2
+
+
+@pytest.mark.asyncio
+async def test_rlm_query_batch_siblings_share_db_tools_safely(engine, monkeypatch):
+    from app.services.rlm.tools import create_user_tools
+
+    monkeypatch.setattr("app.services.rlm.engine.settings.rlm_max_depth", 1)
+    monkeypatch.setattr("app.services.rlm.engine.settings.rlm_query_concurrency", 3)
+
+    class SingleStatementSession:
+        """Fails like asyncpg when a second statement starts before the first finishes."""
+
+        def __init__(self):
+            self.busy = False
+            self.statements = 0
+
+        async def execute(self, *args, **kwargs):
+            if self.busy:
+                raise RuntimeError("another operation is in progress")
+            self.busy = True
+            try:
+                await asyncio.sleep(0.01)
+                self.statements += 1
+            finally:
+                self.busy = False
+            result = MagicMock()
+            result.fetchone.return_value = None
+            return result
+
+    db = SingleStatementSession()
+    tools, tool_prompt, _ = create_user_tools(
+        user_id="user1", db_session=db, milvus_client=MagicMock(), embed_fn=AsyncMock(), knowledge_bases=[],
+    )
+
+    async def create(**kwargs):
+        if _query_of(kwargs).startswith("part"):
+            return _make_response('```python\nSUBMIT(get_file("f1")["error"])\n```')
+        return _make_response(
+            '```python\nSUBMIT(" | ".join(rlm_query_batch(["part 1", "part 2", "part 3"])))\n```'
+        )
+
+    engine.client.chat.completions.create = create
+    result = await engine.run(query="q", context="", tools=tools, tool_prompt=tool_prompt)
+
+    assert result.split(" | ") == ["File not found or access denied"] * 3
+    assert db.statements == 3
+
+
+@pytest.mark.asyncio
+async def test_child_runs_are_spans_in_the_root_trace(engine, monkeypatch):
+    from app.services.tracing import TraceExporter
+
+    monkeypatch.setattr("app.services.rlm.engine.settings.rlm_max_depth", 1)
+    exported = []
+
+    class Recorder(TraceExporter):
+        async def export(self, trace):
+            exported.append(trace)
+
+    monkeypatch.setattr("app.services.rlm.engine.trace_exporter", Recorder())
+
+    async def create(**kwargs):
+        if _query_of(kwargs) == "sub":
+            return _make_response('```python\nSUBMIT("s")\n```')
+        return _make_response('```python\nSUBMIT(rlm_query("sub"))\n```')
+
+    engine.client.chat.completions.create = create
+    await engine.run(query="q", context="", tools={}, tool_prompt="")
+
+    (trace,) = exported
+    runs = [s for s in trace.spans if s.name == "rlm.run"]
+    child = next(s for s in runs if s.attributes["depth"] == 1)
+    root = next(s for s in runs if s.attributes["depth"] == 0)
+    exec_span = next(s for s in trace.spans if s.span_id == child.parent_id)
+    assert exec_span.name == "repl.exec"
+    assert root.parent_id is None
+
+
+@pytest.mark.asyncio
+async def test_all_blocks_in_a_message_run_in_order(engine):
+    engine.client.chat.completions.create = AsyncMock(return_value=_make_response(
+        'First:\n```python\nx = 2\nprint("a")\n```\nThen:\n```python\nprint("b")\nSUBMIT(x * 21)\n```'
+    ))
+    steps = []
+
+    async def on_step(step):
+        steps.append(step)
+
+    result = await engine.run(query="q", context="", tools={}, tool_prompt="", on_repl_step=on_step)
+
+    assert result == "42"
+    assert engine.client.chat.completions.create.call_count == 1
+    assert [(s["block"], s["output"]) for s in steps] == [(1, "stdout:\na\n\n"), (2, "stdout:\nb\n\n")]
+
+
+@pytest.mark.asyncio
+async def test_blocks_after_an_error_are_skipped(engine):
+    responses = [
+        _make_response('```python\nprint("ok")\n```\n```python\n1/0\n```\n```python\nprint("never")\n```'),
+        _make_response('```python\nSUBMIT("done")\n```'),
+    ]
+    engine.client.chat.completions.create = AsyncMock(side_effect=responses)
+
+    assert await engine.run(query="q", context="", tools={}, tool_prompt="") == "done"
+
+    feedback = engine.client.chat.completions.create.call_args.kwargs["messages"][-1]["content"]
+    assert "[block 1/3]\nstdout:\nok" in feedback
+    assert "ZeroDivisionError" in feedback
+    assert "never" not in feedback
+    assert "(blocks 3-3 skipped)" in feedback
+
+
+@pytest.mark.asyncio
+async def test_repeated_code_forces_final_answer(engine, monkeypatch):
+    monkeypatch.setattr("app.services.rlm.engine.settings.rlm_loop_repeat_limit", 3)
+    engine.max_iterations = 15
+    looping = [
+        _make_response('```python\nprint(search("x"))\n```'),
+        # Same code once comments and formatting are ignored
+        _make_response('```python\n# try again\nprint( search( "x" ) )\n```'),
+        _make_response('```python\nprint(search("x"))\n```'),
+    ]
+    engine.client.chat.completions.create = AsyncMock(
+        side_effect=looping + [_make_response("The answer is x.")]
+    )
+
+    result = await engine.run(query="q", context="", tools={"search": lambda q: "nothing"}, tool_prompt="")
+
+    assert result == "The answer is x."
+    assert engine.client.chat.completions.create.call_count == 4
+    assert engine.stop_reason is None
+    last_messages = engine.client.chat.completions.create.call_args.kwargs["messages"]
+    assert "stuck in a loop (the same code ran 3 times)" in last_messages[-1]["content"]
+
+
+@pytest.mark.asyncio
+async def test_repeated_error_without_answer_stops_with_partial_result(engine, monkeypatch):
+    monkeypatch.setattr("app.services.rlm.engine.settings.rlm_loop_repeat_limit", 2)
+    responses = [
+        _make_response('```python\nprint("found 3 files")\nundefined_a()\n```'),
+        _make_response('```python\nundefined_a(1)\n```'),
+        _make_response('```python\nprint("still trying")\n```'),
+        _make_response('```python\nprint("should not run")\n```'),
+    ]
+    engine.client.chat.completions.create = AsyncMock(side_effect=responses)
+
+    result = await engine.run(query="q", context="", tools={}, tool_prompt="")
+
+    assert engine.client.chat.completions.create.call_count == 3
+    assert result.startswith("Stopped early (the same error occurred 2 times: Error: NameError")
+    assert "still trying" in result
+    assert engine.stop_reason.startswith("the same error occurred 2 times")
+
+
+def test_loop_detection_disabled_with_zero_limit():
+    from app.services.rlm.engine import _LoopDetector
+
+    detector = _LoopDetector(0)
+    assert all(detector.observe(["x = 1"], "Error: E: e") is None for _ in range(5))
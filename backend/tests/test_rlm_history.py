@@ -0,0 +1,54 @@
+from app.services.rlm.history import History, count_tokens
+
+
+def _words(text: str) -> int:
+    return len(text.split())
+
+
+def _history(**overrides):
+    options = {"keep_recent": 1, "compact_after_tokens": 50, "digest_chars": 20, "counter": _words}
+    options.update(overrides)
+    history = History(**options)
+    history.append("system", "system prompt")
+    history.append("user", "Query: q")
+    return history
+
+
+def test_counts_tokens_per_message():
+    history = _history()
+    history.append("assistant", "one two three")
+    # word counter + 4 framing tokens per message
+    assert [e.tokens for e in history.entries] == [6, 6, 7]
+    assert history.total_tokens == 19
+
+
+def test_no_compaction_under_budget():
+    history = _history(compact_after_tokens=10_000)
+    history.append("user", "REPL output:\n" + "word " * 100, output_index=0)
+    assert history.compact() == 0
+    assert history.entries[-1].compacted is False
+
+
+def test_compacts_old_outputs_and_keeps_recent():
+    history = _history()
+    for i in range(3):
+        history.append("assistant", f"```python\nstep{i}()\n```")
+        history.append("user", "REPL output:\n" + f"out{i} " * 40, output_index=i)
+
+    saved = history.compact()
+
+    outputs = [e for e in history.entries if e.output_index is not None]
+    assert [e.compacted for e in outputs] == [True, True, False]
+    assert "_repl_outputs[0]" in outputs[0].message["content"]
+    assert outputs[2].message["content"].count("out2") == 40
+    assert saved > 0 and history.saved_tokens == saved
+    # The system prompt, query and assistant messages are untouched
+    assert history.messages[0]["content"] == "system prompt"
+    assert history.messages[2]["content"] == "```python\nstep0()\n```"
+    # Already-digested outputs are not digested again
+    assert history.compact() == 0
+
+
+def test_count_tokens_falls_back_without_tokenizer(monkeypatch):
+    monkeypatch.setattr("app.services.rlm.history._encoding", lambda model: None)
+    assert count_tokens("abcdefgh") == 2
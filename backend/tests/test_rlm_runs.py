@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from app.services.rlm.budget import RLMBudget
+from app.services.rlm.runs import Run, RunRegistry
+
+
+def test_events_are_numbered_and_buffer_is_bounded():
+    run = Run("s1", RLMBudget(), buffer_size=3)
+    for i in range(5):
+        run.emit({"type": "repl_step", "iteration": i})
+
+    assert [e["seq"] for e in run.events] == [3, 4, 5]
+    replay, _, gap = run.subscribe(after_seq=3)
+    assert [e["seq"] for e in replay] == [4, 5]
+    assert not gap
+    _, _, gap = run.subscribe(after_seq=1)
+    assert gap
+
+
+@pytest.mark.asyncio
+async def test_live_events_reach_subscribers_but_are_not_buffered():
+    run = Run("s1", RLMBudget(), buffer_size=10)
+    _, queue, _ = run.subscribe()
+    run.emit_live({"type": "token", "content": "a"})
+    run.emit({"type": "answer", "content": "done"})
+
+    assert queue.get_nowait() == {"type": "token", "content": "a", "run_id": run.id}
+    assert queue.get_nowait()["type"] == "answer"
+    assert [e["type"] for e in run.events] == ["answer"]
+    assert run.status == "completed"
+    # Nothing is recorded after the terminal event, and late subscribers only replay
+    run.emit({"type": "repl_step"})
+    assert run.last_seq == 1
+    assert run.subscribe()[1] is None
+
+
+@pytest.mark.asyncio
+async def test_registry_runs_task_and_reports_failures():
+    registry = RunRegistry(buffer_size=10, retention_seconds=60, detach_grace_seconds=0)
+
+    async def boom(run):
+        run.emit({"type": "repl_step"})
+        raise RuntimeError("exploded")
+
+    run = registry.start("s1", RLMBudget(), boom)
+    await asyncio.wait({run.task})
+
+    assert [e["type"] for e in run.events] == ["run_started", "repl_step", "error"]
+    assert run.status == "failed"
+    assert registry.active_for_session("s1") is None
+
+
+@pytest.mark.asyncio
+async def test_detach_without_grace_cancels():
+    registry = RunRegistry(buffer_size=10, retention_seconds=60, detach_grace_seconds=0)
+
+    async def forever(run):
+        await asyncio.sleep(30)
+
+    run = registry.start("s1", RLMBudget(), forever)
+    _, queue, _ = run.subscribe()
+    registry.detach(run, queue)
+    await asyncio.wait({run.task})
+    await asyncio.sleep(0)
+
+    assert run.status == "cancelled"
+    assert run.budget.cancel_reason == "client disconnected"
+    assert run.events[-1]["reason"] == "client disconnected"
+
+
+@pytest.mark.asyncio
+async def test_finished_runs_expire(monkeypatch):
+    registry = RunRegistry(buffer_size=10, retention_seconds=60, detach_grace_seconds=0)
+
+    async def quick(run):
+        run.emit({"type": "answer", "content": "ok"})
+
+    run = registry.start("s1", RLMBudget(), quick)
+    await asyncio.wait({run.task})
+    assert registry.get(run.id) is run
+
+    later = run.finished_at + 120
+    monkeypatch.setattr("app.services.rlm.runs.time.monotonic", lambda: later)
+    assert registry.get(run.id) is None
+
+
+@pytest.mark.asyncio
+async def test_detaching_twice_starts_one_grace_timer():
+    registry = RunRegistry(buffer_size=10, retention_seconds=60, detach_grace_seconds=30)
+
+    async def forever(run):
+        await asyncio.sleep(30)
+
+    run = registry.start("s1", RLMBudget(), forever)
+    _, queue, _ = run.subscribe()
+    registry.detach(run, queue)
+    timer = run._detach_timer
+    registry.detach(run, queue)
+
+    assert run._detach_timer is timer
+    timer.cancel()
+    registry.clear()
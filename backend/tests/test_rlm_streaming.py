@@ -0,0 +1,53 @@
+from app.services.rlm.streaming import CodeFenceTracker
+
+
+def _run(deltas):
+    tracker = CodeFenceTracker()
+    segments = []
+    for delta in deltas:
+        segments.extend(tracker.feed(delta))
+    segments.extend(tracker.flush())
+    return segments
+
+
+def _merge(segments):
+    """Join consecutive segments of the same kind, as a client would render them."""
+    merged = []
+    for kind, content in segments:
+        if merged and merged[-1][0] == kind and kind in ("text", "code"):
+            merged[-1] = (kind, merged[-1][1] + content)
+        else:
+            merged.append((kind, content))
+    return merged
+
+
+def test_fence_in_single_delta():
+    segments = _run(['Let me search.\n```python\nprint(1)\n```\nDone'])
+    assert _merge(segments) == [
+        ("text", "Let me search.\n"),
+        ("code_start", "python"),
+        ("code", "print(1)\n"),
+        ("code_end", ""),
+        ("text", "\nDone"),
+    ]
+
+
+def test_fence_split_across_deltas():
+    deltas = ["Plan:\n`", "``py", "thon\npri", "nt(1)\n`", "`", "`", " ok"]
+    assert _merge(_run(deltas)) == [
+        ("text", "Plan:\n"),
+        ("code_start", "python"),
+        ("code", "print(1)\n"),
+        ("code_end", ""),
+        ("text", " ok"),
+    ]
+
+
+def test_trailing_backticks_flushed_as_text():
+    assert _merge(_run(["use `x`", "`"])) == [("text", "use `x``")]
+
+
+def test_unclosed_block_stays_code():
+    tracker = CodeFenceTracker()
+    tracker.feed("```repl\nx = 1\n")
+    assert tracker.in_code
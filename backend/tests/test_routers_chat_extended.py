@@ -72,3 +72,68 @@ async def test_query_session_success(client, db_engine, chat_setup):
     body = resp.json()
     assert body["success"] is True
     assert body["data"] == "The answer is 42"
+
+
+@pytest.mark.asyncio
+async def test_query_session_answer_cache(client, db_engine, chat_setup):
+    data = chat_setup
+    url = f"/api/chat/sessions/{data['session'].id}/query"
+
+    async def run(**kwargs):
+        await kwargs["on_repl_step"]({"iteration": 1, "code": "SUBMIT('42')", "output": "", "has_answer": True})
+        return "The answer is 42"
+
+    mock_engine = AsyncMock()
+    mock_engine.run = AsyncMock(side_effect=run)
+    mock_engine.stop_reason = None
+
+    with patch("app.routers.chat.MilvusService"), \
+         patch("app.routers.chat.session_manager") as mock_sm, \
+         patch("app.routers.chat.RLMEngine", return_value=mock_engine), \
+         patch("app.routers.chat.embed_text", AsyncMock(return_value=[1.0, 0.0])), \
+         patch("app.routers.chat._get_openai_client"):
+        mock_session = MagicMock()
+        mock_session.tools = {}
+        mock_session.tool_descriptions = ""
+        mock_session.answer_fingerprint = ("user1", "m", (("kb_x", 0),))
+        mock_sm.get_or_create = AsyncMock(return_value=mock_session)
+
+        first = await client.post(url, json={"query": "What is the answer?"})
+        second = await client.post(url, json={"query": "What's the answer?"})
+        bypassed = await client.post(url, json={"query": "What's the answer?", "bypass_cache": True})
+
+    assert first.json()["data"] == second.json()["data"] == "The answer is 42"
+    assert bypassed.json()["data"] == "The answer is 42"
+    assert mock_engine.run.await_count == 2
+
+    messages = (await client.get(f"/api/chat/sessions/{data['session'].id}/messages")).json()["data"]
+    cached_steps = [m for m in messages if m["role"] == "repl_log" and m["metadata"].get("cached")]
+    assert len(cached_steps) == 1
+    cached_answers = [m for m in messages if m["role"] == "assistant" and (m["metadata"] or {}).get("cached")]
+    assert cached_answers[0]["metadata"]["cached_query"] == "What is the answer?"
+
+
+@pytest.mark.asyncio
+async def test_query_session_does_not_cache_stopped_early_answers(client, db_engine, chat_setup):
+    data = chat_setup
+    url = f"/api/chat/sessions/{data['session'].id}/query"
+
+    mock_engine = AsyncMock()
+    mock_engine.run = AsyncMock(return_value="Stopped early (the same code ran 3 times). Partial result:\n\nx")
+    mock_engine.stop_reason = "the same code ran 3 times"
+
+    with patch("app.routers.chat.MilvusService"), \
+         patch("app.routers.chat.session_manager") as mock_sm, \
+         patch("app.routers.chat.RLMEngine", return_value=mock_engine), \
+         patch("app.routers.chat.embed_text", AsyncMock(return_value=[1.0, 0.0])), \
+         patch("app.routers.chat._get_openai_client"):
+        mock_session = MagicMock()
+        mock_session.tools = {}
+        mock_session.tool_descriptions = ""
+        mock_session.answer_fingerprint = ("user1", "m", (("kb_loop", 0),))
+        mock_sm.get_or_create = AsyncMock(return_value=mock_session)
+
+        await client.post(url, json={"query": "Why does it loop?"})
+        await client.post(url, json={"query": "Why does it loop?"})
+
+    assert mock_engine.run.await_count == 2
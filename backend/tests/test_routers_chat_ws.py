@@ -0,0 +1,208 @@
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.main import app
+from app.services.answer_cache import CachedAnswer
+from app.services.rlm.runs import run_registry
+
+
+@pytest.fixture
+def ws_env(monkeypatch):
+    """Patch the WebSocket query path down to a controllable engine.run."""
+    state = {"started": 0, "cancelled": 0, "budgets": [], "release": None}
+
+    async def run(**kwargs):
+        state["started"] += 1
+        state["budgets"].append(kwargs["budget"])
+        if kwargs["query"] == "fast":
+            return "fast answer"
+        if kwargs["query"] == "stepped":
+            await kwargs["on_repl_step"]({"iteration": 1, "code": "print(1)", "output": "1"})
+            state["release"] = asyncio.Event()
+            await state["release"].wait()
+            await kwargs["on_repl_step"]({"iteration": 2, "code": "print(2)", "output": "2"})
+            return "stepped answer"
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+        return "slow answer"
+
+    @asynccontextmanager
+    async def fake_db_session():
+        db = MagicMock()
+        db.commit = AsyncMock()
+        yield db
+
+    async def lookup_answer(query, *args):
+        if query == "cached":
+            step = {"iteration": 1, "code": "print(1)", "output": "1"}
+            return None, CachedAnswer("cached?", "cached answer", [step], 0.97)
+        return None, None
+
+    engine = MagicMock()
+    engine.run = run
+    engine.stop_reason = None
+    rlm_session = MagicMock(tools={}, tool_descriptions="")
+    state["messages"] = MagicMock(create=AsyncMock())
+    # The shared TestClient portal runs the app lifespan; keep it cheap
+    monkeypatch.setattr("app.main.settings.repl_executor", "inprocess")
+    monkeypatch.setattr("app.main.sub_lm_cache.purge_expired", AsyncMock(return_value=0))
+    with patch("app.routers.chat.get_db_session", fake_db_session), \
+         patch("app.routers.chat.ChatMessageRepository", return_value=state["messages"]), \
+         patch("app.routers.chat.MilvusService"), \
+         patch("app.routers.chat.session_manager") as mock_sm, \
+         patch("app.routers.chat._lookup_answer", lookup_answer), \
+         patch("app.routers.chat.RLMEngine", return_value=engine), \
+         patch("app.routers.chat._get_openai_client"):
+        mock_sm.get_or_create = AsyncMock(return_value=rlm_session)
+        yield state
+    run_registry.clear()
+
+
+def _url(session_id=None):
+    return f"/api/chat/sessions/{session_id or uuid.uuid4()}/ws"
+
+
+def _strip(event):
+    return {k: v for k, v in event.items() if k not in ("run_id", "seq")}
+
+
+def test_cancel_stops_running_query(ws_env):
+    with TestClient(app).websocket_connect(_url()) as ws:
+        ws.send_json({"query": "slow", "user_id": "u1"})
+        started = ws.receive_json()
+        assert started["type"] == "run_started"
+        ws.send_json({"type": "cancel"})
+        cancelled = ws.receive_json()
+        assert _strip(cancelled) == {"type": "cancelled", "reason": "cancelled by user"}
+        assert cancelled["run_id"] == started["run_id"]
+
+        ws.send_json({"query": "fast", "user_id": "u1"})
+        assert ws.receive_json()["type"] == "run_started"
+        assert _strip(ws.receive_json()) == {"type": "answer", "content": "fast answer"}
+
+    assert ws_env["cancelled"] == 1
+    assert ws_env["budgets"][0].cancel_reason == "cancelled by user"
+
+
+def test_second_query_rejected_unless_superseding(ws_env):
+    with TestClient(app).websocket_connect(_url()) as ws:
+        ws.send_json({"query": "slow", "user_id": "u1"})
+        assert ws.receive_json()["type"] == "run_started"
+        ws.send_json({"query": "fast", "user_id": "u1"})
+        assert ws.receive_json() == {"type": "error", "content": "A query is already running"}
+
+        ws.send_json({"query": "fast", "user_id": "u1", "supersede": True})
+        assert _strip(ws.receive_json()) == {"type": "cancelled", "reason": "superseded by a newer query"}
+        assert ws.receive_json()["type"] == "run_started"
+        assert _strip(ws.receive_json()) == {"type": "answer", "content": "fast answer"}
+
+    assert ws_env["started"] == 2
+    assert ws_env["cancelled"] == 1
+
+
+def test_disconnect_cancels_after_grace(ws_env, monkeypatch):
+    monkeypatch.setattr(run_registry, "detach_grace_seconds", 0)
+    with TestClient(app) as client:
+        with client.websocket_connect(_url()) as ws:
+            ws.send_json({"query": "slow", "user_id": "u1"})
+            assert ws.receive_json()["type"] == "run_started"
+        for _ in range(50):
+            if ws_env["cancelled"]:
+                break
+            client.portal.call(asyncio.sleep, 0.02)
+
+    assert ws_env["cancelled"] == 1
+    assert ws_env["budgets"][0].cancel_reason == "client disconnected"
+
+
+def test_reconnect_resumes_without_rerunning(ws_env):
+    session_id = uuid.uuid4()
+    with TestClient(app) as client:
+        with client.websocket_connect(_url(session_id)) as ws:
+            ws.send_json({"query": "stepped", "user_id": "u1"})
+            run_id = ws.receive_json()["run_id"]
+            first_step = ws.receive_json()
+            assert first_step["type"] == "repl_step"
+            assert first_step["seq"] == 2
+
+        # The run keeps going while nobody is connected
+        client.portal.call(lambda: ws_env["release"].set())
+        run = run_registry.get(run_id)
+        for _ in range(50):
+            if run.done:
+                break
+            client.portal.call(asyncio.sleep, 0.02)
+
+        with client.websocket_connect(_url(session_id)) as ws:
+            ws.send_json({"type": "resume", "run_id": run_id, "last_seq": first_step["seq"]})
+            events = [ws.receive_json(), ws.receive_json()]
+
+    assert [e["type"] for e in events] == ["repl_step", "answer"]
+    assert events[0]["code"] == "print(2)"
+    assert [e["seq"] for e in events] == [3, 4]
+    assert events[1]["content"] == "stepped answer"
+    assert ws_env["started"] == 1
+
+
+def test_connect_announces_active_run(ws_env):
+    session_id = uuid.uuid4()
+    with TestClient(app) as client:
+        with client.websocket_connect(_url(session_id)) as ws:
+            ws.send_json({"query": "slow", "user_id": "u1"})
+            run_id = ws.receive_json()["run_id"]
+        with client.websocket_connect(_url(session_id)) as ws:
+            assert ws.receive_json() == {"type": "run_active", "run_id": run_id, "seq": 1}
+            ws.send_json({"type": "resume", "run_id": run_id, "last_seq": 0})
+            assert ws.receive_json()["type"] == "run_started"
+            ws.send_json({"type": "cancel"})
+            assert ws.receive_json()["type"] == "cancelled"
+
+
+def test_resume_unknown_run(ws_env):
+    with TestClient(app).websocket_connect(_url()) as ws:
+        ws.send_json({"type": "resume", "run_id": "nope", "last_seq": 0})
+        assert ws.receive_json() == {"type": "error", "content": "Unknown or expired run"}
+
+
+def test_cached_answer_is_persisted_like_rest(ws_env):
+    with TestClient(app).websocket_connect(_url()) as ws:
+        ws.send_json({"query": "cached", "user_id": "u1"})
+        assert ws.receive_json()["type"] == "run_started"
+        assert _strip(ws.receive_json())["cached"] is True
+        assert _strip(ws.receive_json()) == {"type": "answer", "content": "cached answer", "cached": True}
+
+    saved = [call.kwargs for call in ws_env["messages"].create.await_args_list]
+    assert [m["role"] for m in saved] == ["user", "repl_log", "assistant"]
+    assert saved[1]["metadata_"]["cached"] is True
+    assert saved[2]["metadata_"]["cached_query"] == "cached?"
+    assert ws_env["started"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_send_detaches_so_the_run_is_cancelled(monkeypatch):
+    from app.routers.chat import _forward
+    from app.services.rlm.budget import RLMBudget
+    from app.services.rlm.runs import RunRegistry
+
+    registry = RunRegistry(buffer_size=10, retention_seconds=60, detach_grace_seconds=0)
+    monkeypatch.setattr("app.routers.chat.run_registry", registry)
+
+    async def forever(run):
+        await asyncio.sleep(30)
+
+    run = registry.start("s1", RLMBudget(), forever)
+    replay, queue, gap = run.subscribe()
+    websocket = MagicMock(send_json=AsyncMock(side_effect=RuntimeError("socket closed")))
+    await _forward(websocket, run, replay, queue, gap)
+    await asyncio.wait({run.task}, timeout=5)
+
+    assert run.status == "cancelled"
+    assert run.budget.cancel_reason == "client disconnected"
@@ -48,3 +48,34 @@ async def test_upload_files_success(client, user_and_kb):
     body = resp.json()
     assert body["success"] is True
     assert len(body["data"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_upload_queues_refit_when_due(client, user_and_kb):
+    user_id, kb_id = user_and_kb
+
+    mock_file = MagicMock(spec=File)
+    mock_file.id = "00000000-0000-0000-0000-000000000002"
+    mock_file.user_id = user_id
+    mock_file.knowledge_base_id = kb_id
+    mock_file.filename = "big.txt"
+    mock_file.title = "big"
+    mock_file.file_type = "txt"
+    mock_file.file_size_bytes = 100
+    mock_file.chunk_count = 1
+    mock_file.created_at = "2024-01-01T00:00:00"
+
+    with patch("app.routers.files.ingest_file", new_callable=AsyncMock) as mock_ingest, \
+         patch("app.routers.files.MilvusService"), \
+         patch("app.routers.files.refit_reason", return_value="volume"), \
+         patch("app.routers.files.clustering_jobs") as mock_jobs:
+        mock_ingest.return_value = mock_file
+        mock_jobs.submit = AsyncMock(return_value=(MagicMock(), True))
+
+        resp = await client.post(
+            f"/api/knowledge-bases/{kb_id}/files?user_id={user_id}",
+            files=[("files", ("big.txt", b"Hello world", "text/plain"))],
+        )
+
+    assert resp.json()["success"] is True
+    mock_jobs.submit.assert_awaited_once()
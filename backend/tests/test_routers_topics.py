@@ -1,6 +1,10 @@
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+
 import pytest
 
-from app.models import CollectionTopic, KnowledgeBase, User
+from app.models import ClusteringJob, CollectionTopic, KnowledgeBase, User
 
 
 @pytest.fixture
@@ -41,3 +45,67 @@ async def test_list_topics(client, db_engine, setup):
     assert body["success"] is True
     assert len(body["data"]) >= 1
     assert body["data"][0]["topic_label"] == "0_ai_ml"
+
+
+@pytest.mark.asyncio
+async def test_trigger_clustering_returns_job(client, db_engine, setup):
+    data = setup
+    job = ClusteringJob(
+        id=uuid4(),
+        knowledge_base_id=data["kb"].id,
+        status="pending",
+        mode="auto",
+        progress=0.0,
+        message="Queued",
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow(),
+    )
+    with patch("app.routers.topics.clustering_jobs") as mock_jobs:
+        mock_jobs.submit = AsyncMock(return_value=(job, True))
+        resp = await client.post(f"/api/knowledge-bases/{data['kb'].id}/cluster")
+
+    body = resp.json()
+    assert body["success"] is True
+    assert body["data"]["status"] == "pending"
+    assert body["data"]["id"] == str(job.id)
+    mock_jobs.submit.assert_awaited_once()
+    assert mock_jobs.submit.call_args.kwargs["mode"] == "auto"
+
+
+@pytest.mark.asyncio
+async def test_trigger_clustering_kb_not_found(client, db_engine):
+    resp = await client.post("/api/knowledge-bases/00000000-0000-0000-0000-000000000000/cluster")
+    body = resp.json()
+    assert body["success"] is False
+    assert "not found" in body["error"].lower()
+
+
+@pytest.mark.asyncio
+async def test_get_clustering_job_status(client, db_engine, db_session, setup):
+    data = setup
+    job = ClusteringJob(
+        knowledge_base_id=data["kb"].id,
+        status="running",
+        progress=0.5,
+        message="Labelling topics",
+    )
+    db_session.add(job)
+    await db_session.commit()
+
+    resp = await client.get(f"/api/knowledge-bases/{data['kb'].id}/cluster/jobs/{job.id}")
+    body = resp.json()
+    assert body["success"] is True
+    assert body["data"]["progress"] == 0.5
+    assert body["data"]["message"] == "Labelling topics"
+
+    resp = await client.get(f"/api/knowledge-bases/{data['kb'].id}/cluster/jobs")
+    assert len(resp.json()["data"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_clustering_job_not_found(client, db_engine, setup):
+    data = setup
+    resp = await client.get(
+        f"/api/knowledge-bases/{data['kb'].id}/cluster/jobs/00000000-0000-0000-0000-000000000000"
+    )
+    assert resp.json()["success"] is False
@@ -0,0 +1,165 @@
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.services.rlm.tools import create_user_tools
+from app.services.search_cache import SearchCache
+
+
+def test_get_miss_then_hit():
+    cache = SearchCache(max_entries=10, ttl_seconds=60)
+    assert cache.get("kb_a", ("q", "", 5)) is None
+    cache.put("kb_a", ("q", "", 5), [{"text": "hit"}])
+    assert cache.get("kb_a", ("q", "", 5)) == [{"text": "hit"}]
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_returns_copies():
+    cache = SearchCache()
+    cache.put("kb_a", "k", [{"text": "original"}])
+    cache.get("kb_a", "k")[0]["text"] = "mutated"
+    assert cache.get("kb_a", "k") == [{"text": "original"}]
+
+
+def test_invalidate_bumps_generation():
+    cache = SearchCache()
+    cache.put("kb_a", "k", [1])
+    cache.put("kb_b", "k", [2])
+    assert cache.invalidate("kb_a") == 1
+    assert cache.generation("kb_a") == 1
+    assert cache.get("kb_a", "k") is None
+    assert cache.get("kb_b", "k") == [2]
+
+
+def test_put_skips_stale_generation():
+    cache = SearchCache()
+    gen = cache.generation("kb_a")
+    assert cache.get("kb_a", "k") is None
+    cache.invalidate("kb_a")
+    cache.put("kb_a", "k", ["pre-ingest"], generation=gen)
+    assert cache.get("kb_a", "k") is None
+    cache.put("kb_a", "k", ["fresh"], generation=cache.generation("kb_a"))
+    assert cache.get("kb_a", "k") == ["fresh"]
+
+
+def test_lru_eviction():
+    cache = SearchCache(max_entries=2)
+    cache.put("kb", "a", 1)
+    cache.put("kb", "b", 2)
+    cache.get("kb", "a")
+    cache.put("kb", "c", 3)
+    assert cache.get("kb", "b") is None
+    assert cache.get("kb", "a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry(monkeypatch):
+    cache = SearchCache(ttl_seconds=10)
+    now = time.monotonic()
+    monkeypatch.setattr("app.services.search_cache.time.monotonic", lambda: now)
+    cache.put("kb", "k", 1)
+    monkeypatch.setattr("app.services.search_cache.time.monotonic", lambda: now + 11)
+    assert cache.get("kb", "k") is None
+
+
+def _tools(milvus, embed, cache, user_id="user1"):
+    kb = MagicMock()
+    kb.name = "KB"
+    kb.description = ""
+    kb.milvus_collection = "kb_cached"
+    tools, _, _ = create_user_tools(
+        user_id=user_id,
+        db_session=MagicMock(),
+        milvus_client=milvus,
+        embed_fn=embed,
+        knowledge_bases=[kb],
+        cache=cache,
+    )
+    return tools
+
+
+def test_search_docs_repeat_skips_embedding_and_milvus():
+    milvus = MagicMock()
+    milvus.search.return_value = [{"text": "chunk", "file_id": "f1", "topic_l1": "", "score": 0.8}]
+    embed = AsyncMock(return_value=[0.1] * 1536)
+    cache = SearchCache()
+    tools = _tools(milvus, embed, cache)
+
+    first = tools["search_docs"]("same query", knowledge_base="KB")
+    second = tools["search_docs"]("same query", knowledge_base="KB")
+
+    assert first == second
+    assert milvus.search.call_count == 1
+    assert embed.await_count == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_search_docs_cache_is_per_user():
+    milvus = MagicMock()
+    milvus.search.side_effect = lambda **kw: [
+        {"text": f"hit for {kw['filter_expr']}", "file_id": "f1", "topic_l1": "", "score": 0.8}
+    ]
+    cache = SearchCache()
+    embed = AsyncMock(return_value=[0.1] * 1536)
+    alice = _tools(milvus, embed, cache, user_id="alice")
+    bob = _tools(milvus, embed, cache, user_id="bob")
+
+    alice["search_docs"]("q", knowledge_base="kb_cached")
+    # Bob names the same collection directly; he must not get Alice's cached hits
+    hits = bob["search_docs"]("q", knowledge_base="kb_cached")
+
+    assert milvus.search.call_count == 2
+    assert hits[0]["text"] == 'hit for user_id == "bob"'
+
+
+def test_search_docs_refetches_after_invalidate():
+    milvus = MagicMock()
+    milvus.search.return_value = []
+    embed = AsyncMock(return_value=[0.1] * 1536)
+    cache = SearchCache()
+    tools = _tools(milvus, embed, cache)
+
+    tools["search_docs"]("q", knowledge_base="KB")
+    cache.invalidate("kb_cached")
+    tools["search_docs"]("q", knowledge_base="KB")
+    assert milvus.search.call_count == 2
+
+
+def test_search_docs_invalidated_mid_search_not_cached():
+    cache = SearchCache()
+    milvus = MagicMock()
+
+    def search(**kwargs):
+        # An ingest lands while this search is in flight
+        cache.invalidate("kb_cached")
+        return [{"text": "old", "file_id": "f1", "topic_l1": "", "score": 0.8}]
+
+    milvus.search.side_effect = search
+    tools = _tools(milvus, AsyncMock(return_value=[0.1] * 1536), cache)
+
+    tools["search_docs"]("q", knowledge_base="KB")
+    assert cache.stats()["entries"] == 0
+    tools["search_docs"]("q", knowledge_base="KB")
+    assert milvus.search.call_count == 2
+
+
+def test_search_docs_errors_not_cached():
+    milvus = MagicMock()
+    milvus.search.side_effect = [Exception("down"), []]
+    cache = SearchCache()
+    tools = _tools(milvus, AsyncMock(return_value=[0.1] * 1536), cache)
+
+    assert "error" in tools["search_docs"]("q", knowledge_base="KB")[0]
+    assert tools["search_docs"]("q", knowledge_base="KB") == []
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client):
+    resp = await client.get("/api/metrics")
+    body = resp.json()
+    assert body["success"] is True
+    assert "hit_rate" in body["data"]["search_cache"]
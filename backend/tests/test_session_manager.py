@@ -17,7 +17,7 @@ async def test_get_or_create_new_session():
         MockRepo.return_value = mock_repo
 
         with patch("app.services.rlm.session.create_user_tools") as mock_tools:
-            mock_tools.return_value = ({"tool": lambda: None}, "descriptions")
+            mock_tools.return_value = ({"tool": lambda: None}, "descriptions", AsyncMock())
 
             session = await manager.get_or_create("user1", mock_db, mock_milvus)
 
@@ -37,7 +37,7 @@ async def test_get_or_create_returns_existing():
         MockRepo.return_value = mock_repo
 
         with patch("app.services.rlm.session.create_user_tools") as mock_tools:
-            mock_tools.return_value = ({"tool": lambda: None}, "descriptions")
+            mock_tools.return_value = ({"tool": lambda: None}, "descriptions", AsyncMock())
 
             session1 = await manager.get_or_create("user1", mock_db, mock_milvus)
             session2 = await manager.get_or_create("user1", mock_db, mock_milvus)
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.services.rlm.sub_lm_cache import SubLMCache, sub_lm_cache_key
+
+
+def test_key_covers_model_prompt_ctx_and_params():
+    base = sub_lm_cache_key("sub", "summarize", "file text", {"max_completion_tokens": 8000})
+    assert base == sub_lm_cache_key("sub", "summarize", "file text", {"max_completion_tokens": 8000})
+    assert base != sub_lm_cache_key("other", "summarize", "file text", {"max_completion_tokens": 8000})
+    assert base != sub_lm_cache_key("sub", "summarise", "file text", {"max_completion_tokens": 8000})
+    assert base != sub_lm_cache_key("sub", "summarize", "file text!", {"max_completion_tokens": 8000})
+    assert base != sub_lm_cache_key("sub", "summarize", "file text", {"max_completion_tokens": 100})
+
+
+@pytest.mark.asyncio
+async def test_memory_tier_lru_and_ttl(monkeypatch):
+    cache = SubLMCache(max_entries=2, ttl_seconds=60)
+    await cache.put("a", "sub", "A")
+    await cache.put("b", "sub", "B")
+    assert await cache.get("a") == "A"
+    await cache.put("c", "sub", "C")
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") == "A"
+
+    now = time.monotonic()
+    monkeypatch.setattr("app.services.rlm.sub_lm_cache.time.monotonic", lambda: now + 120)
+    assert await cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_db_tier_survives_memory_loss(db_engine):
+    factory = async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+    cache = SubLMCache(max_entries=10, ttl_seconds=60, session_factory=factory)
+    await cache.put("k", "sub", "persisted")
+
+    cache.clear()
+    assert await cache.get("k") == "persisted"
+    assert await cache.get("k") == "persisted"
+    stats = cache.stats()
+    assert stats["db_hits"] == 1
+    assert stats["memory_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_db_failures_fall_through_to_a_miss():
+    def broken_factory():
+        raise RuntimeError("database down")
+
+    cache = SubLMCache(max_entries=10, ttl_seconds=60, session_factory=broken_factory)
+    await cache.put("k", "sub", "value")
+    cache.clear()
+    assert await cache.get("k") is None
+    assert cache.stats()["misses"] == 1
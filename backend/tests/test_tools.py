@@ -14,7 +14,7 @@ def test_list_knowledge_bases():
     kb2.description = None
     kb2.milvus_collection = "kb_002"
 
-    tools, descriptions = create_user_tools(
+    tools, descriptions, _ = create_user_tools(
         user_id="user123",
         db_session=MagicMock(),
         milvus_client=MagicMock(),
@@ -29,7 +29,7 @@ def test_list_knowledge_bases():
 
 
 def test_tool_descriptions_contain_all_tools():
-    tools, descriptions = create_user_tools(
+    tools, descriptions, _ = create_user_tools(
         user_id="user123",
         db_session=MagicMock(),
         milvus_client=MagicMock(),
@@ -49,7 +49,7 @@ def test_tool_descriptions_contain_all_tools():
 
 
 def test_tools_closures_isolate_user_id():
-    tools1, _ = create_user_tools(
+    tools1, _, _ = create_user_tools(
         user_id="user1",
         db_session=MagicMock(),
         milvus_client=MagicMock(),
@@ -57,7 +57,7 @@ def test_tools_closures_isolate_user_id():
         knowledge_bases=[],
     )
 
-    tools2, _ = create_user_tools(
+    tools2, _, _ = create_user_tools(
         user_id="user2",
         db_session=MagicMock(),
         milvus_client=MagicMock(),
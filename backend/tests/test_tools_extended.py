@@ -1,7 +1,11 @@
 """Extended tests for RLM tools covering search_docs, find_file, get_file."""
+import asyncio
 from unittest.mock import AsyncMock, MagicMock, patch
 
+import pytest
+
 from app.services.rlm.tools import _run_async, create_user_tools
+from app.services.search_cache import SearchCache
 
 
 def test_run_async_basic():
@@ -26,7 +30,7 @@ def test_search_docs_calls_milvus():
     kb.description = "Test"
     kb.milvus_collection = "kb_test"
 
-    tools, _ = create_user_tools(
+    tools, _, _ = create_user_tools(
         user_id="user1",
         db_session=MagicMock(),
         milvus_client=mock_milvus,
@@ -55,7 +59,7 @@ def test_search_docs_all_kbs():
     kb2.description = ""
     kb2.milvus_collection = "kb_2"
 
-    tools, _ = create_user_tools(
+    tools, _, _ = create_user_tools(
         user_id="user1",
         db_session=MagicMock(),
         milvus_client=mock_milvus,
@@ -78,7 +82,7 @@ def test_search_docs_with_topic_filter():
     kb.description = ""
     kb.milvus_collection = "kb_t"
 
-    tools, _ = create_user_tools(
+    tools, _, _ = create_user_tools(
         user_id="user1",
         db_session=MagicMock(),
         milvus_client=mock_milvus,
@@ -102,7 +106,7 @@ def test_search_docs_handles_error():
     kb.description = ""
     kb.milvus_collection = "kb_err"
 
-    tools, _ = create_user_tools(
+    tools, _, _ = create_user_tools(
         user_id="user1",
         db_session=MagicMock(),
         milvus_client=mock_milvus,
@@ -126,7 +130,7 @@ def test_search_docs_limits_top_k():
     kb.description = ""
     kb.milvus_collection = "kb_lim"
 
-    tools, _ = create_user_tools(
+    tools, _, _ = create_user_tools(
         user_id="user1",
         db_session=MagicMock(),
         milvus_client=mock_milvus,
@@ -137,3 +141,227 @@ def test_search_docs_limits_top_k():
     tools["search_docs"]("test", knowledge_base="KB", top_k=100)
     call_args = mock_milvus.search.call_args
     assert call_args.kwargs.get("top_k", 0) <= 20
+
+
+async def _topic_kb(db_session):
+    from app.models import ChunkTopic, CollectionTopic, KnowledgeBase, User
+
+    user = User(username="topicfilteruser")
+    db_session.add(user)
+    await db_session.flush()
+    kb = KnowledgeBase(user_id=user.id, name="KB", milvus_collection="kb_topicfilter")
+    db_session.add(kb)
+    await db_session.flush()
+    db_session.add(CollectionTopic(knowledge_base_id=kb.id, topic_level=1, topic_label="AI", topic_id=0))
+    db_session.add_all([
+        ChunkTopic(id="c1", knowledge_base_id=kb.id, topic_id=0),
+        ChunkTopic(id="c2", knowledge_base_id=kb.id, topic_id=0),
+    ])
+    await db_session.flush()
+    return user, kb
+
+
+@pytest.mark.asyncio
+async def test_search_docs_topic_filter_uses_chunk_topics(db_session):
+    user, kb = await _topic_kb(db_session)
+    mock_milvus = MagicMock()
+    mock_milvus.search.return_value = [
+        {"id": "c1", "text": "about ai", "file_id": "f1", "topic_l1": "", "score": 0.9},
+    ]
+
+    tools, _, _ = create_user_tools(
+        user_id=str(user.id),
+        db_session=db_session,
+        milvus_client=mock_milvus,
+        embed_fn=AsyncMock(return_value=[0.1] * 1536),
+        knowledge_bases=[kb],
+    )
+    results = tools["search_docs"]("ai", knowledge_base="KB", topic_filter="AI")
+
+    filter_expr = mock_milvus.search.call_args.kwargs["filter_expr"]
+    assert 'id in ["c1", "c2"]' in filter_expr or 'id in ["c2", "c1"]' in filter_expr
+    assert results[0]["topic"] == "AI"
+
+
+@pytest.mark.asyncio
+async def test_search_docs_large_topic_post_filters(db_session, monkeypatch):
+    monkeypatch.setattr("app.services.rlm.tools.settings.topic_filter_max_ids", 1)
+    user, kb = await _topic_kb(db_session)
+    mock_milvus = MagicMock()
+    mock_milvus.search.return_value = [
+        {"id": "c9", "text": "unrelated", "file_id": "f2", "topic_l1": "", "score": 0.95},
+        {"id": "c2", "text": "about ai", "file_id": "f1", "topic_l1": "", "score": 0.9},
+    ]
+
+    tools, _, _ = create_user_tools(
+        user_id=str(user.id),
+        db_session=db_session,
+        milvus_client=mock_milvus,
+        embed_fn=AsyncMock(return_value=[0.1] * 1536),
+        knowledge_bases=[kb],
+    )
+    results = tools["search_docs"]("ai", knowledge_base="KB", topic_filter="AI", top_k=3)
+
+    call = mock_milvus.search.call_args.kwargs
+    assert "id in" not in call["filter_expr"]
+    assert call["top_k"] == 3 * 5
+    assert [r["file_id"] for r in results] == ["f1"]
+
+
+async def _hierarchy_kb(db_session):
+    from app.models import ChunkTopic, CollectionTopic
+
+    user, kb = await _topic_kb(db_session)
+    parent = CollectionTopic(knowledge_base_id=kb.id, topic_level=2, topic_label="Technology", topic_id=0, doc_count=3)
+    db_session.add(parent)
+    await db_session.flush()
+    db_session.add(CollectionTopic(
+        knowledge_base_id=kb.id, topic_level=1, topic_label="Databases", topic_id=1,
+        doc_count=1, parent_topic_id=parent.id,
+    ))
+    db_session.add(ChunkTopic(id="c3", knowledge_base_id=kb.id, topic_id=1))
+    await db_session.flush()
+    return user, kb
+
+
+@pytest.mark.asyncio
+async def test_search_docs_level2_topic_filter(db_session):
+    user, kb = await _hierarchy_kb(db_session)
+    mock_milvus = MagicMock()
+    mock_milvus.search.return_value = [
+        {"id": "c3", "text": "about sql", "file_id": "f3", "topic_l1": "", "score": 0.9},
+    ]
+
+    tools, _, _ = create_user_tools(
+        user_id=str(user.id),
+        db_session=db_session,
+        milvus_client=mock_milvus,
+        embed_fn=AsyncMock(return_value=[0.1] * 1536),
+        knowledge_bases=[kb],
+    )
+    results = tools["search_docs"]("sql", knowledge_base="KB", topic_filter="Technology", topic_level=2)
+
+    assert 'id in ["c3"]' in mock_milvus.search.call_args.kwargs["filter_expr"]
+    assert results[0]["topic"] == "Databases"
+    assert results[0]["topic_l2"] == "Technology"
+
+
+@pytest.mark.asyncio
+async def test_list_topics_groups_by_parent(db_session):
+    user, kb = await _hierarchy_kb(db_session)
+    tools, descriptions, _ = create_user_tools(
+        user_id=str(user.id),
+        db_session=db_session,
+        milvus_client=MagicMock(),
+        embed_fn=AsyncMock(),
+        knowledge_bases=[kb],
+    )
+
+    topics = {t["label"]: t for t in tools["list_topics"]("KB")}
+
+    assert "list_topics" in descriptions
+    assert topics["Technology"]["subtopics"] == [{"label": "Databases", "doc_count": 1}]
+    assert topics[None]["subtopics"][0]["label"] == "AI"
+    assert tools["list_topics"]("missing") == []
+
+
+def test_search_docs_all_uses_router():
+    from app.services.topic_router import TopicRouter, _RouterEntry
+
+    mock_milvus = MagicMock()
+    mock_milvus.search.return_value = []
+    kbs = []
+    for name in ("A", "B", "C"):
+        kb = MagicMock()
+        kb.name = name
+        kb.milvus_collection = f"kb_{name.lower()}"
+        kbs.append(kb)
+    router = TopicRouter([
+        _RouterEntry("kb_a", [1.0, 0.0]),
+        _RouterEntry("kb_b", [0.0, 1.0]),
+        _RouterEntry("kb_c", [-1.0, 0.0]),
+    ])
+
+    tools, _, _ = create_user_tools(
+        user_id="user1",
+        db_session=MagicMock(),
+        milvus_client=mock_milvus,
+        embed_fn=AsyncMock(return_value=[1.0, 0.2]),
+        knowledge_bases=kbs,
+        router=router,
+    )
+    with patch("app.services.rlm.tools.settings.topic_router_max_collections", 2):
+        tools["search_docs"]("test", knowledge_base="all")
+
+    searched = [c.kwargs["collection_name"] for c in mock_milvus.search.call_args_list]
+    assert searched == ["kb_a", "kb_b"]
+
+
+def test_routed_search_ranks_unlabeled_chunks_alongside():
+    """Routed topic filters would hide unlabeled chunks, even when they fill a page."""
+    from app.services.topic_router import TopicRouter, _RouterEntry
+
+    labeled = {"id": "c1", "text": "labeled", "file_id": "f1", "score": 0.7}
+    unlabeled = {"id": "c2", "text": "fresh", "file_id": "f2", "score": 0.9}
+    mock_milvus = MagicMock()
+    mock_milvus.search.side_effect = lambda **kw: [labeled] if " and id in " in kw["filter_expr"] else [unlabeled, labeled]
+    kbs = []
+    for name in ("A", "B"):
+        kb = MagicMock()
+        kb.name = name
+        kb.milvus_collection = f"kb_{name.lower()}"
+        kbs.append(kb)
+    router = TopicRouter([
+        _RouterEntry("kb_a", [1.0, 0.0], ["AI"], [[1.0, 0.0]]),
+        _RouterEntry("kb_b", [-1.0, 0.0]),
+    ])
+
+    tools, _, _ = create_user_tools(
+        user_id="user1",
+        db_session=MagicMock(),
+        milvus_client=mock_milvus,
+        embed_fn=AsyncMock(return_value=[1.0, 0.0]),
+        knowledge_bases=kbs,
+        cache=SearchCache(),
+        router=router,
+    )
+    with patch("app.services.rlm.tools.ChunkTopicRepository") as MockRepo, \
+            patch("app.services.rlm.tools.settings.topic_router_max_collections", 1):
+        MockRepo.return_value.find_ids_by_labels = AsyncMock(return_value=["c1"])
+        MockRepo.return_value.find_label_paths = AsyncMock(return_value={"c1": ("AI", None)})
+        results = tools["search_docs"]("test", knowledge_base="all", top_k=1)
+
+    # The routed topic filled the page, but the better unlabeled hit wins
+    assert [r["text"] for r in results] == ["fresh"]
+    filters = [c.kwargs["filter_expr"] for c in mock_milvus.search.call_args_list]
+    assert filters == ['user_id == "user1" and id in ["c1"]', 'user_id == "user1"']
+
+
+@pytest.mark.asyncio
+async def test_prefetch_searches_raw_query_and_fills_cache():
+    mock_milvus = MagicMock()
+    mock_milvus.search.return_value = [
+        {"text": "found text", "file_id": "f1", "topic_l1": "ai", "score": 0.9}
+    ]
+    mock_embed = AsyncMock(return_value=[0.1] * 1536)
+    kb = MagicMock()
+    kb.name = "KB"
+    kb.milvus_collection = "kb_prefetch"
+    cache = SearchCache(max_entries=10, ttl_seconds=60)
+
+    tools, _, prefetch = create_user_tools(
+        user_id="user1",
+        db_session=MagicMock(),
+        milvus_client=mock_milvus,
+        embed_fn=mock_embed,
+        knowledge_bases=[kb],
+        cache=cache,
+    )
+
+    results = await prefetch("what is ai", top_k=5)
+
+    assert [r["file_id"] for r in results] == ["f1"]
+    assert mock_milvus.search.call_args.kwargs["top_k"] == 5
+    # The model repeating the same search is served from the cache
+    assert await asyncio.to_thread(tools["search_docs"], "what is ai") == results
+    assert mock_milvus.search.call_count == 1
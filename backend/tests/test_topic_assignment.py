@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.services.topic_assignment import (
+    assign_to_centroids,
+    compute_centroids,
+    merge_centroids,
+    normalize_rows,
+    refit_reason,
+)
+
+
+def test_normalize_rows_handles_zero_vectors():
+    out = normalize_rows([[3.0, 4.0], [0.0, 0.0]])
+    assert np.allclose(out[0], [0.6, 0.8])
+    assert np.allclose(out[1], [0.0, 0.0])
+
+
+def test_compute_centroids_unit_length():
+    embeddings = [[1, 0], [1, 0.1], [0, 1], [5, 5]]
+    centroids = compute_centroids(embeddings, [0, 0, 1, -1], [0, 1])
+    assert set(centroids) == {0, 1}
+    assert np.isclose(np.linalg.norm(centroids[0]), 1.0)
+    assert np.allclose(centroids[1], [0.0, 1.0])
+
+
+def test_assign_to_centroids_nearest_and_threshold():
+    centroids = [[1.0, 0.0], [0.0, 1.0]]
+    embeddings = [[0.9, 0.1], [0.1, 0.9], [-1.0, -1.0]]
+    assigned, sims = assign_to_centroids(embeddings, [10, 20], centroids, min_similarity=0.5)
+    assert assigned == [10, 20, None]
+    assert sims[0] > 0.9
+
+
+def _kb(clustered, new, drifted):
+    return SimpleNamespace(
+        clustered_chunk_count=clustered, new_chunk_count=new, drifted_chunk_count=drifted
+    )
+
+
+def test_refit_reason(monkeypatch):
+    monkeypatch.setattr("app.services.topic_assignment.settings.topic_refit_min_new_chunks", 10)
+    monkeypatch.setattr("app.services.topic_assignment.settings.topic_refit_new_ratio", 0.25)
+    monkeypatch.setattr("app.services.topic_assignment.settings.topic_refit_drift_ratio", 0.3)
+
+    assert refit_reason(_kb(0, 100, 0)) is None  # never clustered
+    assert refit_reason(_kb(1000, 5, 5)) is None  # too few new chunks
+    assert refit_reason(_kb(1000, 20, 10)) == "drift"
+    assert refit_reason(_kb(100, 30, 0)) == "volume"
+    assert refit_reason(_kb(1000, 30, 0)) is None
+
+
+def test_merge_centroids_groups_nearby_topics():
+    centroids = [[1.0, 0.0], [0.95, 0.05], [0.0, 1.0], [0.05, 0.95], [0.9, 0.1]]
+    parent_of, parents = merge_centroids(centroids, [10, 5, 8, 2, 1], n_parents=2)
+
+    assert parent_of[0] == parent_of[1] == parent_of[4]
+    assert parent_of[2] == parent_of[3]
+    assert parent_of[0] != parent_of[2]
+    assert parents.shape == (2, 2)
+    assert np.allclose(np.linalg.norm(parents, axis=1), 1.0)
+
+
+def test_merge_centroids_caps_parents_at_topic_count():
+    parent_of, parents = merge_centroids([[1.0, 0.0], [0.0, 1.0]], [1, 1], n_parents=5)
+    assert sorted(parent_of) == [0, 1]
+    assert len(parents) == 2
@@ -0,0 +1,62 @@
+import pickle
+from uuid import uuid4
+
+import numpy as np
+
+from app.services.topic_models import TopicModelStore
+
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+
+    def save(self, path, serialization="pickle"):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+
+def _load(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    store = TopicModelStore(str(tmp_path), loader=_load)
+    kb_id = uuid4()
+    assert store.exists(kb_id) is False
+    assert store.load(kb_id) is None
+
+    reduced = np.arange(6, dtype=np.float32).reshape(3, 2)
+    store.save(kb_id, FakeModel("v1"), ["a", "b", "c"], reduced)
+
+    assert store.exists(kb_id)
+    assert store.load(kb_id).name == "v1"
+    by_id = store.load_reduced_embeddings(kb_id)
+    assert list(by_id) == ["a", "b", "c"]
+    assert np.allclose(by_id["c"], [4.0, 5.0])
+
+
+def test_load_is_cached_per_process(tmp_path):
+    calls = []
+
+    def loader(path):
+        calls.append(path)
+        return _load(path)
+
+    kb_id = uuid4()
+    TopicModelStore(str(tmp_path), loader=loader).save(kb_id, FakeModel("v1"), [], np.zeros((0, 2)))
+
+    # A fresh store (as in a new worker process) loads lazily, once
+    store = TopicModelStore(str(tmp_path), loader=loader)
+    store.load(kb_id)
+    store.load(kb_id)
+    assert len(calls) == 1
+
+
+def test_delete(tmp_path):
+    store = TopicModelStore(str(tmp_path), loader=_load)
+    kb_id = uuid4()
+    store.save(kb_id, FakeModel("v1"), ["a"], np.zeros((1, 2)))
+    store.delete(kb_id)
+    assert store.exists(kb_id) is False
+    assert store.load_reduced_embeddings(kb_id) == {}
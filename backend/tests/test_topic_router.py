@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import uuid4
+
+import pytest
+
+from app.services.search_cache import search_cache
+from app.services.topic_router import TopicRouter, TopicRouterCache, _RouterEntry
+
+
+def _router():
+    return TopicRouter([
+        _RouterEntry("kb_ml", [1.0, 0.0, 0.0], ["Neural nets", "Optimizers"], [[0.9, 0.1, 0.0], [0.7, 0.7, 0.0]]),
+        _RouterEntry("kb_cooking", [0.0, 1.0, 0.0], ["Baking"], [[0.0, 1.0, 0.0]]),
+        _RouterEntry("kb_travel", [0.0, 0.0, 1.0]),
+        _RouterEntry("kb_unclustered", None),
+    ])
+
+
+def test_route_picks_closest_collections_and_topics():
+    targets = _router().route([1.0, 0.05, 0.0], max_collections=1, max_topics=1, min_similarity=0.5)
+
+    assert [t.collection for t in targets] == ["kb_ml", "kb_unclustered"]
+    assert targets[0].topic_labels == ["Neural nets"]
+    # Nothing to score it on, so it is searched in full rather than dropped
+    assert targets[1].score is None and targets[1].topic_labels is None
+
+
+def test_route_without_matching_topics_searches_whole_collection():
+    targets = _router().route([0.0, 0.0, 1.0], max_collections=1, max_topics=2, min_similarity=0.5)
+
+    assert targets[0].collection == "kb_travel"
+    assert targets[0].topic_labels is None
+
+
+@pytest.mark.asyncio
+async def test_router_cache_rebuilds_on_generation_change():
+    kb = SimpleNamespace(id=uuid4(), name="ML", description="machine learning", milvus_collection="kb_rc")
+    embed = AsyncMock(return_value=[1.0, 0.0])
+    cache = TopicRouterCache()
+
+    with patch("app.services.topic_router.TopicRepository") as MockRepo:
+        MockRepo.return_value.find_centroids_for_knowledge_bases = AsyncMock(return_value=[])
+        first = await cache.get("u1", [kb], MagicMock(), embed)
+        assert await cache.get("u1", [kb], MagicMock(), embed) is first
+
+        search_cache.invalidate("kb_rc")
+        rebuilt = await cache.get("u1", [kb], MagicMock(), embed)
+
+    assert rebuilt is not first
+    # Description embeddings survive rebuilds
+    embed.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_router_cache_bounds_description_embeddings():
+    kbs = [
+        SimpleNamespace(id=uuid4(), name=f"KB{i}", description="docs", milvus_collection=f"kb_lru{i}")
+        for i in range(3)
+    ]
+    embed = AsyncMock(return_value=[1.0, 0.0])
+    cache = TopicRouterCache(max_descriptions=2)
+
+    for kb in kbs[:2]:
+        await cache._description_vector(kb, embed)
+    await cache._description_vector(kbs[0], embed)  # touch, so KB1 is the oldest
+    await cache._description_vector(kbs[2], embed)
+
+    assert list(cache._description_vectors) == ["KB0: docs", "KB2: docs"]
+    assert embed.await_count == 3
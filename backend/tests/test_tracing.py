@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.tracing import TraceExporter, span, start_trace, traced
+
+
+def test_span_outside_trace_is_noop():
+    with span("orphan", a=1) as s:
+        s.set(b=2)
+
+
+def test_spans_nest_and_record_attributes():
+    with start_trace("root") as trace:
+        with span("outer", kind="x") as outer:
+            with span("inner") as inner:
+                inner.set(prompt_tokens=10)
+            outer.set(done=True)
+
+    by_name = {s.name: s for s in trace.spans}
+    assert [s.name for s in trace.spans] == ["inner", "outer", "root"]
+    assert by_name["inner"].parent_id == by_name["outer"].span_id
+    assert by_name["outer"].parent_id == by_name["root"].span_id
+    assert by_name["root"].parent_id is None
+    assert by_name["outer"].attributes == {"kind": "x", "done": True}
+    assert all(s.trace_id == trace.trace_id for s in trace.spans)
+
+
+def test_span_records_error():
+    with pytest.raises(ValueError):
+        with start_trace("root") as trace:
+            with span("failing"):
+                raise ValueError("boom")
+
+    assert trace.spans[0].error == "ValueError: boom"
+
+
+@pytest.mark.asyncio
+async def test_spans_follow_tasks_and_traced_functions():
+    @traced("tool.work")
+    def work():
+        with span("db"):
+            pass
+
+    async def child():
+        with span("child"):
+            await asyncio.sleep(0)
+
+    with start_trace("root") as trace:
+        with span("parent") as parent:
+            await asyncio.gather(child(), child())
+            work()
+
+    by_name = {}
+    for s in trace.spans:
+        by_name.setdefault(s.name, []).append(s)
+    assert [s.parent_id for s in by_name["child"]] == [parent.span_id] * 2
+    assert by_name["tool.work"][0].parent_id == parent.span_id
+    assert by_name["db"][0].parent_id == by_name["tool.work"][0].span_id
+
+
+def test_summary_groups_by_name_since_index():
+    with start_trace("root") as trace:
+        with span("llm", prompt_tokens=5):
+            pass
+        mark = len(trace.spans)
+        with span("llm", prompt_tokens=7, completion_tokens=2):
+            pass
+        with span("llm", prompt_tokens=1):
+            pass
+        with span("exec"):
+            pass
+        summary = trace.summary(mark)
+
+    assert summary["llm"]["count"] == 2
+    assert summary["llm"]["prompt_tokens"] == 8
+    assert summary["llm"]["completion_tokens"] == 2
+    assert summary["exec"]["count"] == 1
+    assert "prompt_tokens" not in summary["exec"]
+
+
+def test_otlp_encoding():
+    with start_trace("root", model="m") as trace:
+        with span("child", hits=3, ratio=0.5, cached=False):
+            pass
+
+    otlp = trace.to_otlp()
+    spans = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    child = spans[0]
+    assert child["traceId"] == trace.trace_id
+    assert child["parentSpanId"] == spans[1]["spanId"]
+    assert {a["key"]: a["value"] for a in child["attributes"]} == {
+        "hits": {"intValue": "3"},
+        "ratio": {"doubleValue": 0.5},
+        "cached": {"boolValue": False},
+    }
+    assert int(child["endTimeUnixNano"]) >= int(child["startTimeUnixNano"])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fmt", ["json", "otlp"])
+async def test_exporter_appends_json_lines(tmp_path, fmt):
+    path = tmp_path / "traces.jsonl"
+    exporter = TraceExporter(path=str(path), format=fmt)
+    for _ in range(2):
+        with start_trace("root") as trace:
+            pass
+        await exporter.export(trace)
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 2
+    if fmt == "json":
+        assert lines[1]["trace_id"] == trace.trace_id
+        assert lines[1]["spans"][0]["name"] == "root"
+    else:
+        assert lines[1]["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["traceId"] == trace.trace_id
+
+
+@pytest.mark.asyncio
+async def test_exporter_failure_is_logged_not_raised(tmp_path):
+    exporter = TraceExporter(path=str(tmp_path / "missing" / "traces.jsonl"))
+    with start_trace("root") as trace:
+        pass
+    await exporter.export(trace)
@@ -2,7 +2,7 @@ import { useCallback, useEffect, useRef, useState } from "react";
 import ReactMarkdown from "react-markdown";
 import { api } from "../lib/api";
 import { useAppStore } from "../store/appStore";
-import type { ChatMessage, ChatSession, ReplStep } from "../types";
+import type { ChatMessage, ChatSession, ReplStep, TokenEvent } from "../types";
 import { useWebSocket } from "../hooks/useWebSocket";
 import { useSound } from "../audio/useSound";
 import { playIfUnmuted } from "../audio/useSound";
@@ -25,9 +25,22 @@ export function ChatPanel() {
 
   const { play } = useSound();
   const [input, setInput] = useState("");
+  const [liveText, setLiveText] = useState("");
+  const liveIteration = useRef(0);
   const messagesEndRef = useRef<HTMLDivElement>(null);
-  const { connected, sendQuery, onReplStep, onAnswer, onError, flush, clearQueue } =
-    useWebSocket(currentSession?.id ?? null);
+  const {
+    connected,
+    sendQuery,
+    cancelQuery,
+    onReplStep,
+    onAnswer,
+    onError,
+    onToken,
+    onCancelled,
+    onResumeGap,
+    flush,
+    clearQueue,
+  } = useWebSocket(currentSession?.id ?? null);
 
   useEffect(() => {
     if (!currentUser) return;
@@ -60,11 +73,21 @@ export function ChatPanel() {
   }, [currentSession]);
 
   useEffect(() => {
+    onToken.current = (token: TokenEvent) => {
+      const fresh = token.iteration !== liveIteration.current;
+      liveIteration.current = token.iteration;
+      const piece =
+        token.kind === "code_start" ? "\n```" + token.content + "\n" :
+        token.kind === "code_end" ? "```\n" :
+        token.content;
+      setLiveText((prev) => (fresh ? piece : prev + piece));
+    };
     onReplStep.current = (step: ReplStep) => {
       addReplStep(step);
       playIfUnmuted("replStep");
     };
     onAnswer.current = (answer: string) => {
+      setLiveText("");
       addMessage({
         id: crypto.randomUUID(),
         session_id: currentSession?.id ?? "",
@@ -78,6 +101,7 @@ export function ChatPanel() {
       refetchMessages();
     };
     onError.current = (error: string) => {
+      setLiveText("");
       setIsLoading(false);
       playIfUnmuted("error");
       // Refetch first so setMessages has canonical data, then append the
@@ -93,6 +117,15 @@ export function ChatPanel() {
         });
       });
     };
+    onCancelled.current = () => {
+      setLiveText("");
+      setIsLoading(false);
+      refetchMessages();
+    };
+    // Some events were lost while disconnected; persisted messages are the source of truth
+    onResumeGap.current = () => {
+      refetchMessages();
+    };
     flush();
   }, [currentSession, refetchMessages, flush]);
 
@@ -129,6 +162,8 @@ export function ChatPanel() {
     const query = input.trim();
     setInput("");
     clearReplSteps();
+    setLiveText("");
+    liveIteration.current = 0;
     setIsLoading(true);
     play("messageSend");
 
@@ -238,6 +273,9 @@ export function ChatPanel() {
             &gt; PROCESSING QUERY...
           </div>
         )}
+        {isLoading && liveText && (
+          <pre className="text-sm font-mono text-terminal-amber-dim whitespace-pre-wrap">{liveText}</pre>
+        )}
         <div ref={messagesEndRef} />
       </div>
 
@@ -259,6 +297,14 @@ export function ChatPanel() {
         >
           [Send]
         </button>
+        {isLoading && connected && (
+          <button
+            className="text-sm px-3 py-1 t-border text-terminal-amber hover:bg-terminal-amber-faint font-mono uppercase"
+            onClick={cancelQuery}
+          >
+            [Abort]
+          </button>
+        )}
       </div>
     </div>
   );
@@ -1,7 +1,7 @@
 import { useEffect, useState } from "react";
 import { api } from "../lib/api";
 import { useAppStore } from "../store/appStore";
-import type { FileRecord, KnowledgeBase, Topic } from "../types";
+import type { ClusteringJob, FileRecord, KnowledgeBase, Topic } from "../types";
 import { useSound } from "../audio/useSound";
 
 export function KBSidebar() {
@@ -81,9 +81,21 @@ export function KBSidebar() {
     setClustering(true);
     play("messageSend");
     const res = await api.clusterKB(selectedKB.id);
-    if (res.success && res.data) {
-      setTopics(res.data as Topic[]);
-      play("confirm");
+    let job = res.success ? (res.data as ClusteringJob) : null;
+    // Clustering runs as a background job; poll until it finishes
+    while (job && (job.status === "pending" || job.status === "running")) {
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      const status = await api.getClusterJob(selectedKB.id, job.id);
+      job = status.success ? (status.data as ClusteringJob) : null;
+    }
+    if (job?.status === "completed") {
+      const topicsRes = await api.listTopics(selectedKB.id);
+      if (topicsRes.success && topicsRes.data) {
+        setTopics(topicsRes.data as Topic[]);
+        play("confirm");
+      }
+    } else {
+      play("error");
     }
     setClustering(false);
   };
@@ -185,10 +197,12 @@ export function KBSidebar() {
 
                   {topics.length > 0 && (
                     <div className="flex flex-wrap gap-1">
-                      {topics.map((t) => (
+                      {[...topics].sort((a, b) => b.topic_level - a.topic_level).map((t) => (
                         <span
                           key={t.id}
-                          className="text-sm font-mono bg-terminal-dark text-terminal-amber-bright px-1.5 py-0.5 t-border"
+                          className={`text-sm font-mono bg-terminal-dark px-1.5 py-0.5 t-border ${
+                            t.topic_level === 2 ? "text-terminal-amber uppercase" : "text-terminal-amber-bright"
+                          }`}
                         >
                           {t.topic_label} ({t.doc_count})
                         </span>
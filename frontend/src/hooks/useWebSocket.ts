@@ -1,9 +1,22 @@
 import { useCallback, useEffect, useRef, useState } from "react";
-import type { ReplStep } from "../types";
+import type { ReplStep, TokenEvent } from "../types";
 
 interface WSMessage {
-  type: "repl_step" | "answer" | "error";
+  type:
+    | "repl_step"
+    | "answer"
+    | "error"
+    | "token"
+    | "cancelled"
+    | "run_started"
+    | "run_active"
+    | "resume_gap";
   content?: string;
+  reason?: string;
+  // Durable events of a run are numbered so a reconnect can resume after the last one seen
+  run_id?: string;
+  seq?: number;
+  kind?: TokenEvent["kind"];
   iteration?: number;
   code?: string;
   output?: string;
@@ -11,6 +24,8 @@ interface WSMessage {
 }
 
 const MAX_QUEUE_SIZE = 50;
+const MAX_RECONNECT_DELAY_MS = 10_000;
+const TERMINAL_TYPES = new Set(["answer", "error", "cancelled"]);
 
 export function useWebSocket(sessionId: string | null) {
   const wsRef = useRef<WebSocket | null>(null);
@@ -19,11 +34,52 @@ export function useWebSocket(sessionId: string | null) {
   const onReplStep = useRef<((step: ReplStep) => void) | null>(null);
   const onAnswer = useRef<((answer: string) => void) | null>(null);
   const onError = useRef<((error: string) => void) | null>(null);
+  const onToken = useRef<((token: TokenEvent) => void) | null>(null);
+  const onCancelled = useRef<((reason: string) => void) | null>(null);
+  const onResumeGap = useRef<(() => void) | null>(null);
+
+  // The run this client follows and the last event it has seen from it
+  const runId = useRef<string | null>(null);
+  const lastSeq = useRef(0);
 
   const pendingQueue = useRef<WSMessage[]>([]);
 
+  const resume = useCallback((ws: WebSocket, id: string, after: number) => {
+    ws.send(JSON.stringify({ type: "resume", run_id: id, last_seq: after }));
+  }, []);
+
   const dispatch = useCallback((msg: WSMessage) => {
-    if (msg.type === "repl_step") {
+    if (msg.seq !== undefined && msg.run_id !== undefined) {
+      if (msg.type === "run_started") {
+        runId.current = msg.run_id;
+        lastSeq.current = 0;
+      }
+      if (msg.run_id !== runId.current) return;
+      // A resume may replay events that already arrived
+      if (msg.seq <= lastSeq.current) return;
+      lastSeq.current = msg.seq;
+      if (TERMINAL_TYPES.has(msg.type)) runId.current = null;
+    }
+
+    if (msg.type === "run_started") {
+      return;
+    } else if (msg.type === "run_active") {
+      // Connected while a run of this session is in progress (e.g. after a page reload)
+      if (msg.run_id && msg.run_id !== runId.current && wsRef.current) {
+        runId.current = msg.run_id;
+        lastSeq.current = 0;
+        resume(wsRef.current, msg.run_id, 0);
+      }
+    } else if (msg.type === "resume_gap") {
+      onResumeGap.current?.();
+    } else if (msg.type === "token") {
+      // Tokens are only useful live; the repl_step/answer that follows carries the full text
+      onToken.current?.({
+        iteration: msg.iteration ?? 0,
+        kind: msg.kind ?? "text",
+        content: msg.content ?? "",
+      });
+    } else if (msg.type === "repl_step") {
       if (onReplStep.current) {
         onReplStep.current({
           iteration: msg.iteration ?? 0,
@@ -46,10 +102,12 @@ export function useWebSocket(sessionId: string | null) {
       } else if (pendingQueue.current.length < MAX_QUEUE_SIZE) {
         pendingQueue.current.push(msg);
       }
+    } else if (msg.type === "cancelled") {
+      onCancelled.current?.(msg.reason ?? "cancelled");
     } else {
       console.warn("[useWebSocket] unhandled message type", msg);
     }
-  }, []);
+  }, [resume]);
 
   const flush = useCallback(() => {
     const queued = pendingQueue.current.splice(0);
@@ -68,33 +126,57 @@ export function useWebSocket(sessionId: string | null) {
   useEffect(() => {
     if (!sessionId) return;
 
-    const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
-    const ws = new WebSocket(
-      `${protocol}//${window.location.host}/api/chat/sessions/${sessionId}/ws`
-    );
-
-    ws.onopen = () => setConnected(true);
-    ws.onclose = () => setConnected(false);
-
-    ws.onmessage = (event) => {
-      const msg: WSMessage = JSON.parse(event.data);
-      dispatch(msg);
+    let closed = false;
+    let retryDelay = 1000;
+    let retryTimer: ReturnType<typeof setTimeout> | undefined;
+    runId.current = null;
+    lastSeq.current = 0;
+
+    const connect = () => {
+      const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
+      const ws = new WebSocket(
+        `${protocol}//${window.location.host}/api/chat/sessions/${sessionId}/ws`
+      );
+
+      ws.onopen = () => {
+        setConnected(true);
+        retryDelay = 1000;
+        // Pick up where we left off; the server replays what we missed
+        if (runId.current) resume(ws, runId.current, lastSeq.current);
+      };
+      ws.onclose = () => {
+        setConnected(false);
+        if (closed) return;
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, MAX_RECONNECT_DELAY_MS);
+      };
+
+      ws.onmessage = (event) => {
+        const msg: WSMessage = JSON.parse(event.data);
+        dispatch(msg);
+      };
+
+      wsRef.current = ws;
     };
 
+    connect();
+
     // Keepalive ping every 30s to prevent proxy/network timeout
     const pingInterval = setInterval(() => {
-      if (ws.readyState === WebSocket.OPEN) {
-        ws.send(JSON.stringify({ type: "ping" }));
+      if (wsRef.current?.readyState === WebSocket.OPEN) {
+        wsRef.current.send(JSON.stringify({ type: "ping" }));
       }
     }, 30000);
 
-    wsRef.current = ws;
     return () => {
+      closed = true;
       clearInterval(pingInterval);
-      ws.close();
+      clearTimeout(retryTimer);
+      wsRef.current?.close();
+      wsRef.current = null;
       pendingQueue.current = [];
     };
-  }, [sessionId, dispatch]);
+  }, [sessionId, dispatch, resume]);
 
   const sendQuery = useCallback(
     (query: string, userId: string) => {
@@ -105,12 +187,23 @@ export function useWebSocket(sessionId: string | null) {
     []
   );
 
+  // Stops the running query; the server answers with a "cancelled" message
+  const cancelQuery = useCallback(() => {
+    if (wsRef.current?.readyState === WebSocket.OPEN) {
+      wsRef.current.send(JSON.stringify({ type: "cancel" }));
+    }
+  }, []);
+
   return {
     connected,
     sendQuery,
+    cancelQuery,
     onReplStep,
     onAnswer,
     onError,
+    onToken,
+    onCancelled,
+    onResumeGap,
     flush,
     clearQueue,
   };
@@ -59,6 +59,9 @@ export const api = {
   clusterKB: (kb_id: string) =>
     request(`/knowledge-bases/${kb_id}/cluster`, { method: "POST" }),
 
+  getClusterJob: (kb_id: string, job_id: string) =>
+    request(`/knowledge-bases/${kb_id}/cluster/jobs/${job_id}`),
+
   listTopics: (kb_id: string) =>
     request(`/knowledge-bases/${kb_id}/topics`),
 
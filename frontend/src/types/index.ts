@@ -37,6 +37,19 @@ export interface Topic {
   updated_at: string;
 }
 
+export interface ClusteringJob {
+  id: string;
+  knowledge_base_id: string;
+  status: "pending" | "running" | "completed" | "failed";
+  progress: number;
+  message: string | null;
+  error: string | null;
+  topic_count: number | null;
+  created_at: string;
+  updated_at: string;
+  finished_at: string | null;
+}
+
 export interface ChatSession {
   id: string;
   user_id: string;
@@ -70,3 +83,9 @@ export interface ApiResponse<T> {
     limit: number;
   } | null;
 }
+
+export interface TokenEvent {
+  iteration: number;
+  kind: "text" | "code" | "code_start" | "code_end";
+  content: string;
+}